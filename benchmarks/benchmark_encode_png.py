@@ -0,0 +1,76 @@
+"""
+Benchmark of the PNG transparency conversion used by encode_png.
+
+Compares the former pixel-by-pixel loop with the band operations of
+make_transparent on the maps downloaded to <KEGG_MAP_WIZARD_DATA>/maps_png
+and checks that both produce byte-identical PNGs.
+
+Usage:
+    python benchmarks/benchmark_encode_png.py [max_number_of_maps]
+"""
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+from PIL import Image
+from keggmapwizard.config import config
+from keggmapwizard.download_data import make_transparent
+
+
+def make_transparent_pixel_loop(img: Image.Image) -> Image.Image:
+    """The former implementation of encode_png, iterating over every pixel."""
+    pixdata = img.load()
+    width, height = img.size
+    for y_coord in range(height):
+        for x_coord in range(width):
+            r, b, g, a = pixdata[x_coord, y_coord]
+            if r == 255 and b == 255 and g == 255 and a == 255:
+                pixdata[x_coord, y_coord] = (255, 255, 255, 0)
+            elif r == b == g and r != 0:
+                assert a == 255, f'{(r,g,b,a)=}'
+                pixdata[x_coord, y_coord] = (0, 0, 0, 255 - r)
+    return img
+
+
+def png_bytes(img: Image.Image) -> bytes:
+    buffer = BytesIO()
+    img.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def benchmark(png_paths: list) -> None:
+    total_loop = 0.0
+    total_bands = 0.0
+    for png_path in png_paths:
+        with Image.open(png_path) as img:
+            rgba = img.convert('RGBA')
+
+        start = time.perf_counter()
+        loop_result = make_transparent_pixel_loop(rgba.copy())
+        loop_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        band_result = make_transparent(rgba.copy())
+        band_time = time.perf_counter() - start
+
+        identical = png_bytes(loop_result) == png_bytes(band_result)
+        total_loop += loop_time
+        total_bands += band_time
+        print(f'{png_path.name}: {rgba.size[0]}x{rgba.size[1]} '
+              f'pixel loop {loop_time:.3f} s, band operations {band_time:.3f} s, '
+              f'speed-up {loop_time / band_time:.1f}x, identical: {identical}')
+        assert identical, f'{png_path.name}: outputs differ'
+
+    if png_paths:
+        print(f'Total for {len(png_paths)} maps: pixel loop {total_loop:.2f} s, '
+              f'band operations {total_bands:.2f} s, speed-up {total_loop / total_bands:.1f}x')
+
+
+if __name__ == '__main__':
+    maps_png = Path(config.working_dir) / 'maps_png'
+    paths = sorted(maps_png.glob('map*.png'))
+    if len(sys.argv) > 1:
+        paths = paths[:int(sys.argv[1])]
+    if not paths:
+        print(f'No PNG maps found in {maps_png}. Download some with download_kegg_resources first.')
+    benchmark(paths)
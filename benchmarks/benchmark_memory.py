@@ -0,0 +1,115 @@
+"""
+Benchmark of the memory held by the pathway components of all maps.
+
+Compares the former dict-backed PathwayComponent and Geometry objects with
+the __slots__ classes and GeometryColumns on the KGML files downloaded to
+<KEGG_MAP_WIZARD_DATA>/kgml_data and checks that both produce the same
+geometries.
+
+Usage:
+    python benchmarks/benchmark_memory.py [max_number_of_files]
+"""
+import sys
+import tracemalloc
+from pathlib import Path
+from xml.etree import ElementTree as ET
+from keggmapwizard.config import config
+from keggmapwizard.geometry import GeometryColumns, geometry_factory
+from keggmapwizard.pathway_component import PathwayComponent
+
+
+class LegacyGeometry:
+    """The former Geometry, with a __dict__."""
+
+    def __init__(self, geometry_coords: dict, geometry_shape: str):
+        self.geometry_coords = geometry_coords
+        self.geometry_shape = geometry_shape
+
+
+class LegacyPathwayComponent:
+    """The former PathwayComponent, keeping the entry and copies of its geometry."""
+
+    def __init__(self, entry: dict):
+        self.entry = entry
+        self.pathway_component_id = entry['id']
+        geometry = geometry_factory(entry)
+        self.shape_object = LegacyGeometry(geometry.geometry_coords, geometry.geometry_shape)
+        self.pathway_component_geometry = self.shape_object.geometry_coords
+        self.pathway_component_geometry_shape = self.shape_object.geometry_shape
+
+
+def legacy_components(entries: list) -> list:
+    # The former construction in Pathway.__create_pathway_components
+    components = []
+    for entry in entries:
+        graphics = entry.find('graphics')
+        entry_data = {
+            "id": entry.get('id'),
+            "name": [entry.get('name')],
+            "type": [entry.get('type')],
+            "graphics": {
+                "type": graphics.get('type'),
+                "x": graphics.get('x'),
+                "y": graphics.get('y'),
+                "height": graphics.get('height'),
+                "width": graphics.get('width'),
+                "coords": graphics.get('coords')
+            }
+        }
+        components.append(LegacyPathwayComponent(entry_data))
+    return components
+
+
+def compact_components(entries: list) -> list:
+    # The construction in Pathway.__create_pathway_components
+    geometries = GeometryColumns.from_entries(entries)
+    return [PathwayComponent({"id": entry.get('id'), "name": [entry.get('name')], "type": [entry.get('type')]},
+                             geometries.geometry(row))
+            for row, entry in enumerate(entries)]
+
+
+def retained_memory(kgml_paths: list, build) -> tuple:
+    # Returns the components built from all files and the memory they hold,
+    # excluding the parsed XML trees, which are released after each file
+    components = []
+    retained = 0
+    tracemalloc.start()
+    for kgml_path in kgml_paths:
+        entries = ET.parse(kgml_path).getroot().findall('entry')
+        before = tracemalloc.get_traced_memory()[0]
+        components.append(build(entries))
+        retained += tracemalloc.get_traced_memory()[0] - before
+        del entries
+    tracemalloc.stop()
+    return components, retained
+
+
+def benchmark(kgml_paths: list) -> None:
+    legacy, legacy_memory = retained_memory(kgml_paths, legacy_components)
+    compact, compact_memory = retained_memory(kgml_paths, compact_components)
+
+    n_components = 0
+    for legacy_file, compact_file in zip(legacy, compact):
+        for old, new in zip(legacy_file, compact_file):
+            assert old.pathway_component_geometry == new.pathway_component_geometry, \
+                f'{old.pathway_component_id}: geometries differ'
+            assert old.pathway_component_geometry_shape == new.pathway_component_geometry_shape
+        n_components += len(compact_file)
+
+    print(f'{len(kgml_paths)} KGML files, {n_components} pathway components')
+    print(f'dict-backed objects: {legacy_memory / 2 ** 20:.1f} MiB '
+          f'({legacy_memory / max(n_components, 1):.0f} bytes per component)')
+    print(f'__slots__ objects and geometry columns: {compact_memory / 2 ** 20:.1f} MiB '
+          f'({compact_memory / max(n_components, 1):.0f} bytes per component)')
+    if compact_memory:
+        print(f'saving: {1 - compact_memory / legacy_memory:.0%}')
+
+
+if __name__ == '__main__':
+    kgml_data = Path(config.working_dir) / 'kgml_data'
+    paths = sorted(kgml_data.glob('*/*.xml'))
+    if len(sys.argv) > 1:
+        paths = paths[:int(sys.argv[1])]
+    if not paths:
+        print(f'No KGML files found in {kgml_data}. Download some with download_kegg_resources first.')
+    benchmark(paths)
@@ -0,0 +1,373 @@
+"""
+This module provides an indexed store of the annotations in the KEGG REST list
+files (ko.txt, compound.txt, <org>.txt, ...).
+
+The REST files are parsed once into an SQLite database next to them in the
+rest_data directory. Annotations are then looked up key by key, so rendering a
+map only loads the annotations of the entries it actually contains instead of
+re-reading tens of MB of text. A REST file is re-indexed automatically when
+its modification time or size changes.
+
+The module-level annotation_cache shares the indexes and the annotations looked
+up so far between all pathways of a process.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from keggmapwizard.annotation_settings import ANNOTATION_SETTINGS
+
+INDEX_FILE_NAME = 'annotation_index.sqlite'
+
+# REST files holding reference annotations. Their descriptions are in the second
+# column; all other REST files are organism gene lists with the description in
+# the fourth column.
+REFERENCE_REST_FILES = {settings['rest_file'] for settings in ANNOTATION_SETTINGS.values()} - {'org', ''}
+
+# Files in the rest_data directory that are not REST list files
+_IGNORED_FILES = {'bad_requests.txt'}
+
+# Maximum number of organism gene lists kept in the process-wide annotation cache
+MAX_CACHED_ORGANISMS = 32
+
+
+def parse_rest_line(line: str, description_column: int) -> tuple:
+    """
+    Splits a line of a REST list file into its key and description.
+
+    Args:
+        line (str): A tab separated line of a REST list file.
+        description_column (int): The column holding the description.
+
+    Returns:
+        tuple: The key and the description. The description is an empty string
+        if the line has less than two fields.
+    """
+    data = line.strip().split('\t')
+    if len(data) < 2:
+        return data[0], ""
+    if description_column < len(data):
+        return data[0], data[description_column]
+    return data[0], ""
+
+
+class AnnotationIndex:
+    """
+    An SQLite index of the REST list files of a rest_data directory.
+
+    Methods:
+        update(sources=None): Indexes the given REST files, or all REST files of
+                              the directory, whose contents changed.
+        get(sources, key): Returns the description of key from the given REST files.
+        lookup(sources): Returns a read-only mapping of the given REST files.
+        close(): Closes the database connection.
+    """
+
+    def __init__(self, rest_data_dir):
+        self.directory = Path(rest_data_dir)
+        self.index_path = self.directory / INDEX_FILE_NAME
+        self._connection = None
+        self._lock = threading.RLock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.index_path, timeout=60, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS sources '
+                               '(source TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER)')
+            connection.execute('CREATE TABLE IF NOT EXISTS annotations '
+                               '(source TEXT, key TEXT, value TEXT, PRIMARY KEY (source, key)) WITHOUT ROWID')
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def _rest_file(self, source: str) -> Path:
+        return self.directory / f'{source}.txt'
+
+    def is_current(self, source: str) -> bool:
+        """
+        Checks whether the index holds the current contents of a REST file.
+
+        Args:
+            source (str): The name of the REST file without extension, e.g. 'ko'.
+
+        Returns:
+            bool: True if the REST file is indexed and has not changed since.
+        """
+        try:
+            stat = self._rest_file(source).stat()
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            row = self._connect().execute('SELECT mtime_ns, size FROM sources WHERE source = ?',
+                                          (source,)).fetchone()
+        return row is not None and row[0] == stat.st_mtime_ns and row[1] == stat.st_size
+
+    def update(self, sources: list = None) -> list:
+        """
+        Indexes REST files that are not indexed yet or changed since indexing.
+
+        Args:
+            sources (list, optional): Names of the REST files without extension.
+                                      Defaults to all REST files of the directory.
+
+        Returns:
+            list: The names of the REST files that were (re-)indexed.
+        """
+        if not self.directory.is_dir():
+            return []
+        if sources is None:
+            sources = [path.stem for path in sorted(self.directory.glob('*.txt'))
+                       if path.name not in _IGNORED_FILES]
+
+        updated = []
+        for source in sources:
+            if not self._rest_file(source).is_file() or self.is_current(source):
+                continue
+            self._index_file(source)
+            updated.append(source)
+        return updated
+
+    def _index_file(self, source: str) -> None:
+        rest_file = self._rest_file(source)
+        description_column = 1 if source in REFERENCE_REST_FILES else 3
+        stat = rest_file.stat()
+        with open(rest_file, 'r') as file:
+            rows = [(source, *parse_rest_line(line, description_column)) for line in file]
+
+        with self._lock:
+            connection = self._connect()
+            # Replace all annotations of the file in one transaction
+            with connection:
+                connection.execute('DELETE FROM annotations WHERE source = ?', (source,))
+                connection.executemany('INSERT OR REPLACE INTO annotations (source, key, value) '
+                                       'VALUES (?, ?, ?)', rows)
+                connection.execute('INSERT OR REPLACE INTO sources (source, mtime_ns, size) '
+                                   'VALUES (?, ?, ?)', (source, stat.st_mtime_ns, stat.st_size))
+
+    def get(self, sources: list, key: str):
+        """
+        Returns the description of a key.
+
+        Args:
+            sources (list): Names of the REST files to search. If the key occurs
+                            in several of them, the last file wins.
+            key (str): The key to look up, e.g. 'K00844'.
+
+        Returns:
+            str or None: The description, or None if the key is not found.
+        """
+        with self._lock:
+            connection = self._connect()
+            for source in reversed(sources):
+                row = connection.execute('SELECT value FROM annotations WHERE source = ? AND key = ?',
+                                         (source, key)).fetchone()
+                if row is not None:
+                    return row[0]
+        return None
+
+    def lookup(self, sources: list, verbose: bool = True):
+        """
+        Returns a read-only mapping of the annotations of the given REST files.
+
+        REST files that are not indexed yet or have changed are indexed first.
+
+        Args:
+            sources (list): Names of the REST files without extension.
+            verbose (bool): If True, report REST files that do not exist.
+
+        Returns:
+            AnnotationLookup: The mapping from keys to descriptions.
+        """
+        available = []
+        for source in sources:
+            if self._rest_file(source).is_file():
+                available.append(source)
+            elif verbose:
+                print(f"File not found: {self._rest_file(source)}")
+        self.update(available)
+        return AnnotationLookup(self, available)
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class AnnotationLookup:
+    """
+    A read-only mapping from annotation keys to descriptions, backed by an
+    AnnotationIndex. Keys are queried on first access and remembered.
+    """
+
+    def __init__(self, index: AnnotationIndex, sources: list):
+        self._index = index
+        self.sources = list(sources)
+        self._cache = {}
+
+    def get(self, key, default=None):
+        if key not in self._cache:
+            self._cache[key] = self._index.get(self.sources, key) if self.sources else None
+        value = self._cache[key]
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+
+class ChainedAnnotationLookup:
+    """
+    A read-only mapping combining the lookups of several REST files. If a key
+    occurs in several of them, the last lookup wins.
+    """
+
+    def __init__(self, lookups: list):
+        self.lookups = list(lookups)
+        self.sources = [source for lookup in self.lookups for source in lookup.sources]
+
+    def get(self, key, default=None):
+        for lookup in reversed(self.lookups):
+            value = lookup.get(key)
+            if value is not None:
+                return value
+        return default
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+
+class AnnotationCache:
+    """
+    A process-wide cache of the annotations of the REST files.
+
+    The cache keeps one AnnotationIndex per rest_data directory and one
+    AnnotationLookup per REST file, keyed by the path and modification time of
+    the file, so annotations looked up for one pathway are reused by all later
+    pathways. Reference files (ko, compound, ...) stay cached; organism gene
+    lists are evicted least recently used first when more than max_organisms
+    of them are cached.
+
+    Methods:
+        lookup(directory, sources, verbose=True): Returns a mapping of the
+            annotations of the given REST files.
+        index(directory): Returns the shared AnnotationIndex of a directory.
+        invalidate(rest_file): Drops a REST file from the cache.
+        clear(): Drops all cached annotations and closes the indexes.
+    """
+
+    def __init__(self, max_organisms: int = MAX_CACHED_ORGANISMS):
+        self.max_organisms = max_organisms
+        self._indexes = {}
+        self._reference_files = {}
+        self._organism_files = OrderedDict()
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+
+    def _check_process(self):
+        # Database connections must not be shared with forked processes
+        if self._pid != os.getpid():
+            self._indexes = {}
+            self._reference_files = {}
+            self._organism_files = OrderedDict()
+            self._lock = threading.RLock()
+            self._pid = os.getpid()
+
+    def index(self, directory) -> AnnotationIndex:
+        """Returns the shared AnnotationIndex of a rest_data directory."""
+        self._check_process()
+        directory = Path(directory)
+        with self._lock:
+            if directory not in self._indexes:
+                self._indexes[directory] = AnnotationIndex(directory)
+            return self._indexes[directory]
+
+    def _file_lookup(self, directory: Path, source: str, verbose: bool):
+        rest_file = directory / f'{source}.txt'
+        try:
+            stat = rest_file.stat()
+        except FileNotFoundError:
+            if verbose:
+                print(f"File not found: {rest_file}")
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        files = self._reference_files if source in REFERENCE_REST_FILES else self._organism_files
+
+        with self._lock:
+            cached = files.get(rest_file)
+            if cached is not None and cached[0] == version:
+                if files is self._organism_files:
+                    files.move_to_end(rest_file)
+                return cached[1]
+
+            index = self.index(directory)
+            index.update([source])
+            lookup = AnnotationLookup(index, [source])
+            files[rest_file] = (version, lookup)
+            if files is self._organism_files:
+                files.move_to_end(rest_file)
+                while len(files) > self.max_organisms:
+                    files.popitem(last=False)
+            return lookup
+
+    def lookup(self, directory, sources: list, verbose: bool = True):
+        """
+        Returns a read-only mapping of the annotations of the given REST files.
+
+        Args:
+            directory: The rest_data directory.
+            sources (list): Names of the REST files without extension.
+            verbose (bool): If True, report REST files that do not exist.
+
+        Returns:
+            AnnotationLookup or ChainedAnnotationLookup: The mapping from keys
+            to descriptions.
+        """
+        self._check_process()
+        directory = Path(directory)
+        lookups = [self._file_lookup(directory, source, verbose) for source in sources]
+        lookups = [lookup for lookup in lookups if lookup is not None]
+        if len(lookups) == 1:
+            return lookups[0]
+        return ChainedAnnotationLookup(lookups)
+
+    def invalidate(self, rest_file) -> None:
+        """
+        Drops the cached annotations of a REST file, e.g. after it was downloaded again.
+
+        Args:
+            rest_file: The path of the REST file.
+        """
+        self._check_process()
+        rest_file = Path(rest_file)
+        with self._lock:
+            self._reference_files.pop(rest_file, None)
+            self._organism_files.pop(rest_file, None)
+
+    def clear(self) -> None:
+        """Drops all cached annotations and closes the database connections."""
+        self._check_process()
+        with self._lock:
+            for index in self._indexes.values():
+                index.close()
+            self._indexes = {}
+            self._reference_files = {}
+            self._organism_files = OrderedDict()
+
+
+# Create a process-wide cache instance, shared by all pathways of the process.
+annotation_cache = AnnotationCache()
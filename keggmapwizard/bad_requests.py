@@ -0,0 +1,236 @@
+"""
+This module provides the negative cache of KEGG resources that could not be
+downloaded, e.g. the KGML files of maps that do not exist for an organism.
+
+Every resource directory (rest_data, maps_png, kgml_data/ko, ...) has its own
+store, an SQLite database bad_requests.sqlite indexed by the request argument.
+For every bad request the status code, the time of the last failure and the
+number of failures are recorded. Entries expire after a time to live that
+depends on the status code: resources that do not exist (400, 404) are tried
+again after NOT_FOUND_TTL, transient failures (429, 5xx) after TRANSIENT_TTL.
+
+The database is opened in WAL mode and every operation uses its own connection,
+so worker threads and processes can record bad requests at the same time.
+
+The bad_requests.txt files written by earlier versions are imported into the
+store of their directory when it is first opened, and renamed to
+bad_requests.txt.migrated.
+"""
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+BAD_REQUESTS_DB = 'bad_requests.sqlite'
+# The text file of bad requests written by earlier versions
+LEGACY_BAD_REQUESTS_FILE = 'bad_requests.txt'
+# Seconds after which a resource that did not exist is requested again
+NOT_FOUND_TTL = 30 * 24 * 60 * 60
+# Seconds after which a request that failed temporarily is sent again
+TRANSIENT_TTL = 60 * 60
+# Status codes of resources that do not exist, and of temporary failures
+NOT_FOUND_STATUS = (400, 404)
+TRANSIENT_STATUS = (429, 500, 502, 503, 504)
+# Seconds a connection waits for the lock of another writer
+_BUSY_TIMEOUT = 30
+# Maximum number of arguments looked up by a single query
+_LOOKUP_CHUNK_SIZE = 500
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS bad_requests (
+    arg TEXT PRIMARY KEY,
+    status INTEGER NOT NULL,
+    failed_at REAL NOT NULL,
+    expires_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 1
+)
+'''
+
+
+def is_bad_request(status: int) -> bool:
+    """Checks whether a failed request with this status code is recorded."""
+    return status in NOT_FOUND_STATUS or status in TRANSIENT_STATUS
+
+
+def time_to_live(status: int):
+    """
+    Returns the seconds after which a bad request with this status code
+    expires, or None if it never expires, i.e. if the time to live of its
+    kind of status codes is set to None.
+    """
+    return NOT_FOUND_TTL if status in NOT_FOUND_STATUS else TRANSIENT_TTL
+
+
+class BadRequest:
+    """
+    A recorded bad request.
+
+    Attributes:
+        arg (str): The request argument, e.g. 'hsa00010'.
+        status (int): The status code of the last failure.
+        failed_at (float): The time of the last failure (seconds since the epoch).
+        expires_at (float): The time the request is sent again, or None.
+        attempts (int): The number of failures.
+    """
+    __slots__ = ('arg', 'status', 'failed_at', 'expires_at', 'attempts')
+
+    def __init__(self, arg: str, status: int, failed_at: float, expires_at, attempts: int):
+        self.arg = arg
+        self.status = status
+        self.failed_at = failed_at
+        self.expires_at = expires_at
+        self.attempts = attempts
+
+    def __repr__(self):
+        return f'<BadRequest: {self.arg} - status {self.status}, {self.attempts} attempt(s)>'
+
+
+class BadRequestStore:
+    """
+    The negative cache of the bad requests of one resource directory.
+
+    Methods:
+        lookup(args, now=None): Returns the unexpired bad requests of arguments.
+        record(arg, status, now=None): Records a failed request.
+        migrate(legacy_file): Imports a bad_requests.txt file.
+    """
+
+    def __init__(self, directory, legacy_file: str = LEGACY_BAD_REQUESTS_FILE):
+        self.directory = Path(directory)
+        self.path = self.directory / BAD_REQUESTS_DB
+        os.makedirs(self.directory, exist_ok=True)
+        with self._connect() as connection:
+            # WAL lets readers proceed while another process writes
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(_SCHEMA)
+        connection.close()
+        if legacy_file:
+            self.migrate(legacy_file)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=_BUSY_TIMEOUT)
+
+    def __len__(self):
+        connection = self._connect()
+        try:
+            return connection.execute('SELECT COUNT(*) FROM bad_requests').fetchone()[0]
+        finally:
+            connection.close()
+
+    def lookup(self, args: list, now: float = None) -> dict:
+        """
+        Returns the bad requests of arguments that have not expired.
+
+        Args:
+            args (list): The request arguments.
+            now (float, optional): The current time. Defaults to time.time().
+
+        Returns:
+            dict: The BadRequest of every argument with an unexpired bad request.
+        """
+        now = time.time() if now is None else now
+        args = list(dict.fromkeys(args))
+        bad_requests = {}
+        connection = self._connect()
+        try:
+            for start in range(0, len(args), _LOOKUP_CHUNK_SIZE):
+                chunk = args[start:start + _LOOKUP_CHUNK_SIZE]
+                rows = connection.execute(
+                    f'SELECT arg, status, failed_at, expires_at, attempts FROM bad_requests '
+                    f'WHERE arg IN ({",".join("?" * len(chunk))}) AND (expires_at IS NULL OR expires_at > ?)',
+                    chunk + [now])
+                for row in rows:
+                    bad_requests[row[0]] = BadRequest(*row)
+        finally:
+            connection.close()
+        return bad_requests
+
+    def record(self, arg: str, status: int, now: float = None) -> None:
+        """
+        Records a failed request. A request that failed before is updated and
+        its number of attempts increased.
+
+        Args:
+            arg (str): The request argument.
+            status (int): The status code of the response.
+            now (float, optional): The time of the failure. Defaults to time.time().
+        """
+        now = time.time() if now is None else now
+        ttl = time_to_live(status)
+        expires_at = None if ttl is None else now + ttl
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    'INSERT INTO bad_requests (arg, status, failed_at, expires_at) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT(arg) DO UPDATE SET status = excluded.status, failed_at = excluded.failed_at, '
+                    'expires_at = excluded.expires_at, attempts = attempts + 1',
+                    (arg, status, now, expires_at))
+        finally:
+            connection.close()
+
+    def migrate(self, legacy_file: str = LEGACY_BAD_REQUESTS_FILE, now: float = None) -> int:
+        """
+        Imports a bad requests text file of an earlier version, one argument
+        per line, as requests that did not exist. The file records no times,
+        so the requests are dated from the migration: they expire NOT_FOUND_TTL
+        after the upgrade instead of all being requested again at once. The
+        file is renamed to <name>.migrated afterwards.
+
+        Args:
+            legacy_file (str): The name of the file in the directory.
+            now (float, optional): The time of the migration. Defaults to time.time().
+
+        Returns:
+            int: The number of imported bad requests.
+        """
+        legacy_path = self.directory / legacy_file
+        try:
+            with open(legacy_path, 'r') as file:
+                args = [line.strip() for line in file if line.strip()]
+        except OSError:
+            return 0
+        failed_at = time.time() if now is None else now
+        ttl = time_to_live(404)
+        connection = self._connect()
+        try:
+            with connection:
+                # Requests recorded in the store since are kept
+                connection.executemany(
+                    'INSERT OR IGNORE INTO bad_requests (arg, status, failed_at, expires_at) VALUES (?, 404, ?, ?)',
+                    [(arg, failed_at, None if ttl is None else failed_at + ttl) for arg in args])
+        finally:
+            connection.close()
+        try:
+            os.replace(legacy_path, legacy_path.with_name(f'{legacy_path.name}.migrated'))
+        except OSError:
+            # Another process migrated the file at the same time
+            pass
+        return len(args)
+
+
+# The opened stores of this process, by directory
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def bad_request_store(directory, legacy_file: str = LEGACY_BAD_REQUESTS_FILE) -> BadRequestStore:
+    """
+    Returns the bad request store of a resource directory, creating the database
+    and importing the legacy text file the first time it is needed in this
+    process.
+
+    Args:
+        directory: The resource directory.
+        legacy_file (str): The name of the bad requests text file to import.
+
+    Returns:
+        BadRequestStore: The store of the directory.
+    """
+    key = (str(Path(directory)), legacy_file)
+    with _stores_lock:
+        # The store is created again if its database was deleted
+        if key not in _stores or not _stores[key].path.exists():
+            _stores[key] = BadRequestStore(directory, legacy_file)
+        return _stores[key]
@@ -1,4 +1,111 @@
+import os
 import json
+import mmap
+import base64
+import hashlib
+import struct
+from pathlib import Path
+
+# Base images are stored as a small fixed header followed by the raw bytes of the
+# processed PNG. The header holds 8 magic bytes and the width and height of the
+# image as unsigned 32-bit big-endian integers, so the dimensions can be read
+# without touching the image itself.
+BASE_IMAGE_SUFFIX = '.bimg'
+BASE_IMAGE_MAGIC = b'KMWBIMG1'
+_HEADER = struct.Struct('>8sII')
+# Number of PNG bytes encoded per chunk when streaming; a multiple of 3 so that
+# the base64 chunks can be concatenated without padding in between
+_CHUNK_SIZE = 3 * 64 * 1024
+# Shared base image files are named map#####.<hash>.png, where the hash is this
+# number of hex digits of the SHA-256 of the PNG. Files of different versions of
+# a map image therefore never overwrite each other.
+SHARED_IMAGE_HASH_LENGTH = 16
+
+
+def write_base_image(image_path, width: int, height: int, png_bytes: bytes) -> None:
+    """
+    Writes a processed PNG and its dimensions to a base image file.
+
+    The file is written to a temporary file first and then moved into place,
+    so readers never see a partially written image.
+
+    Args:
+        image_path: The path of the base image file.
+        width (int): The width of the image.
+        height (int): The height of the image.
+        png_bytes (bytes): The raw bytes of the PNG image.
+    """
+    image_path = Path(image_path)
+    temp_path = image_path.with_name(f'{image_path.name}.{os.getpid()}.tmp')
+    with open(temp_path, 'wb') as file:
+        file.write(_HEADER.pack(BASE_IMAGE_MAGIC, width, height))
+        file.write(png_bytes)
+    os.replace(temp_path, image_path)
+
+
+def read_base_image_header(image_path) -> tuple:
+    """
+    Reads the dimensions of a base image file without reading the image.
+
+    Args:
+        image_path: The path of the base image file.
+
+    Returns:
+        tuple: The width and height of the image.
+
+    Raises:
+        ValueError: If the file is not a base image file.
+    """
+    with open(image_path, 'rb') as file:
+        header = file.read(_HEADER.size)
+    if len(header) != _HEADER.size or header[:len(BASE_IMAGE_MAGIC)] != BASE_IMAGE_MAGIC:
+        raise ValueError(f'{image_path} is not a base image file')
+    _, width, height = _HEADER.unpack(header)
+    return width, height
+
+
+def migrate_json_base_image(json_path) -> Path:
+    """
+    Converts a base image stored in the former JSON format (width, height and
+    the base64 encoded PNG) to a base image file next to it.
+
+    Args:
+        json_path: The path of the JSON file.
+
+    Returns:
+        Path: The path of the written base image file.
+    """
+    json_path = Path(json_path)
+    with open(json_path, 'r') as file:
+        image_data = json.load(file)
+    image_path = json_path.with_suffix(BASE_IMAGE_SUFFIX)
+    write_base_image(image_path, int(image_data['width']), int(image_data['height']),
+                     base64.b64decode(image_data['image']))
+    return image_path
+
+
+def migrate_json_base_images(directory, remove_json: bool = False) -> list:
+    """
+    Converts all base images of a directory from the former JSON format.
+
+    JSON files that already have a base image file next to them are skipped.
+
+    Args:
+        directory: The directory containing the map#####.json files, usually
+                   <working_dir>/maps_png.
+        remove_json (bool): If True, delete the JSON files after conversion.
+
+    Returns:
+        list: The paths of the written base image files.
+    """
+    migrated = []
+    for json_path in sorted(Path(directory).glob('map*.json')):
+        image_path = json_path.with_suffix(BASE_IMAGE_SUFFIX)
+        if not image_path.exists():
+            migrated.append(migrate_json_base_image(json_path))
+        if remove_json:
+            json_path.unlink()
+    return migrated
 
 
 class BaseImage:
@@ -8,25 +115,128 @@ class BaseImage:
    Attributes:
        map_id : str
            The ID of the pathway map.
-       image: The image data.
+       image: The base64 encoded image data.
        image_height: The height of the image.
        image_width: The width of the image.
+       image_path: The base image file the image is read from, if any.
     """
 
-    def __init__(self, map_id: str, image, height, width):
+    def __init__(self, map_id: str, image, height, width, image_path=None):
         """
         Initializes a new instance of the class.
-    
+
         Args:
         - map_id (str): The ID of the pathway map.
-        - image: The image of the pathway map.
+        - image: The base64 encoded image of the pathway map. May be None if
+          image_path is given, in which case it is read on first access.
         - height: The height of the image.
         - width: The width of the image.
+        - image_path: The base image file holding the image.
        """
         self.map_id = map_id
-        self.image = image
+        self._image = image
         self.image_height = height
         self.image_width = width
+        self.image_path = image_path
+        self._content_hash = None
+
+    @property
+    def image(self):
+        """
+        The base64 encoded PNG image. Images of base image files are only read
+        and encoded on first access.
+        """
+        if self._image is None and self.image_path is not None:
+            self._image = ''.join(self.iter_base64())
+        return self._image
+
+    def iter_base64(self, chunk_size: int = _CHUNK_SIZE):
+        """
+        Yields the base64 encoded PNG image in chunks.
+
+        For base image files the PNG is memory-mapped and encoded chunk by
+        chunk, so the complete encoded image is never held in memory.
+
+        Args:
+            chunk_size (int): Number of PNG bytes encoded per chunk. Rounded
+                              down to a multiple of 3.
+
+        Yields:
+            str: Consecutive chunks of the base64 encoded image.
+        """
+        if self._image is not None or self.image_path is None:
+            if self._image:
+                yield self._image
+            return
+        chunk_size = max(3, chunk_size - chunk_size % 3)
+        with open(self.image_path, 'rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as payload:
+                for start in range(_HEADER.size, len(payload), chunk_size):
+                    yield base64.b64encode(payload[start:start + chunk_size]).decode()
+
+    def iter_png(self, chunk_size: int = _CHUNK_SIZE):
+        """
+        Yields the raw bytes of the PNG image in chunks.
+
+        Args:
+            chunk_size (int): Number of bytes read per chunk from base image files.
+
+        Yields:
+            bytes: Consecutive chunks of the PNG image.
+        """
+        if self._image is not None or self.image_path is None:
+            if self._image:
+                yield base64.b64decode(self._image)
+            return
+        with open(self.image_path, 'rb') as file:
+            file.seek(_HEADER.size)
+            while chunk := file.read(chunk_size):
+                yield chunk
+
+    @property
+    def content_hash(self) -> str:
+        """
+        The first SHARED_IMAGE_HASH_LENGTH hex digits of the SHA-256 of the PNG
+        image, computed on first access.
+        """
+        if self._content_hash is None:
+            digest = hashlib.sha256()
+            for chunk in self.iter_png():
+                digest.update(chunk)
+            self._content_hash = digest.hexdigest()[:SHARED_IMAGE_HASH_LENGTH]
+        return self._content_hash
+
+    @property
+    def shared_image_name(self) -> str:
+        """The file name of the shared PNG image, e.g. map00010.<hash>.png."""
+        return f"map{self.map_id[-5:]}.{self.content_hash}.png"
+
+    def write_shared_png(self, directory) -> Path:
+        """
+        Writes the PNG image to a content-hashed file in a directory, unless
+        the file already exists.
+
+        As the file name is derived from the content, an existing file holds
+        the same image and all maps of the same map number share it. The file
+        is written to a temporary file first and then moved into place, so
+        concurrent renders of the map never see a partially written image.
+
+        Args:
+            directory: The directory of the shared images, created if needed.
+
+        Returns:
+            Path: The path of the PNG file.
+        """
+        directory = Path(directory)
+        png_path = directory / self.shared_image_name
+        if not png_path.exists():
+            os.makedirs(directory, exist_ok=True)
+            temp_path = png_path.with_name(f'{png_path.name}.{os.getpid()}.tmp')
+            with open(temp_path, 'wb') as file:
+                for chunk in self.iter_png():
+                    file.write(chunk)
+            os.replace(temp_path, png_path)
+        return png_path
 
     @classmethod
     def from_png(cls, map_id, image_path):
@@ -51,3 +261,23 @@ class BaseImage:
         image = image_data['image']
 
         return cls(map_id, image, height, width)
+
+    @classmethod
+    def from_store(cls, map_id, image_path):
+        """
+        Create a BaseImage object from a base image file.
+
+        Only the header with the dimensions is read; the image is read when
+        it is first needed.
+
+        Args:
+            cls: The class itself.
+            map_id (str): The ID of the pathway map.
+            image_path (str): The path to the base image file.
+
+        Returns:
+            BaseImage: An instance of the BaseImage class.
+        """
+        width, height = read_base_image_header(image_path)
+
+        return cls(map_id, None, str(height), str(width), image_path=image_path)
@@ -0,0 +1,172 @@
+"""
+This module provides functionality for rendering many KEGG pathway maps in
+parallel.
+
+The combinations of map IDs and organisms are distributed over a pool of
+worker processes. Required resources are downloaded and the REST annotations
+are indexed once in the calling process before the workers start. The workers
+then share the read-only annotation index on disk, and each worker keeps its
+process-wide annotation cache across all maps it renders. The time taken and
+any failure are reported for every map.
+"""
+import io
+import os
+import time
+import contextlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from keggmapwizard.config import config
+from keggmapwizard.annotation_index import annotation_cache
+from keggmapwizard.kegg_pathway_map import KeggPathwayMap, download_kegg_resources
+
+
+class RenderResult:
+    """
+    The outcome of rendering a single map.
+
+    Attributes:
+        map_id (str): The map ID that was rendered, including organism prefixes.
+        output_path (Path or None): The written SVG file, or None if nothing was written.
+        seconds (float): The time taken to render the map.
+        error (str or None): A description of the failure, or None if rendering succeeded.
+    """
+
+    def __init__(self, map_id, output_path=None, seconds=0.0, error=None):
+        self.map_id = map_id
+        self.output_path = output_path
+        self.seconds = seconds
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None and self.output_path is not None
+
+    def __repr__(self):
+        status = 'ok' if self.ok else f'failed: {self.error or "no pathway to create"}'
+        return f'<RenderResult: {self.map_id} - {status} ({self.seconds:.2f} s)>'
+
+
+def _suppress_output(verbose):
+    # Printed messages are discarded unless verbose; with verbose, stdout is left alone
+    return contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+
+def _init_worker(working_dir):
+    # Worker processes use the working directory of the calling process
+    config.set_working_dir(working_dir)
+
+
+def render_map(map_id, color_function=None, args=(), path=None, output_name=None,
+               verbose=False, output_format='svg', shared_image=False, image_url=None) -> RenderResult:
+    """
+    Renders a single map and reports the outcome instead of raising.
+
+    Args:
+        map_id (str): The map ID, optionally prefixed with organisms, e.g. 'hsa00010'.
+        color_function (callable, optional): The color function passed to write_svg_map.
+        args (tuple): Additional positional arguments for the color function.
+        path (str, optional): The output directory passed to write_svg_map.
+        output_name (str, optional): The output file name passed to write_svg_map.
+        verbose (bool): If False, the progress messages of the map are suppressed.
+        output_format (str): The output format passed to write_svg_map.
+        shared_image (bool): If True, the SVG references the shared base image file
+                             of the map instead of embedding it, see write_svg_map.
+        image_url (str, optional): The URL the shared base images are served from.
+
+    Returns:
+        RenderResult: The outcome of rendering the map.
+    """
+    start_time = time.perf_counter()
+    try:
+        with _suppress_output(verbose):
+            pathway_map = KeggPathwayMap(map_id=map_id)
+            # Only the files are needed, so the base image is not embedded into a document
+            output_path = pathway_map.write_svg_map(color_function, *args, path=path, output_name=output_name,
+                                                    output_format=output_format, shared_image=shared_image,
+                                                    image_url=image_url)
+        return RenderResult(map_id, output_path, time.perf_counter() - start_time)
+    except Exception as error:
+        return RenderResult(map_id, None, time.perf_counter() - start_time,
+                            f'{type(error).__name__}: {error}')
+
+
+def render_maps(map_ids: list, orgs: list = None, color_function=None, *args, path=None,
+                n_processes: int = None, download: bool = True, reload: bool = False,
+                verbose: bool = True, output_format: str = 'svg', shared_image: bool = False,
+                image_url: str = None, verbose_maps: bool = False) -> list:
+    """
+    Renders all combinations of map IDs and organisms in a pool of worker processes.
+
+    Args:
+        map_ids (list): The map numbers to render, e.g. ['00010', '00400'].
+        orgs (list, optional): Organism prefixes, e.g. ['hsa', 'mmu']. An empty
+                               string renders the reference map. Defaults to [''].
+        color_function (callable, optional): A color function applied to every map.
+                                             It must be picklable, i.e. defined at
+                                             module level.
+        *args: Additional positional arguments for the color function.
+        path (str, optional): The output directory passed to write_svg_map.
+        n_processes (int, optional): Number of worker processes. Defaults to the
+                                     number of CPUs. With 1, the maps are rendered
+                                     in the calling process.
+        download (bool): If True, download missing resources before rendering.
+        reload (bool): If True, download all resources again before rendering.
+        verbose (bool): If True, print the outcome of every map and a summary.
+        output_format (str): The output format passed to write_svg_map: 'svg',
+                             'svgz' or 'svg+gz'.
+        shared_image (bool): If True, every map number's base image is written once
+                             to a content-hashed PNG file in the output directory and
+                             referenced by all its SVGs instead of being embedded.
+        image_url (str, optional): The URL the shared base images are served from.
+        verbose_maps (bool): If True, the progress messages of every map are printed
+                             as well, see render_map. The messages of maps rendered
+                             in parallel may be interleaved.
+
+    Returns:
+        list: A RenderResult for every rendered map, in the order of completion.
+    """
+    orgs = [''] if not orgs else list(orgs)
+    combined_ids = [f"{org}{map_id}" for map_id in map_ids for org in orgs]
+    if n_processes is None:
+        n_processes = os.cpu_count() or 1
+
+    start_time = time.perf_counter()
+    # Download and index all resources once, before the workers start, so that
+    # the workers neither race on downloads nor on building the annotation index
+    if download or reload:
+        with _suppress_output(verbose):
+            download_kegg_resources(list(map_ids), [org for org in orgs if org] or None, reload=reload)
+    annotation_cache.index(Path(config.working_dir) / 'rest_data').update()
+
+    results = []
+
+    def report(result):
+        results.append(result)
+        if verbose:
+            print(f'[{len(results)}/{len(combined_ids)}] {result}')
+
+    if n_processes <= 1 or len(combined_ids) <= 1:
+        for map_id in combined_ids:
+            report(render_map(map_id, color_function, args, path, verbose=verbose_maps,
+                              output_format=output_format, shared_image=shared_image, image_url=image_url))
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_processes, len(combined_ids)),
+                                 initializer=_init_worker, initargs=(config.working_dir,)) as executor:
+            futures = {executor.submit(render_map, map_id, color_function, args, path, verbose=verbose_maps,
+                                       output_format=output_format, shared_image=shared_image,
+                                       image_url=image_url): map_id
+                       for map_id in combined_ids}
+            for future in as_completed(futures):
+                try:
+                    report(future.result())
+                except Exception as error:
+                    # The worker process itself failed, e.g. the color function is not picklable
+                    report(RenderResult(futures[future], error=f'{type(error).__name__}: {error}'))
+
+    if verbose:
+        failed = [result for result in results if not result.ok]
+        print(f'Rendered {len(results) - len(failed)} of {len(results)} maps in '
+              f'{time.perf_counter() - start_time:.1f} seconds using {n_processes} process(es).')
+        for result in failed:
+            print(f'Failed: {result.map_id}: {result.error or "no pathway to create"}')
+    return results
@@ -1,4 +1,11 @@
+import hashlib
 from xml.etree import ElementTree as ET
+from keggmapwizard.shape_index import get_shape_index
+
+# Colors given to query sets without a color of their own, in this order.
+# Further sets get colors spread evenly over the hue circle.
+QUERY_SET_PALETTE = ['yellow', 'red', 'blue', 'green', 'orange', 'purple', 'cyan', 'magenta',
+                     'brown', 'olive', 'navy', 'teal', 'maroon', 'lime', 'pink', 'gray']
 
 
 def color_all(*args, data):
@@ -29,23 +36,17 @@ def color_org(org, *args, data):
     Parse the element_tree object
     """
     root = data
-    elements = root.find('.//g')
     # Determine the color to use; default to 'blue' if not provided
     color = args[0] if args else 'blue'
 
-    # Set the stroke of each element to the specified color
-
-    for shapes in elements:
-        # Extract the title element from shapes
-        title_element = shapes.find('title')
-
-        # Extract the title text if the title element           
-        title_text = eval(title_element.text)
+    # process the organism prefix to match the format in SVG
+    query = org + ":"
 
-        # process the organism prefix to match the format in SVG
-        query = org + ":"
-
-        if any(query in item for item in title_text):
+    # Set the stroke of each element to the specified color
+    for entry in get_shape_index(root):
+        # Look up the title lines of the shape in the shape index
+        if any(query in item for item in entry.titles):
+            shapes = entry.element
             shapes.set('stroke', color)
             shapes.set('stroke-width', '3')
             shapes.set('fill', color)
@@ -57,79 +58,162 @@ def color_org(org, *args, data):
 def color_custom_annotations(query: dict, *args, data):
     """
     Color only shapes with indicated annotation blue
+
+    The values of the query are annotation identifiers such as 'K00844',
+    'EC:2.7.1.1' or 'hsa:3098', matched exactly against the annotations of
+    the shapes.
+
+    Any number of query sets (e.g. genomes) can be given. Each shape gets a
+    gradient with one bar per set, colored in the color of the set if the
+    shape matches it and white otherwise. Shapes matching the same sets share
+    one gradient. Sets without a color of their own get one from
+    QUERY_SET_PALETTE.
     """
     # Use the provided data as the root of the XML tree
     root = data
 
+    # Return early if the query is empty
+    if not query:
+        return root, None
+
     # Determine the color to use; default to 'blue' if not provided
     color = args[0] if args else ['blue'] * len(query)
 
     if not isinstance(color, list):
         color = [color]
-    # Find the group of elements in the SVG
-    elements = root.find('.//g')
-    # Set the fill of each element to the specified color
-
-    # Return early if the query is empty
-    if not query:
-        return root
-    # if the length of query is less than 5 execute the following commands
-    if len(query) < 5:
-
-        for shapes in elements:
-
-            # Extract the title element from shapes
-            title_element = shapes.find('title')
-
-            # Extract the title text if the title element           
-            title_text = eval(title_element.text)
-
-            # Define an empty list for colors to store colors if there are more than one query
-            colors = []
-            counter = 0
-            # Iterate over each key-value pair in the query
-            for key, values in query.items():
-
-                # Check if any value in the list of values of the query dictionary
-                # matches the title text
-
-                if any(value in item for item in title_text for value in values):
-                    colors.append(color[counter])  # Add the specified color
-                else:
-                    colors.append('white')  # Default to white
-
-                # Update title text based on matches
-                for value in values:
-                    if any(value in item for item in title_text):
-                        # Create a new list to replace items
-                        updated_title_text = []
-                        # Update title text with the key
-                        for item in title_text:
-                            if value in item:
-                                updated_title_text.append(f"{key}:{item}")
-                                shapes.set('fill-opacity', '0.5')  # Set opacity
-
-                                # if the length of queries is 1 then the shape will be filled with
-                                # specified color otherwise a gradient will be added later
-                                if len(query) == 1:
-                                    shapes.set('fill', color[0])
-                            else:
-                                updated_title_text.append(item)  # Keep the original 
-                                # item if conditions are not met
-                            # Replace the title_text with updated_title_text
-                            title_element.text = str(updated_title_text)
-                counter = counter + 1
-            # Executed when length of queries is more than 1
-            # Check if any color is not white
-            if colors and any(c != 'white' for c in colors):
-                # Create a new definitions element 
-                defs = ET.Element('defs')
-                defs = set_gradient(shapes.get('shape_id'), shapes, defs, colors)  # Set gradient
-                root.append(defs)  # Append definitions to root
+    # Query sets without a color of their own get one from the palette
+    color = extend_colors(color, len(query))
+
+    # Shapes matching the same query sets share one gradient
+    gradients = GradientRegistry(root)
+
+    shape_index = get_shape_index(root)
+    # Look up the shapes annotated with the values of each query in the
+    # inverted annotation index. Values are matched exactly, so only the
+    # shapes matching any query have to be visited.
+    query_matches = [shape_index.match([values] if isinstance(values, str) else values)
+                     for values in query.values()]
+    matched_entries = sorted({entry for matches in query_matches for entry in matches},
+                             key=lambda entry: entry.position)
+
+    for entry in matched_entries:
+        shapes = entry.element
+        updated_title_text = list(entry.titles)
+
+        # Define an empty list for colors to store colors if there are more than one query
+        colors = []
+        counter = 0
+        # Iterate over each key and the shapes matching its values
+        for key, matches in zip(query, query_matches):
+            if entry in matches:
+                colors.append(color[counter])  # Add the specified color
+
+                # Update the matching title lines with the key
+                for i in matches[entry]:
+                    updated_title_text[i] = f"{key}:{updated_title_text[i]}"
+                shapes.set('fill-opacity', '0.5')  # Set opacity
+
+                # if the length of queries is 1 then the shape will be filled with
+                # specified color otherwise a gradient will be added later
+                if len(query) == 1:
+                    shapes.set('fill', color[0])
+            else:
+                colors.append('white')  # Default to white
+            counter = counter + 1
+
+        # Write the title lines back only if they changed
+        if updated_title_text != entry.titles:
+            entry.set_titles(updated_title_text)
+
+        # Executed when length of queries is more than 1
+        # Check if any color is not white
+        if colors and any(c != 'white' for c in colors):
+            gradients.apply(shapes, colors)  # Set gradient
 
     return root, color
 
 
+def extend_colors(colors: list, n: int) -> list:
+    """
+    Extends a list of colors to at least n colors.
+
+    Missing colors are taken from QUERY_SET_PALETTE, skipping colors already
+    in the list. If the palette is exhausted, further colors are spread evenly
+    over the hue circle.
+
+    Args:
+        colors (list): The given colors.
+        n (int): The number of colors needed.
+
+    Returns:
+        list: The given colors followed by the added colors.
+    """
+    colors = list(colors)
+    palette = (color for color in QUERY_SET_PALETTE if color not in colors)
+    while len(colors) < n:
+        color = next(palette, None)
+        if color is None:
+            # Golden angle steps give well separated hues for any number of colors
+            color = f'hsl({round(len(colors) * 137.508) % 360}, 70%, 50%)'
+        colors.append(color)
+    return colors
+
+
+def color_signature(colors: list) -> str:
+    """
+    Returns a short identifier of a list of colors, used as id of the gradient
+    shared by all shapes with these colors.
+    """
+    return hashlib.sha1('|'.join(colors).encode()).hexdigest()[:12]
+
+
+class GradientRegistry:
+    """
+    The gradients of an SVG document, keyed by their colors.
+
+    Every distinct list of colors is emitted once as a linearGradient into the
+    'shape-color-defs' element of the document; all shapes with these colors
+    reference it by its id.
+
+    Methods:
+        apply(shape_element, colors): Fills a shape with the gradient of the colors.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.defs = root.find("defs[@id='shape-color-defs']")
+        if self.defs is None:
+            # Documents not created by create_svg_content
+            self.defs = ET.SubElement(root, 'defs', id='shape-color-defs')
+        # Gradients emitted by earlier color functions are reused as well
+        self._gradient_ids = {element.get('id') for element in self.defs.iter('linearGradient')}
+
+    def __len__(self):
+        return len(self._gradient_ids)
+
+    def apply(self, shape_element, colors: list) -> str:
+        """
+        Fills and strokes a shape with the gradient of a list of colors,
+        emitting the gradient if it has not been emitted yet.
+
+        Args:
+            shape_element: The shape element.
+            colors (list): The colors of the gradient.
+
+        Returns:
+            str: The id of the gradient.
+        """
+        signature = color_signature(colors)
+        gradient_id = 'gradient_' + signature
+        if gradient_id in self._gradient_ids:
+            shape_element.set('fill', 'url(#{})'.format(gradient_id))
+            shape_element.set('stroke', 'url(#{})'.format(gradient_id))
+        else:
+            set_gradient(signature, shape_element, self.defs, list(colors))
+            self._gradient_ids.add(gradient_id)
+        return gradient_id
+
+
 def set_gradient(anno: str, shape_element, defs, colors: list = ['yellow', 'red', 'blue', 'green']):
     """
     Set a gradient of shapes with specific colors
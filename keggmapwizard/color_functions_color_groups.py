@@ -1,34 +1,36 @@
-from xml.etree import ElementTree as ET
-from color_function_base import set_gradient
+from keggmapwizard.color_function_base import GradientRegistry
+from keggmapwizard.shape_index import get_shape_index
 
 
-def check_anno(title_text, group, group_no):
-    colors = []
+def check_anno(title_text, group, group_no, positions):
+    """
+    Determines the percentage of the keys of a group matching a shape and
+    prefixes the matching title lines of the shape with the group and key.
+
+    Args:
+        title_text (list): The title lines of the shape.
+        group (list): The group, i.e. a list holding the query dictionary.
+        group_no (int): The number of the group.
+        positions (dict): The positions of the title lines matching the values
+                          of each key, for the keys matching the shape.
 
-    # Iterate over each key-value pair in the query
-    for key, values in group[0].items():
+    Returns:
+        tuple: The updated title lines and the percentage of matching keys.
+    """
+    colors = []
+    title_text = list(title_text)
 
-        # Check if any value in the list of values of the query dictionary
-        # matches the title text
+    # Iterate over each key of the query
+    for key in group[0]:
 
-        if any(value in item for item in title_text for value in values):
+        # Check if any value in the list of values of the key matches the shape
+        if key in positions:
             colors.append(1)  # Add the specified color
+            # Update title text with the group and key
+            for i in positions[key]:
+                title_text[i] = f"group{group_no}:{key}:{title_text[i]}"
         else:
             colors.append(0)  # Default to white
-        for value in values:
-            if any(value in item for item in title_text):
-                # Create a new list to replace items
-                updated_title_text = []
-                # Update title text with the key
-                for item in title_text:
-                    if (value in item):
-                        updated_title_text.append(f"group{group_no}:{key}:{item}")
-                    else:
-                        updated_title_text.append(item)  # Keep the original 
-
-                    title_text = updated_title_text
-                    # item if conditions are not met
-                    # Replace the title_text with updated_title_text
     if len(colors) == 0:
         percentage_presence = 0
     else:
@@ -40,40 +42,49 @@ def check_anno(title_text, group, group_no):
 def add_linear_gradient_groups(query: list, predefined_colors: list = ['yellow', 'red', 'blue', 'green'], data=None):
     # assign the data parameter to the root variable. 
     root = data
-    elements = root.find('.//g')
-    # Create a <defs> element
-    defs = ET.Element('defs')
     # Set the fill of each element to the specified color
     no_of_groups, groups = assess_no_of_groups(query)
 
     if no_of_groups == 0:
         return root, None
 
-    for shapes in elements:
+    shape_index = get_shape_index(root)
+    # Shapes with the same colors share one gradient
+    gradients = GradientRegistry(root)
+    # Look up the shapes matching the values of every key of every group in the
+    # inverted annotation index, matching the values exactly
+    group_matches = [{key: shape_index.match([values] if isinstance(values, str) else values)
+                      for key, values in sublist[0].items()}
+                     for sublist in groups]
+    matched_entries = sorted({entry for matches in group_matches for key_matches in matches.values()
+                              for entry in key_matches}, key=lambda entry: entry.position)
+
+    # Shapes matching no key stay uncolored; the legend is drawn for any map with shapes
+    legend_colors = define_color([])[1] if len(shape_index) else None
+    for entry in matched_entries:
+        shapes = entry.element
         colors = []
-        # Extract the title element from shapes
-        title_element = shapes.find('title')
-
-        # Extract the title text if the title element           
-        title_text = eval(title_element.text)
+        title_text = entry.titles
 
         group_count = 0
-        for sublist in groups:
+        for sublist, matches in zip(groups, group_matches):
             group_count = group_count + 1
-            updated_title_text, color = check_anno(title_text, sublist, group_count)
+            positions = {key: key_matches[entry] for key, key_matches in matches.items()
+                         if entry in key_matches}
+            title_text, color = check_anno(title_text, sublist, group_count, positions)
 
-            updated_title_text = remove_duplicate_groups(updated_title_text)
+            title_text = remove_duplicate_groups(title_text)
             colors.append(color)
-            title_element.text = str(updated_title_text)
-            title_text = eval(title_element.text)
+
+        # Write the title lines back only if they changed
+        if title_text != entry.titles:
+            entry.set_titles(title_text)
 
         gradient_colors, legend_colors = define_color(colors)
 
         if gradient_colors and any(c != 'white' for c in gradient_colors):
             shapes.set('fill-opacity', '0.5')
-            defs = ET.Element('defs')
-            defs = set_gradient(shapes.get('shape_id'), shapes, defs, gradient_colors)  # Set gradient
-            root.append(defs)  # Append definitions to root
+            gradients.apply(shapes, gradient_colors)  # Set gradient
 
     return root, legend_colors
 
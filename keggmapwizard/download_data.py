@@ -1,18 +1,28 @@
 import os
-import base64
 from io import BytesIO
 import re
+import hashlib
 import time
-import json
-import urllib.request
 import urllib.error
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from PIL import Image
+from PIL import Image, ImageChops
 from keggmapwizard.config import config
+from keggmapwizard.http_session import session
+from keggmapwizard.base_image import BASE_IMAGE_SUFFIX, write_base_image, migrate_json_base_image
+from keggmapwizard.annotation_index import annotation_cache
+from keggmapwizard.sync_state import KEGG_INFO_URL, parse_kegg_release, load_sync_state
+from keggmapwizard.bad_requests import BAD_REQUESTS_DB, LEGACY_BAD_REQUESTS_FILE, NOT_FOUND_STATUS, bad_request_store, is_bad_request
 
+# Default number of files downloaded simultaneously by the download functions.
+# Independent of this, the shared HTTP session never opens more than
+# http_session.MAX_CONNECTIONS_PER_HOST connections to a single host.
+N_PARALLEL = 4
 
-# TODO: INCORPORATE PARALLEL PROCESSING
-def download_data(url: str, arg: str, path: str, verbose: bool = True):
+
+
+def download_data(url: str, arg: str, path: str, verbose: bool = True, sync_state=None) -> bool:
     """
     Handle the downloading of data based on a URL and an argument.
 
@@ -21,9 +31,12 @@ def download_data(url: str, arg: str, path: str, verbose: bool = True):
         arg (str): Argument/query to be downloaded.
         path (str): Path to save the downloaded file.
         verbose (bool): A boolean flag indicating whether to display verbose output.
+        sync_state (SyncState, optional): If given, an existing file is revalidated
+            with the validators recorded in the sync state and only rewritten if
+            its content changed.
 
     Returns:
-        None
+        bool: True if the file was written.
     """
     def save_file(data, file_name, mode='w'):
         """Helper function to save content to a file."""
@@ -34,48 +47,68 @@ def download_data(url: str, arg: str, path: str, verbose: bool = True):
 
     def log_bad_request():
         """Helper function to log bad requests."""
-        
-        file_path = Path(path) /  'bad_requests.txt'
-        
-        # Ensure the file exists; create it if it doesn't
-        file_path.parent.mkdir(parents=True, exist_ok=True)  # Create missing directories
-        file_path.touch(exist_ok=True)  # Now safe to touch the file
-        
-        with open(file_path, 'r') as file:
-            bad_requests = file.read().splitlines()
-        if arg not in bad_requests:
-            save_file(arg + '\n', 'bad_requests.txt',mode = 'a')
-            if verbose:
+        # The store of the directory is safe to write from several workers
+        bad_request_store(path).record(arg, error_code)
+        if verbose:
+            if error_code in (400, 404):
                 print(f"Data non-existent for query: {arg}. Status code: {error_code}")
+            else:
+                print(f"An error occurred for query: {arg}. Status code: {error_code}. "
+                      f"The query will be retried later.")
+
+    # Define URL patterns for kgml and PNG file types
+    pattern1 = r'^https?://rest\.kegg\.jp/get/[^/]+/kgml$'
+    pattern2 = r'https://www\.genome\.jp/kegg/pathway/map/map\d+\.png'
+
+    # Determine file type and extension based on URL pattern
+    if re.match(pattern1, url):
+        file_name = f'{arg}.xml'
+    elif re.match(pattern2, url):
+        file_name = f'map{arg}.png'
+    else:
+        file_name = f'{arg}.txt'
+    file_path = Path(path) / file_name
+
     if verbose:
         print(f"Attempting to download {arg}...")
     try:
-        # Make the request
-        with urllib.request.urlopen(url) as response:
-            data = response.read()
-
-            # Define URL patterns for kgml and PNG file types
-            pattern1 = r'^http://rest\.kegg\.jp/get/[^/]+/kgml$'
-            pattern2 = r'https://www\.genome\.jp/kegg/pathway/map/map\d+\.png'
-
-            # Determine file type and extension based on URL pattern
-            if re.match(pattern1, url):
-                file_name = f'{arg}.xml'
-                save_file(data.decode('utf-8'), file_name)
-            elif re.match(pattern2, url):
-                file_name = f'map{arg}.png'
-                save_file(data, file_name, mode='wb')
-                # Uncomment if encode_png is needed
-                # encode_png(f'{path}/{file_name}')
-            else:
-                file_name = f'{arg}.txt'
-                save_file(data.decode('utf-8'), file_name)
-            
+        if sync_state is None:
+            # Make the request over a pooled keep-alive connection of the shared session
+            data = session.get(url)
+        else:
+            # Revalidate the file; the server answers 304 if it did not change
+            response = session.fetch(url, headers=sync_state.conditional_headers(file_path))
+            if response.status == 304:
+                sync_state.record(file_path, response.headers)
+                if verbose:
+                    print(f"{file_name} is unchanged")
+                return False
+            data = response.body
+            digest = hashlib.sha256(data).hexdigest()
+            # Unchanged files are not rewritten, so caches keyed by their
+            # modification time stay valid
+            if sync_state.is_unchanged(file_path, digest):
+                sync_state.record(file_path, response.headers, digest)
+                if verbose:
+                    print(f"{file_name} is unchanged")
+                return False
+
+        if file_name.endswith('.png'):
+            save_file(data, file_name, mode='wb')
+            # Uncomment if encode_png is needed
+            # encode_png(f'{path}/{file_name}')
+        else:
+            save_file(data.decode('utf-8'), file_name)
+        if sync_state is not None:
+            # The validators are only recorded once the file was written, so a
+            # failed write is revalidated by the next sync
+            sync_state.record(file_path, response.headers, digest)
+        return True
 
     except urllib.error.HTTPError as error:
         # Handle HTTP error codes (e.g., 400, 404)
         error_code = error.code
-        if error_code in (400, 404):
+        if is_bad_request(error_code):
             log_bad_request()
         else:
             if verbose:
@@ -84,21 +117,147 @@ def download_data(url: str, arg: str, path: str, verbose: bool = True):
         # Handle other URL errors
         if verbose:
             print(f"Failed to reach server for query: {arg}. Reason: {error.reason}")
+    return False
+
+
+def sync_kegg_release(verbose: bool = True, refresh: bool = False):
+    """
+    Returns the sync state of the working directory with the current KEGG
+    release, which is requested once per process unless refresh is True.
+
+    Args:
+        verbose (bool): If True, print the release.
+        refresh (bool): If True, request the release again.
+
+    Returns:
+        SyncState: The sync state of the working directory.
+    """
+    sync_state = load_sync_state(config.working_dir)
+    if refresh or not sync_state.release_checked:
+        release = fetch_kegg_release(verbose)
+        sync_state.release_checked = True
+        # If the release is not available, all existing files are revalidated
+        sync_state.release = release
+        if verbose:
+            print(f"Syncing the local data with KEGG release {release}")
+    return sync_state
+
+
+def _is_present(file_path, sync_state) -> bool:
+    # Whether a file need not be downloaded: it exists and, when syncing, was
+    # validated against the current KEGG release
+    return os.path.isfile(file_path) and (sync_state is None or sync_state.is_current(file_path))
+
+
+def is_resolved(file_path, arg: str) -> bool:
+    """
+    Checks whether a resource need not be requested again: its file exists, or
+    the resource is recorded as not existing (status 400 or 404) and the record
+    has not expired yet. Resources whose download failed temporarily, e.g.
+    because of a network error or a 429/5xx response, are not resolved.
+
+    Args:
+        file_path: The path of the downloaded file.
+        arg (str): The request argument of the file, e.g. 'hsa00010'.
+
+    Returns:
+        bool: True if the resource is resolved.
+    """
+    if os.path.isfile(file_path):
+        return True
+    directory = Path(file_path).parent
+    # No request to the directory has failed so far
+    if not os.path.isfile(directory / BAD_REQUESTS_DB):
+        return False
+    bad_request = bad_request_store(directory).lookup([arg]).get(arg)
+    return bad_request is not None and bad_request.status in NOT_FOUND_STATUS
+
+
+def fetch_kegg_release(verbose: bool = True):
+    """
+    Requests the current KEGG release from the info endpoint of the KEGG REST API.
+
+    Args:
+        verbose (bool): If True, print why the release could not be requested.
+
+    Returns:
+        str: The release, e.g. '112.0+/10-17', or None if it is not available.
+    """
+    try:
+        return parse_kegg_release(session.get(KEGG_INFO_URL).decode('utf-8'))
+    except urllib.error.URLError as error:
+        if verbose:
+            print(f"Failed to request the KEGG release. Reason: {error.reason}")
+        return None
+
+
+def download_many(jobs: list, n_parallel: int = N_PARALLEL, verbose: bool = True,
+                  on_complete=None, sync_state=None) -> list:
+    """
+    Download a batch of files using a bounded pool of worker threads.
+
+    Every job is handed to download_data, so file naming and the logging of bad
+    requests are identical to downloading the files one by one. The number of
+    simultaneous requests to a single host is additionally limited by the
+    connection pools of the shared HTTP session.
+
+    Args:
+        jobs (list): List of (url, arg, path) tuples, one for each file to download.
+        n_parallel (int): Maximum number of simultaneous downloads. With 1 or less,
+            the files are downloaded one after another in the calling thread.
+        verbose (bool): A boolean flag indicating whether to display verbose output.
+        on_complete (callable, optional): Called as on_complete(arg, path) after each
+            download attempt, e.g. to post-process the downloaded file.
+        sync_state (SyncState, optional): Passed to download_data to revalidate
+            existing files instead of downloading them again.
+
+    Returns:
+        list: The args of the jobs whose files were written.
+    """
+    def run_job(index, job):
+        url, arg, path = job
+        if verbose:
+            # Display the progress of the download
+            print(f'file {index + 1} of {len(jobs)}')
+        if sync_state is None:
+            written = download_data(url, arg, path, verbose)
+        else:
+            written = download_data(url, arg, path, verbose, sync_state=sync_state)
+        if on_complete is not None:
+            on_complete(arg, path)
+        return written
+
+    if n_parallel is None or n_parallel <= 1 or len(jobs) <= 1:
+        return [job[1] for index, job in enumerate(jobs) if run_job(index, job)]
+
+    with ThreadPoolExecutor(max_workers=min(n_parallel, len(jobs))) as executor:
+        futures = {executor.submit(run_job, index, job): job[1] for index, job in enumerate(jobs)}
+        written = []
+        # Re-raise unexpected errors of the workers in the calling thread
+        for future in as_completed(futures):
+            if future.result():
+                written.append(futures[future])
+    return written
 
 
 def download_rest_data(
         args_list: list,
         reload: bool = False,
         bad_requests_file: str = "bad_requests.txt",
-        verbose: bool = True
+        verbose: bool = True,
+        n_parallel: int = N_PARALLEL,
+        sync: bool = False
 ) -> None:
     """
     Args:
          args_list: List of arguments for that indicate which files to download
          n_parallel: Number of parallel downloads
          reload: if True: overwrite existing files, if False: only download non-existing files
-         bad_requests_file: path to file that conains list of non-existent files
+         bad_requests_file: deprecated, see check_bad_requests. Bad requests are kept in
+                            bad_requests.sqlite of the download directory
          verbose: if True: print summary
+         sync: if True: revalidate existing files and only rewrite the changed ones,
+               see sync_state
     """
     # create a directory for the rest data and changes the working directory to it.
     path = Path(config.working_dir) / "rest_data"
@@ -110,8 +269,10 @@ def download_rest_data(
 
     args_list = check_bad_requests(args_list, path, bad_requests_file, verbose,reload)
 
+    # Existing files that are not current with the KEGG release are revalidated when syncing
+    sync_state = sync_kegg_release(verbose) if sync and not reload else None
     if not reload:
-        args_list = [args for args in args_list if not os.path.isfile(path / f'{args}.txt')]
+        args_list = [args for args in args_list if not _is_present(path / f'{args}.txt', sync_state)]
 
     if len(args_list) == 0:
         if verbose:
@@ -119,9 +280,22 @@ def download_rest_data(
         return
     if verbose:
         print(f'These files will be downloaded: {args_list}')
+    jobs = [(f'https://rest.kegg.jp/list/{arg}', arg, path) for arg in args_list]
+    if sync_state is None:
+        download_many(jobs, n_parallel, verbose)
+    else:
+        # Only the changed files are indexed again
+        args_list = download_many(jobs, n_parallel, verbose, sync_state=sync_state)
+        sync_state.save()
+
+    # Drop cached annotations of rewritten files and compile the downloaded files
+    # into the annotation index once, instead of parsing them every time a
+    # pathway is annotated
     for arg in args_list:
-        url = f'https://rest.kegg.jp/list/{arg}'
-        download_data(url, arg, path, verbose)
+        annotation_cache.invalidate(path / f'{arg}.txt')
+    indexed = annotation_cache.index(path).update(args_list)
+    if verbose and indexed:
+        print(f'Indexed annotations of: {indexed}')
     return
 
 
@@ -166,14 +340,55 @@ def extract_all_map_ids():
     return map_ids
 
 
+def make_transparent(img: Image.Image) -> Image.Image:
+    """
+    Makes the background of a KEGG map transparent.
+
+    Pixels with white full opacity (255, 255, 255, 255) become transparent
+    (255, 255, 255, 0) and all other grey pixels become black with the grey
+    level as transparency (0, 0, 0, 255 - grey). The transformation is done
+    with band operations on the whole image instead of pixel by pixel.
+
+    Args:
+        img: An image in 'RGBA' mode.
+
+    Returns:
+        The modified image in 'RGBA' mode.
+    """
+    red, green, blue, alpha = img.split()
+
+    def to_mask(band, condition):
+        # Convert a band to a mask: 255 where the condition holds, 0 elsewhere
+        return band.point([255 if condition(value) else 0 for value in range(256)])
+
+    # Grey pixels have equal red, green and blue values that are not black
+    grey = ImageChops.multiply(
+        ImageChops.multiply(to_mask(ImageChops.difference(red, green), lambda v: v == 0),
+                            to_mask(ImageChops.difference(green, blue), lambda v: v == 0)),
+        to_mask(red, lambda v: v != 0))
+    # All grey pixels must be fully opaque
+    translucent_grey = ImageChops.multiply(grey, to_mask(alpha, lambda v: v != 255))
+    assert translucent_grey.getbbox() is None, \
+        f'grey pixel with transparency at {translucent_grey.getbbox()[:2]}'
+
+    # The transparency of white and grey pixels is 255 minus the grey level
+    alpha = Image.composite(ImageChops.invert(red), alpha, grey)
+    # White pixels keep their color, all other grey pixels become black
+    dark_grey = ImageChops.multiply(grey, to_mask(red, lambda v: v != 255))
+    black = Image.new('L', img.size, 0)
+    red, green, blue = (Image.composite(black, band, dark_grey) for band in (red, green, blue))
+
+    return Image.merge('RGBA', (red, green, blue, alpha))
+
+
 def encode_png(png_path) -> None:
     """
     Takes a PNG image file as input and converts it to the 'RGBA' mode.
     Converts pixels with white full opacity (255, 255, 255, 255) to transparent 
     (255, 255, 255, 0).
-    Creates a JSON object containing the width, height, and the base64 encoded 
-    string of the modified image and writes it to a file with the same name as 
-    the original PNG file but with a '.json' extension.
+    Writes the width, height, and the bytes of the modified PNG image to a base
+    image file with the same name as the original PNG file but with the
+    BASE_IMAGE_SUFFIX extension.
     Args:
          PNG image file
     
@@ -186,25 +401,11 @@ def encode_png(png_path) -> None:
         img = Image.open(png_path)
         # Convert the image to the 'RGBA' mode
         img = img.convert('RGBA')
-        # Load the pixel data of the image
-        pixdata = img.load()
         # Get the width and height of the image
         width, height = img.size
 
-        # Iterate through each pixel of the image
-        for y_coord in range(height):
-            for x_coord in range(width):
-
-                r, b, g, a = pixdata[x_coord, y_coord]
-
-                # Check if pixel is white
-                if r == 255 and b == 255 and g == 255 and a == 255:
-                    pixdata[x_coord, y_coord] = (255, 255, 255, 0)
-                # Check if pixel is grey
-                elif r == b == g and r != 0:
-                    assert a == 255, f'{(r,g,b,a)=}'
-                    # All pixels are black with variable transparency
-                    pixdata[x_coord, y_coord] = (0, 0, 0, 255 - r)
+        # Make white pixels transparent and grey pixels black with transparency
+        img = make_transparent(img)
 
         # Create a buffer to save the modified image as a PNG
         buffer = BytesIO()
@@ -213,23 +414,19 @@ def encode_png(png_path) -> None:
         # Close the image file
         img.close()
 
-        # encoded_image=base64.b64encode(buffer.getvalue()).decode()
-        # Create a JSON object containing the width, height, and the base64 encoded
-        # string of the modified image.
-        with open(png_path.with_suffix('.json'), 'w') as file:
-            json.dump(dict(
-                width=width,
-                height=height,
-                image=base64.b64encode(buffer.getvalue()).decode()), file)
+        # Write the width, height and the modified image to the base image file
+        write_base_image(png_path.with_suffix(BASE_IMAGE_SUFFIX), width, height, buffer.getvalue())
 
 
 def download_base_png_maps(map_ids: [str], reload: bool = False,
                            bad_requests_file: str = "bad_requests.txt",
-                           verbose: bool = True) -> None:
+                           verbose: bool = True,
+                           n_parallel: int = N_PARALLEL,
+                           sync: bool = False) -> None:
     """
-    Downloads PNG maps, saves them, modifies them and Create a JSON object 
-    containing the width, height, and the base64 encoded string of the modified
-    image.
+    Downloads PNG maps, saves them, modifies them and writes a base image file 
+    containing the width, height, and the modified image. Base images that are 
+    still stored in the former JSON format are converted instead of downloaded.
     
     Args:
         map_ids: list of ids of the images to be downloaded
@@ -238,6 +435,11 @@ def download_base_png_maps(map_ids: [str], reload: bool = False,
         if False: only download non-existing files.
         verbose: A boolean flag indicating whether to display verbose output 
         for ongoing operation     
+        n_parallel: Number of maps downloaded and converted simultaneously.
+        sync: A boolean flag indicating whether to revalidate existing maps and 
+        only convert the changed ones again, see sync_state.
+        bad_requests_file: Deprecated, see check_bad_requests. Bad requests are 
+        kept in bad_requests.sqlite of the download directory.
 
     """
     map_ids = check_input(map_ids)
@@ -255,8 +457,17 @@ def download_base_png_maps(map_ids: [str], reload: bool = False,
     map_ids = check_bad_requests(map_ids, path, bad_requests_file, verbose,reload)
     map_numbers = list(set(map(lambda x: x[-5:], map_ids)))
 
+    # Existing maps that are not current with the KEGG release are revalidated when syncing
+    sync_state = sync_kegg_release(verbose) if sync and not reload else None
     if not reload:
-        map_ids = [map_id for map_id in map_ids if not os.path.isfile(path / f'map{map_id[-5:]}.json')]
+        # Convert base images of existing caches written in the former JSON format
+        for map_number in map_numbers:
+            json_path = path / f'map{map_number}.json'
+            if not os.path.isfile(path / f'map{map_number}{BASE_IMAGE_SUFFIX}') and os.path.isfile(json_path):
+                migrate_json_base_image(json_path)
+        map_ids = [map_id for map_id in map_ids
+                   if not os.path.isfile(path / f'map{map_id[-5:]}{BASE_IMAGE_SUFFIX}')
+                   or (sync_state is not None and not sync_state.is_current(path / f'map{map_id[-5:]}.png'))]
         map_numbers = list(set(map(lambda x: x[-5:], map_ids)))
     
     if len(map_ids) == 0:
@@ -266,19 +477,26 @@ def download_base_png_maps(map_ids: [str], reload: bool = False,
         if verbose:
             print(f'PNG file/s will be downloaded for maps: {map_numbers}')
 
-        for map_id in map_ids:
-            map_number = map_id[-5:]  # Get the last five characters
-
-            if verbose:
-                # Display the progress of the download
-                print(f'map {map_ids.index(map_id) + 1} of {len(map_ids)}')
-            # download all the maps in the filtered maps_id list
-            url = f'https://www.genome.jp/kegg/pathway/map/map{map_number}.png'
-            # Call the download_data function to download the data
-            download_data(url, map_number, path, verbose)
-            
-            # Call the encode_png function to modify the saved image
-            encode_png(path / f'map{map_id[-5:]}.png')
+        # download all the maps in the filtered maps_id list
+        jobs = [(f'https://www.genome.jp/kegg/pathway/map/map{map_id[-5:]}.png', map_id[-5:], path)
+                for map_id in map_ids]
+        # Call the encode_png function to modify each saved image as soon as it
+        # has been downloaded
+        if sync_state is None:
+            download_many(jobs, n_parallel, verbose,
+                          on_complete=lambda map_number, map_path: encode_png(map_path / f'map{map_number}.png'))
+        else:
+            # Unchanged PNG files are not rewritten; their base images are only
+            # converted again if they are missing or older than the PNG
+            def encode_changed_png(map_number, map_path):
+                png_path = map_path / f'map{map_number}.png'
+                image_path = png_path.with_suffix(BASE_IMAGE_SUFFIX)
+                if (os.path.isfile(png_path) and (not os.path.isfile(image_path)
+                                                  or os.path.getmtime(image_path) < os.path.getmtime(png_path))):
+                    encode_png(png_path)
+
+            download_many(jobs, n_parallel, verbose, on_complete=encode_changed_png, sync_state=sync_state)
+            sync_state.save()
 
     # Record the end time
     end_time = time.time()
@@ -294,7 +512,9 @@ def download_kgml(
         reload: bool = False,
         bad_requests_file: str = "bad_requests.txt",
         verbose: bool = True,
-        file_type='all'
+        file_type='all',
+        n_parallel: int = N_PARALLEL,
+        sync: bool = False
 ) -> None:
     """
         Downloads KGML files for given map IDs.
@@ -303,9 +523,14 @@ def download_kgml(
             map_ids (list of str): List of map IDs to download KGML files for.
             reload (bool, optional): Flag indicating whether to reload previously
             downloaded files. Defaults to False. bad_requests_file (str, optional):
-            File path to store IDs of maps that failed to download. Defaults to
-            "bad_requests.txt".verbose (bool, optional): Flag indicating whether
-            to print progress messages. Defaults to True.
+            Deprecated, see check_bad_requests. Bad requests are kept in
+            bad_requests.sqlite of the download directory. verbose (bool, optional):
+            Flag indicating whether to print progress messages. Defaults to True.
+            n_parallel (int, optional): Number of KGML files downloaded
+            simultaneously. Defaults to N_PARALLEL.
+            sync (bool, optional): Flag indicating whether to revalidate previously
+            downloaded files and only rewrite the changed ones, see sync_state.
+            Defaults to False.
         
         Returns:
         -------
@@ -314,12 +539,11 @@ def download_kgml(
         This function downloads KGML (KEGG Markup Language) files for the given
         map IDs. KGML files are XML representations of KEGG pathway maps. The
         function allows for reloading previously downloaded files if the 'reload'
-        flag is set to True. If a map fails to download, its ID is stored in the
-        'bad_requests_file' for reference.
+        flag is set to True. If a map fails to download, its ID is recorded in the
+        bad request store of the directory, see bad_requests.
         
         Example usage:
-        download_kgml(["map00010", "map00020"], reload=True,
-                      bad_requests_file="failed_maps.txt", verbose=True)
+        download_kgml(["map00010", "map00020"], reload=True, verbose=True)
         """
     # start_time = time.time()  # Record the start time
 
@@ -371,43 +595,29 @@ def download_kgml(
     rn_map_ids = check_bad_requests(list(set(rn_map_ids)), path / "rn", bad_requests_file, verbose,reload)
     org_map_ids = check_bad_requests(list(set(org_map_ids)), path / "orgs", bad_requests_file, verbose,reload)
 
+    # Existing files that are not current with the KEGG release are revalidated when syncing
+    sync_state = sync_kegg_release(verbose) if sync and not reload else None
     if not reload:
-        ko_map_ids = [map_id for map_id in ko_map_ids if not os.path.isfile(path / "ko" / f"{map_id}.xml")]
-        ec_map_ids = [map_id for map_id in ec_map_ids if not os.path.isfile(path / "ec" / f"{map_id}.xml")]
-        rn_map_ids = [map_id for map_id in rn_map_ids if not os.path.isfile(path / "rn" / f"{map_id}.xml")]
-        org_map_ids = [map_id for map_id in org_map_ids if not os.path.isfile(path / "orgs" / f"{map_id}.xml")]
+        ko_map_ids = [map_id for map_id in ko_map_ids if not _is_present(path / "ko" / f"{map_id}.xml", sync_state)]
+        ec_map_ids = [map_id for map_id in ec_map_ids if not _is_present(path / "ec" / f"{map_id}.xml", sync_state)]
+        rn_map_ids = [map_id for map_id in rn_map_ids if not _is_present(path / "rn" / f"{map_id}.xml", sync_state)]
+        org_map_ids = [map_id for map_id in org_map_ids if not _is_present(path / "orgs" / f"{map_id}.xml", sync_state)]
 
     files_to_download = ko_map_ids + ec_map_ids + rn_map_ids + org_map_ids
 
     print(f"Files to download: {files_to_download}")
 
-    for i in range(len(ko_map_ids)):
-        if verbose:
-            print(f'ko file {i + 1} of {len(ko_map_ids)}')
-
-        ko_url = f"http://rest.kegg.jp/get/{ko_map_ids[i]}/kgml"
-        download_data(ko_url, ko_map_ids[i], path / "ko")
-
-    for i in range(len(ec_map_ids)):
-        if verbose:
-            print(f'ec file {i + 1} of {len(ec_map_ids)}')
-
-        ec_url = f"http://rest.kegg.jp/get/{ec_map_ids[i]}/kgml"
-        download_data(ec_url, ec_map_ids[i], path / "ec")
-
-    for i in range(len(rn_map_ids)):
-        if verbose:
-            print(f'rn file {i + 1} of {len(rn_map_ids)}')
-
-        rn_url = f"http://rest.kegg.jp/get/{rn_map_ids[i]}/kgml"
-        download_data(rn_url, rn_map_ids[i], path / "rn")
-
-    for i in range(len(org_map_ids)):
-        if verbose:
-            print(f'organism file {i + 1} of {len(org_map_ids)}')
-
-        org_url = f"http://rest.kegg.jp/get/{org_map_ids[i]}/kgml"
-        download_data(org_url, org_map_ids[i], path / "orgs")
+    # Download the ko, ec, rn and organism files in one shared pool of workers
+    jobs = []
+    for sub_dir, sub_dir_map_ids in (("ko", ko_map_ids), ("ec", ec_map_ids),
+                                     ("rn", rn_map_ids), ("orgs", org_map_ids)):
+        for map_id in sub_dir_map_ids:
+            jobs.append((f"https://rest.kegg.jp/get/{map_id}/kgml", map_id, path / sub_dir))
+    if sync_state is None:
+        download_many(jobs, n_parallel, verbose)
+    else:
+        download_many(jobs, n_parallel, verbose, sync_state=sync_state)
+        sync_state.save()
 
     end_time = time.time()
     # Calculate the total time taken
@@ -419,45 +629,51 @@ def download_kgml(
 
 def check_bad_requests(args_list: list, path: Path | str, bad_requests_file: Path | str, verbose: bool, reload:bool) -> list:
     """
-    Checks if the arguments/files to be downloaded are in the bad_requests.txt
+    Checks if the arguments/files to be downloaded are recorded as bad requests
+    in the bad request store of the directory, see bad_requests.
     Args:
          args_list: List of arguments that indicate which files to download
-         bad_requests_file: Path to file that contains a list of non-existent files
+         path: The directory of the files
+         bad_requests_file: Deprecated. Bad requests are kept in bad_requests.sqlite
+                            of the directory, and a bad_requests.txt file of an
+                            earlier version is imported into it. Any other file
+                            name is ignored with a warning; the file is neither
+                            read nor changed. If empty, bad requests are not
+                            checked.
+         verbose: if True: print the bad requests
+         reload: if True: keep the bad requests, so they are downloaded again
     Returns:
          List of arguments to be downloaded
     """
-    if len(args_list) == 0:
-        return []
-    # Initialize an empty list bad_requests to hold all the bad queries.
-    bad_requests = []
-
-    # Check if the bad_requests_file exists and is a file.
-    if bad_requests_file and os.path.isfile(Path(path) / bad_requests_file):
-        with open(Path(path) / bad_requests_file, 'r') as file:
-            bad_requests = file.read().splitlines()
-
-    if bad_requests:
-
-        # Find the args  that are already noted as bad_requests
-        filtered_args = [args for args in args_list if args in bad_requests]
-        # Print the args that are noted as bad_requests
-        
-            
-        for args in filtered_args:
+    if bad_requests_file and bad_requests_file != LEGACY_BAD_REQUESTS_FILE:
+        warnings.warn(f"bad_requests_file is deprecated and ignored: bad requests are kept in "
+                      f"{BAD_REQUESTS_DB} of the download directory, and {bad_requests_file} is "
+                      f"neither read nor changed.", FutureWarning, stacklevel=3)
+        bad_requests_file = LEGACY_BAD_REQUESTS_FILE
+    if len(args_list) == 0 or not bad_requests_file:
+        return args_list
+    # Nothing to check if no request to the directory has failed so far
+    if not (os.path.isfile(Path(path) / BAD_REQUESTS_DB) or os.path.isfile(Path(path) / bad_requests_file)):
+        return args_list
+
+    # Look up all args in the index of the store at once; expired bad requests
+    # are not returned, so they are downloaded again
+    bad_requests = bad_request_store(path, bad_requests_file).lookup(args_list)
+    if not bad_requests:
+        return args_list
+
+    for args, bad_request in bad_requests.items():
+        if verbose:
             if not reload:
-                # Filter the args_list to include only files that are not in the list
-                # of bad requests.
-                args_list = [args for args in args_list if args not in bad_requests]
-                if verbose:
-                    print(f'{args} was previously identified as a bad request and will '
-                          f'therefore not be downloaded.')
+                print(f'{args} was previously identified as a bad request and will '
+                      f'therefore not be downloaded.')
             else:
-                if verbose:
-                    print(f'{args} was previously identified as a bad request. '
-                          f'Attempting to download again.')
-
-
-    return args_list
+                print(f'{args} was previously identified as a bad request. '
+                      f'Attempting to download again.')
+    if reload:
+        return args_list
+    # Filter the args_list to include only files that are not bad requests
+    return [args for args in args_list if args not in bad_requests]
 
 
 def check_input(map_ids: list):
@@ -1,10 +1,16 @@
 class Geometry:
+    # Geometries are created for every entry of every KGML file, so they are
+    # kept without __dict__
+    __slots__ = ('geometry_coords', 'geometry_shape')
+
     def __init__(self, geometry_coords: dict, geometry_shape: str):
         self.geometry_coords = geometry_coords
         self.geometry_shape = geometry_shape
 
 
 class Line(Geometry):
+    __slots__ = ()
+
     @classmethod
     def geometry_details(cls, data):
         # Convert the geometry string to a list of integers
@@ -25,6 +31,8 @@ class Line(Geometry):
 
 
 class Circle(Geometry):
+    __slots__ = ()
+
     @classmethod
     def geometry_details(cls, data):
         # Calculate the radius of the  and assign x and y coordinates to cs and cy
@@ -40,6 +48,8 @@ class Circle(Geometry):
 
 
 class Rectangle(Geometry):
+    __slots__ = ()
+
     @classmethod
     def geometry_details(cls, data):
 
@@ -82,3 +92,167 @@ def geometry_factory(data):
         return Rectangle.geometry_details(data)
     else:
         return None
+
+
+# The SVG shapes of the KGML graphics types
+GEOMETRY_SHAPES = {
+    'line': 'path',
+    'circle': 'circle',
+    'rectangle': 'rect',
+    'roundrectangle': 'rect'
+}
+
+
+class GeometryColumns:
+    """
+    The geometries of all entries of a KGML file, stored column-wise.
+
+    The <graphics> attributes of the entries are read in a single pass, and
+    the coordinates of all rectangles, circles and lines are computed per
+    graphics type rather than per entry. The dictionaries of SVG attributes
+    of a shape (and the path strings of lines) are only created when the
+    geometry of the shape is accessed, i.e. when the shape is serialized.
+
+    The geometries are identical to those created by geometry_factory.
+
+    Attributes:
+        types (list): The KGML graphics type of each entry.
+        shapes (list): The SVG shape of each entry, or None for unknown types.
+    """
+
+    def __init__(self, types: list, x: list, y: list, width: list, height: list, coords: list):
+        n = len(types)
+        self.types = list(types)
+        self.shapes = [GEOMETRY_SHAPES.get(graphics_type) for graphics_type in self.types]
+        # Rectangles keep their width and height as given in the KGML file
+        self.width = [None] * n
+        self.height = [None] * n
+        # Position of the shape: x and y of rectangles, cx and cy of circles
+        self.x = [None] * n
+        self.y = [None] * n
+        # Corner radius of rectangles, radius of circles
+        self.radius = [None] * n
+        # Points of lines as flat tuples of integers
+        self.points = [None] * n
+
+        rectangles = [i for i, shape in enumerate(self.shapes) if shape == 'rect']
+        circles = [i for i, shape in enumerate(self.shapes) if shape == 'circle']
+        lines = [i for i, shape in enumerate(self.shapes) if shape == 'path']
+
+        # Rectangles: move x and y from the center to the corner of the shape;
+        # round rectangles are shifted by one more unit (KGML specific issue)
+        for i, xi, yi, wi, hi in zip(rectangles,
+                                     _ints(x, rectangles), _ints(y, rectangles),
+                                     _ints(width, rectangles), _ints(height, rectangles)):
+            offset = 1 if self.types[i] == 'roundrectangle' else 0
+            self.x[i] = xi - wi / 2 + offset
+            self.y[i] = yi - hi / 2 + offset
+            self.radius[i] = 10 if offset else 0
+            self.width[i] = width[i]
+            self.height[i] = height[i]
+
+        # Circles: the radius is half the width
+        for i, xi, yi, wi in zip(circles, _ints(x, circles), _ints(y, circles), _ints(width, circles)):
+            self.x[i] = xi
+            self.y[i] = yi
+            self.radius[i] = wi / 2
+
+        # Lines: convert the coordinates to integers to catch errors
+        for i in lines:
+            points = tuple(int(c) for c in coords[i].split(','))
+            # Assert no. of coordinates are even
+            assert len(points) % 2 == 0, f'number of polygon coordinates must be even! {points} -> {points}'
+            self.points[i] = points
+
+    def __len__(self):
+        return len(self.types)
+
+    @classmethod
+    def from_entries(cls, entries):
+        """
+        Reads the <graphics> attributes of KGML entries in a single pass.
+
+        Args:
+            entries (list): The <entry> elements of a KGML file.
+
+        Returns:
+            GeometryColumns: The geometries of the entries.
+        """
+        types, x, y, width, height, coords = [], [], [], [], [], []
+        for entry in entries:
+            graphics = entry.find('graphics')
+            get = graphics.get
+            types.append(get('type'))
+            x.append(get('x'))
+            y.append(get('y'))
+            width.append(get('width'))
+            height.append(get('height'))
+            coords.append(get('coords'))
+        return cls(types, x, y, width, height, coords)
+
+    def geometry_coords(self, row: int):
+        """
+        Creates the SVG attributes of the shape of an entry.
+
+        Args:
+            row (int): The position of the entry.
+
+        Returns:
+            dict: The SVG attributes, or None if the graphics type is unknown.
+        """
+        shape = self.shapes[row]
+        if shape == 'rect':
+            return {
+                'x': self.x[row],
+                'y': self.y[row],
+                'height': self.height[row],
+                'width': self.width[row],
+                'rx': self.radius[row],
+                'ry': self.radius[row]
+            }
+        elif shape == 'circle':
+            return {
+                'r': self.radius[row],
+                'cx': self.x[row],
+                'cy': self.y[row]
+            }
+        elif shape == 'path':
+            # eg: (1, 2, 3, 4, 5, 6) => 'M 1,2 L 3,4 L 5,6'.
+            points = self.points[row]
+            return {'d': 'M ' + ' L '.join(f'{points[j]},{points[j + 1]}' for j in range(0, len(points), 2))}
+        else:
+            return None
+
+    def geometry(self, row: int):
+        """
+        Returns the geometry of an entry, or None if the graphics type is unknown.
+        """
+        if self.shapes[row] is None:
+            return None
+        return GeometryRow(self, row)
+
+
+class GeometryRow:
+    """
+    The geometry of a single entry of GeometryColumns. The SVG attributes are
+    created from the columns each time they are accessed, so a row only holds
+    a reference to the columns and its position.
+    """
+    __slots__ = ('_columns', '_row')
+
+    def __init__(self, columns: GeometryColumns, row: int):
+        self._columns = columns
+        self._row = row
+
+    @property
+    def geometry_coords(self):
+        return self._columns.geometry_coords(self._row)
+
+    @property
+    def geometry_shape(self):
+        return self._columns.shapes[self._row]
+
+
+def _ints(values: list, rows: list) -> list:
+    # Converts the values of the given rows to integers
+    return [int(values[i]) for i in rows]
@@ -41,9 +41,10 @@ class GeometryAnnotation():
             str: The description for the given annotation or an empty string if not found.
         """
 
-        if anno_name in annotations[anno_type]:
+        # Look the annotation up once; annotations may be a dict or an AnnotationLookup
+        result = annotations[anno_type].get(anno_name)
+        if result is not None:
             # Remove/replace problematic characters for svg
-            result = annotations[anno_type][anno_name]
             result = result.replace("'", "")
             result = result.replace("<->", "(1->4)")
             result = result.replace("<=>", "(1->4)")
@@ -0,0 +1,217 @@
+"""
+This module provides a small HTTP session with persistent (keep-alive)
+connections for downloading KEGG resources.
+
+Connections are pooled per host, so bulk downloads from rest.kegg.jp and
+www.genome.jp reuse their TCP/TLS connections instead of performing a new
+handshake for every file. Errors are reported with the exceptions of
+urllib.error, so callers can handle them exactly like urllib.request.urlopen.
+"""
+import os
+import threading
+import http.client
+import urllib.error
+from urllib.parse import urlsplit, urljoin
+
+# Maximum number of simultaneous connections (and therefore requests) to a single host
+MAX_CONNECTIONS_PER_HOST = 3
+# Timeout in seconds for connecting to and reading from a host
+TIMEOUT = 60
+# Maximum number of redirects followed for a single request
+MAX_REDIRECTS = 5
+
+# Errors raised when a kept-alive connection has been closed by the server
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                            ConnectionResetError, ConnectionAbortedError, BrokenPipeError)
+
+
+class HttpResponse:
+    """
+    A fully read HTTP response.
+
+    Attributes:
+        url (str): The URL that finally answered the request (after redirects).
+        status (int): The HTTP status code.
+        reason (str): The HTTP reason phrase.
+        headers (http.client.HTTPMessage): The response headers.
+        body (bytes): The response body.
+    """
+
+    def __init__(self, url, status, reason, headers, body):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+
+class HostConnectionPool:
+    """
+    A pool of keep-alive connections to a single host.
+
+    At most max_connections connections are in use at the same time; further
+    requests wait until a connection is released. Idle connections are reused
+    for the next request.
+    """
+
+    def __init__(self, scheme: str, netloc: str, max_connections: int, timeout: float):
+        self.scheme = scheme
+        self.netloc = netloc
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def _new_connection(self):
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(self.netloc, timeout=self.timeout)
+
+    def _acquire(self):
+        # Returns an idle connection if there is one, and whether it was reused
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._new_connection(), False
+
+    def _release(self, connection):
+        with self._lock:
+            self._idle.append(connection)
+
+    @staticmethod
+    def _send(connection, method, target, headers):
+        connection.request(method, target, headers=headers)
+        response = connection.getresponse()
+        body = response.read()
+        return response, body
+
+    def request(self, method: str, target: str, headers: dict) -> tuple:
+        """
+        Sends a request over a pooled connection.
+
+        Args:
+            method (str): The HTTP method.
+            target (str): The path and query of the request.
+            headers (dict): Additional request headers.
+
+        Returns:
+            tuple: The http.client.HTTPResponse and its fully read body.
+        """
+        with self._slots:
+            connection, reused = self._acquire()
+            try:
+                try:
+                    response, body = self._send(connection, method, target, headers)
+                except _STALE_CONNECTION_ERRORS:
+                    # The server closed the idle connection; retry once on a new one
+                    connection.close()
+                    if not reused:
+                        raise
+                    connection = self._new_connection()
+                    response, body = self._send(connection, method, target, headers)
+            except BaseException:
+                connection.close()
+                raise
+            # Keep the connection for the next request unless the server closes it
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(connection)
+        return response, body
+
+    def close(self):
+        """Closes all idle connections of the pool."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class HttpSession:
+    """
+    An HTTP client keeping one pool of persistent connections per host.
+
+    Methods:
+        fetch(url, headers=None): Sends a GET request and returns an HttpResponse.
+        get(url, headers=None): Sends a GET request and returns the response body.
+        close(): Closes all pooled connections.
+    """
+
+    def __init__(self, max_connections_per_host: int = None, timeout: float = None):
+        self._max_connections_per_host = max_connections_per_host
+        self._timeout = timeout
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, scheme: str, netloc: str) -> HostConnectionPool:
+        with self._lock:
+            if (scheme, netloc) not in self._pools:
+                max_connections = self._max_connections_per_host or MAX_CONNECTIONS_PER_HOST
+                timeout = self._timeout or TIMEOUT
+                self._pools[(scheme, netloc)] = HostConnectionPool(scheme, netloc, max_connections, timeout)
+            return self._pools[(scheme, netloc)]
+
+    def fetch(self, url: str, headers: dict = None) -> HttpResponse:
+        """
+        Sends a GET request, following redirects.
+
+        Args:
+            url (str): The URL to request.
+            headers (dict, optional): Additional request headers.
+
+        Returns:
+            HttpResponse: The response. Responses with status codes of 400 and
+            above are raised as urllib.error.HTTPError instead.
+
+        Raises:
+            urllib.error.HTTPError: If the server answers with an error status.
+            urllib.error.URLError: If the server cannot be reached.
+        """
+        headers = dict(headers or {})
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            if parts.scheme not in ('http', 'https'):
+                raise urllib.error.URLError(f'unsupported URL scheme: {parts.scheme}')
+            target = parts.path or '/'
+            if parts.query:
+                target = f'{target}?{parts.query}'
+            try:
+                response, body = self._pool(parts.scheme, parts.netloc).request('GET', target, headers)
+            except (OSError, http.client.HTTPException) as error:
+                raise urllib.error.URLError(error) from error
+
+            location = response.getheader('Location')
+            if response.status in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                continue
+            if response.status >= 400:
+                raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+            return HttpResponse(url, response.status, response.reason, response.headers, body)
+        raise urllib.error.URLError(f'too many redirects: {url}')
+
+    def get(self, url: str, headers: dict = None) -> bytes:
+        """
+        Sends a GET request and returns the body of the response.
+
+        See fetch for the handling of redirects and errors.
+        """
+        return self.fetch(url, headers).body
+
+    def close(self):
+        """Closes the idle connections of all pools and forgets the pools."""
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            pool.close()
+
+    def _reset(self):
+        # Sockets must not be shared with forked processes; start with empty pools
+        self._pools = {}
+        self._lock = threading.Lock()
+
+
+# Create a shared session instance, so all downloads of the process reuse the same connections.
+session = HttpSession()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=session._reset)
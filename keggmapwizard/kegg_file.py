@@ -1,6 +1,15 @@
+import os
+import json
 from pathlib import Path
 from xml.etree import ElementTree as ET
 
+# Suffix of the cache of the entries of a KGML file, stored next to the file.
+# The cache is JSON, so loading a cache file planted in a shared data directory
+# cannot execute code.
+ENTRY_CACHE_SUFFIX = '.entries.json'
+# Version of the cache format; caches of other versions are ignored
+ENTRY_CACHE_VERSION = 2
+
 
 class KgmlFile:
     def __init__(self, map_id, file_type, data_directory, reload=False):
@@ -10,6 +19,12 @@ class KgmlFile:
         self._in_memory = False
         self.map_id = map_id
         self._reload = reload
+        # Incremented on every reload, so users of the contents can tell that
+        # anything derived from them is outdated
+        self.version = 0
+        # The attributes of the <pathway> root, read once
+        self.__header = None
+        self._header_read = False
 
     @property
     def file_name(self):
@@ -29,6 +44,10 @@ class KgmlFile:
         else:
             return self.file_directory / f"{self.file_type}{self.map_id[-5:]}.xml"
 
+    @property
+    def entry_cache_path(self):
+        return self.file_path.with_name(self.file_path.stem + ENTRY_CACHE_SUFFIX)
+
     @property
     def file_contents(self):
         if not self._in_memory:
@@ -37,27 +56,37 @@ class KgmlFile:
             self._in_memory = True
         return self.__file_contents
 
+    @property
+    def header(self):
+        # The attributes of the <pathway> root (org, title, number, ...). They are
+        # taken from the contents if the file was read already, and otherwise read
+        # from the start of the file without parsing the entries.
+        if not self._header_read:
+            if self._in_memory:
+                self.__header = dict(self.__file_contents.items()) if self.__file_contents is not None else None
+            else:
+                self.__header = read_kgml_header(self.file_path)
+            self._header_read = True
+        return self.__header
+
     @property
     def organism(self):
-        if self.file_contents is not None:
-            root_info = dict(self.file_contents.items())
-            return root_info['org']
+        if self.header is not None:
+            return self.header['org']
         else:
             return None
 
     @property
     def title(self):
-        if self.file_contents is not None:
-            root_info = dict(self.file_contents.items())
-            return root_info['title']
+        if self.header is not None:
+            return self.header['title']
         else:
             return None
 
     @property
     def pathway_number(self):
-        if self.file_contents is not None:
-            root_info = dict(self.file_contents.items())
-            return root_info['number']
+        if self.header is not None:
+            return self.header['number']
         else:
             return None
 
@@ -70,6 +99,16 @@ class KgmlFile:
         else:
             return []
 
+    def reload(self):
+        """
+        Discards the parsed contents, so the file is read again on next access.
+        """
+        self.__file_contents = None
+        self._in_memory = False
+        self.__header = None
+        self._header_read = False
+        self.version += 1
+
     def __is_file_cached(self):
         if self._in_memory:
             return self.__file_contents
@@ -78,12 +117,145 @@ class KgmlFile:
         return self.__file_contents is not None
 
     def __read_file(self):
+        # Returns a <pathway> element holding the root attributes and the
+        # entries of the file, each with its first <graphics> element. The
+        # entries are read from the cache next to the file if it is current,
+        # and parsed from the file and cached otherwise.
         try:
-            # parse the XML file specified by xml_path
-            # retrieve the root element of the parsed XML tree
-            root = ET.parse(self.file_path).getroot()
-            # convert the attributes of the root element into key-value pairs
-            return root
+            stat = self.file_path.stat()
         except FileNotFoundError as error:
             print(f"File not found! {error}")
             return None
+        tree = None if self._reload else self.__read_cache(stat)
+        if tree is None:
+            try:
+                contents = parse_kgml(self.file_path)
+            except FileNotFoundError as error:
+                print(f"File not found! {error}")
+                return None
+            self.__write_cache(stat, contents)
+            tree = build_kgml_tree(*contents)
+        return tree
+
+    def __read_cache(self, stat):
+        # Returns the tree of the cached contents if they were cached from the
+        # current file; caches of another structure are ignored like corrupt ones
+        try:
+            with open(self.entry_cache_path, 'r') as file:
+                cache = json.load(file)
+            if (cache['version'], cache['mtime_ns'], cache['size']) != (ENTRY_CACHE_VERSION, stat.st_mtime_ns,
+                                                                        stat.st_size):
+                return None
+            root_attrib, entries = cache['root'], cache['entries']
+            if not (_is_attrib(root_attrib) and isinstance(entries, list) and
+                    all(len(entry) == 2 and _is_attrib(entry[0]) and (entry[1] is None or _is_attrib(entry[1]))
+                        for entry in entries)):
+                return None
+            return build_kgml_tree(root_attrib, entries)
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+
+    def __write_cache(self, stat, contents):
+        # Write to a temporary file first, so concurrent readers never see a partial cache
+        temp_path = self.entry_cache_path.with_name(f'{self.entry_cache_path.name}.{os.getpid()}.tmp')
+        try:
+            root_attrib, entries = contents
+            with open(temp_path, 'w') as file:
+                json.dump({'version': ENTRY_CACHE_VERSION, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                           'root': root_attrib, 'entries': entries}, file, separators=(',', ':'))
+            os.replace(temp_path, self.entry_cache_path)
+        except OSError:
+            # The cache is optional, e.g. the data directory may be read-only
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+def parse_kgml(file_path) -> tuple:
+    """
+    Stream-parses the root attributes and the entries of a KGML file.
+
+    Only the attributes of the <pathway> root, of the <entry> elements and of
+    their first <graphics> element are extracted. Elements are discarded as
+    soon as they are parsed, so <relation> and <reaction> elements are never
+    kept in memory.
+
+    Args:
+        file_path: The path of the KGML file.
+
+    Returns:
+        tuple: The root attributes (dict) and a list of tuples of the attributes
+        of every entry and of its graphics (a dict, or None if it has none).
+    """
+    root = None
+    root_attrib = {}
+    entries = []
+    entry_attrib = None
+    graphics_attrib = None
+    depth = 0
+    for event, element in ET.iterparse(file_path, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if root is None:
+                root = element
+                root_attrib = dict(element.attrib)
+            elif depth == 2 and element.tag == 'entry':
+                entry_attrib = dict(element.attrib)
+                graphics_attrib = None
+            elif depth == 3 and element.tag == 'graphics' and entry_attrib is not None and graphics_attrib is None:
+                graphics_attrib = dict(element.attrib)
+        else:
+            depth -= 1
+            if depth == 1:
+                if element.tag == 'entry':
+                    entries.append((entry_attrib, graphics_attrib))
+                    entry_attrib = None
+                # Discard the parsed child of the root
+                root.clear()
+    return root_attrib, entries
+
+
+def read_kgml_header(file_path):
+    """
+    Reads the attributes of the <pathway> root of a KGML file. Parsing stops at
+    the root element, so only the start of the file is read.
+
+    Args:
+        file_path: The path of the KGML file.
+
+    Returns:
+        dict: The attributes of the root, or None if the file does not exist.
+    """
+    try:
+        with open(file_path, 'rb') as file:
+            for _, element in ET.iterparse(file, events=('start',)):
+                return dict(element.attrib)
+    except FileNotFoundError as error:
+        print(f"File not found! {error}")
+    return None
+
+
+def _is_attrib(value) -> bool:
+    # Whether a cached value holds the attributes of an element
+    return isinstance(value, dict) and all(isinstance(key, str) and isinstance(item, str)
+                                           for key, item in value.items())
+
+
+def build_kgml_tree(root_attrib: dict, entries: list) -> ET.Element:
+    """
+    Builds a <pathway> element from the contents returned by parse_kgml.
+
+    Args:
+        root_attrib (dict): The attributes of the <pathway> root.
+        entries (list): The attributes of the entries and their graphics.
+
+    Returns:
+        ET.Element: The <pathway> element with one <entry> per entry.
+    """
+    root = ET.Element('pathway', root_attrib)
+    for entry_attrib, graphics_attrib in entries:
+        entry = ET.SubElement(root, 'entry', entry_attrib)
+        if graphics_attrib is not None:
+            ET.SubElement(entry, 'graphics', graphics_attrib)
+    return root
@@ -4,17 +4,29 @@ It includes classes and methods for downloading pathway data, processing it,
 and saving the pathway map in svg format.
 """
 import os
-from xml.etree import ElementTree as ET
 from pathlib import Path
 from keggmapwizard.config import config
 from keggmapwizard.download_data import (download_rest_data, download_base_png_maps,
                                          download_kgml, check_input, extract_all_map_ids,
-                                         check_map_prefix)
+                                         check_map_prefix, sync_kegg_release, is_resolved, N_PARALLEL)
 from keggmapwizard.pathway import Pathway
-from keggmapwizard.base_image import BaseImage
-from keggmapwizard.svg_content import create_svg_content
+from keggmapwizard.base_image import BaseImage, BASE_IMAGE_SUFFIX, migrate_json_base_image
+from keggmapwizard.resource_manifest import resource_manifest
+from keggmapwizard.svg_template import svg_templates
+from keggmapwizard.svg_writer import write_svg_files, embed_base_image
 from keggmapwizard.color_function_base import color_org
 
+# The files written by create_svg_map for each output format: plain SVG,
+# gzip-compressed SVG, or plain SVG together with a precompressed copy for
+# static file servers
+OUTPUT_FORMATS = {
+    'svg': ('.svg',),
+    'svgz': ('.svgz',),
+    'svg+gz': ('.svg', '.svg.gz')
+}
+# Directory of the shared base images, next to the SVG files referencing them
+SHARED_IMAGE_DIR = 'base_images'
+
 
 class KeggPathwayMap:
     """
@@ -30,6 +42,8 @@ class KeggPathwayMap:
         _pathway (object): The pathway data associated with the map (initialized to None).
         _image_data (object): The image data for the pathway (initialized to None).
         _organism (object): The organism associated with the pathway (initialized to None).
+        output_path (Path): The SVG file written by the last call of create_svg_map
+                            or write_svg_map (initialized to None).
             
     Methods:
         __init__(map_id, reload=False): Initializes a KeggPathwayMap instance with
@@ -41,6 +55,8 @@ class KeggPathwayMap:
         base_image: Retrieves the base image data for the pathway if it has not been initialized.
         create_svg_map(color_function=None, *args, path=None, output_name=None):
             Generates an SVG representation of the pathway map with optional color customization.
+        write_svg_map(color_function=None, *args, path=None, output_name=None):
+            Writes the SVG files of the pathway map like create_svg_map and returns the file path.
 
     Private Methods:
         __file_exists(): Checks if the necessary files for the pathway exist and
@@ -49,6 +65,7 @@ class KeggPathwayMap:
                         based on the map ID.
         __create_pathway(): Creates a pathway object based on the available file types.
         __base_image(): Retrieves the base image for the pathway from the specified path.
+        __write_svg_map(...): Writes the SVG files of create_svg_map and write_svg_map.
     """
    
     def __init__(self, map_id=None, reload=False):
@@ -60,6 +77,10 @@ class KeggPathwayMap:
         self._image_data = None
         self._organism = None
         self._reload = reload
+        self.output_path = None
+        if reload:
+            # Cached documents may hold annotations of the resources downloaded again
+            svg_templates.clear()
         self.__file_exists()
 
     @property
@@ -202,7 +223,9 @@ class KeggPathwayMap:
         it downloads the REST data associated with the organism.
         
         This method is responsible for ensuring that all required resources are available 
-        for the KEGG pathway map to function correctly.
+        for the KEGG pathway map to function correctly. Resources already verified 
+        in this process are recorded in the resource manifest and not checked again, 
+        so constructing maps whose resources are present does no file system I/O.
         
         Returns:
         -------
@@ -211,18 +234,25 @@ class KeggPathwayMap:
         args_list = ['pathway', 'br', 'md', 'ko', 'gn', 'compound', 'glycan', 'rn', 'rc',
                      'enzyme', 'ne', 'variant', 'ds', 'drug', 'dgroup']
         if self.map_id != '':
-            download_rest_data(args_list, self._reload)
-            download_kgml([self.map_id], self._reload)
-            download_base_png_maps([self.map_id], self._reload)
+            # Every resource is checked once per process when it is first needed,
+            # unless the resources are reloaded. Resources that could not be
+            # downloaded, e.g. because of a network error, are checked again.
+            resource_manifest.ensure('rest', args_list,
+                                     lambda args: download_rest_data(args, self._reload), self._reload,
+                                     lambda arg: _is_resource_resolved('rest', arg))
+            resource_manifest.ensure('kgml', [self.map_id],
+                                     lambda map_ids: download_kgml(map_ids, self._reload), self._reload,
+                                     lambda map_id: _is_resource_resolved('kgml', map_id))
+            resource_manifest.ensure('png', [self.map_id[-5:]],
+                                     lambda map_ids: download_base_png_maps(map_ids, self._reload),
+                                     self._reload, lambda map_id: _is_resource_resolved('png', map_id))
 
             if self.organism is not None:
                 separated_org_list = self.organism.split(':')
-                for org in separated_org_list:
-                    map_id = org + self.map_id[-5:]
-                    kgml_file_path = Path(config.working_dir) / "kgml_data" / 'orgs' / f"{map_id}.xml"
-                    if os.path.exists(kgml_file_path):
-                        rest_file = org
-                        download_rest_data([rest_file], self._reload)
+                # The organism property only lists organisms whose KGML file exists
+                resource_manifest.ensure('rest', separated_org_list,
+                                         lambda args: download_rest_data(args, self._reload),
+                                         self._reload, lambda arg: _is_resource_resolved('rest', arg))
 
     def __file_types(self):
         """
@@ -299,11 +329,11 @@ class KeggPathwayMap:
         """
         Retrieves the base image for the specified map ID.
     
-        This private method constructs the file path for a PNG image in JSON format 
-        based on the last five characters of the `map_id`. It checks if the image 
-        file exists at the constructed path. If the file is found, it creates and 
-        returns a `BaseImage` object using the `from_png` method, passing the 
-        `map_id` and the image path.
+        This private method constructs the file path of the base image file 
+        based on the last five characters of the `map_id`. If only a base image 
+        in the former JSON format exists, it is converted first. If the base 
+        image file is found, it creates and returns a `BaseImage` object using 
+        the `from_store` method, which only reads the dimensions of the image.
     
         If the image file does not exist, the method returns None.
     
@@ -312,21 +342,29 @@ class KeggPathwayMap:
             found and successfully created; otherwise, returns None.
         """
         base_image = None
-        image_path = Path(config.working_dir) / "maps_png" / f"map{self.map_id[-5:]}.json"
+        image_dir = Path(config.working_dir) / "maps_png"
+        image_path = image_dir / f"map{self.map_id[-5:]}{BASE_IMAGE_SUFFIX}"
+        json_path = image_dir / f"map{self.map_id[-5:]}.json"
+
+        if not os.path.exists(image_path) and os.path.exists(json_path):
+            migrate_json_base_image(json_path)
 
         if os.path.exists(image_path):
-            base_image = BaseImage.from_png(self.map_id, image_path)
+            base_image = BaseImage.from_store(self.map_id, image_path)
 
         return base_image
 
-    def create_svg_map(self, color_function=None,*args, path=None, output_name=None):
+    def create_svg_map(self, color_function=None,*args, path=None, output_name=None, output_format='svg',
+                       shared_image=False, image_url=None):
         """
         Creates an SVG representation of the KEGG pathway map and saves it to a specified location.
         
         This method generates an SVG map based on the current pathway and base image. If either 
         the base image or pathway is not available, it prints a message and returns None. 
-        The SVG content is created using the `create_svg_content` function, which takes the 
-        pathway, base image, and optional color function as parameters.
+        The SVG content is rendered from the uncolored template of the map, which is 
+        created once per process and cached in `svg_templates`, and colored by the 
+        optional color function. The result equals the SVG content created by the 
+        `create_svg_content` function.
         
         The method allows for customization of the output directory and file name:
         - If `path` is provided, the SVG will be saved in that directory. If the directory 
@@ -337,24 +375,70 @@ class KeggPathwayMap:
         Parameters:
         color_function (callable, optional): A function to determine the color scheme 
                                             for the SVG elements. Defaults to None.
-        *args: Additional positional arguments to be passed to the `create_svg_content` function.
+        *args: Additional positional arguments to be passed to the color function.
          path (str, optional): The directory path where the SVG file will be saved. 
                                If None, defaults to the predefined output directory.
         output_name (str, optional): The name of the output SVG file. If None, a unique default 
                                      name will be generated based on the organism and map ID.
+        output_format (str, optional): 'svg' (default) writes <name>.svg, 'svgz' writes the 
+                                       gzip-compressed <name>.svgz, and 'svg+gz' writes 
+                                       <name>.svg together with the precompressed <name>.svg.gz.
+        shared_image (bool, optional): If True, the base image is not embedded into the SVG. 
+                                       It is written once per map number to the content-hashed 
+                                       file base_images/map#####.<hash>.png in the output 
+                                       directory, which all SVGs of the map reference.
+        image_url (str, optional): The URL the shared base images are served from. If given, 
+                                   the SVG references <image_url>/map#####.<hash>.png instead 
+                                   of the relative path of the file. Implies shared_image.
         
         Returns:
         -------
         object: The SVG pathway object created. Returns None if the pathway or base image 
-                is not available.
+                is not available. Unless the base image is shared, it is embedded into 
+                the returned object, so serializing it gives the content of the file.
+        """
+        svg_pathway_object = self.__write_svg_map(color_function, *args, path=path, output_name=output_name,
+                                                  output_format=output_format, shared_image=shared_image,
+                                                  image_url=image_url)
+        if svg_pathway_object is not None:
+            # The image was streamed into the file; the returned object embeds it as well
+            embed_base_image(svg_pathway_object, self.base_image)
+        return svg_pathway_object
+
+    def write_svg_map(self, color_function=None, *args, path=None, output_name=None, output_format='svg',
+                      shared_image=False, image_url=None):
         """
+        Writes the SVG files of the KEGG pathway map like create_svg_map, without 
+        returning the SVG pathway object.
+        
+        The base image is streamed from its base image file into the written files and 
+        never held in memory encoded, so this is the cheaper method when only the files 
+        are needed, e.g. when rendering many maps.
         
+        Parameters:
+        Same as create_svg_map.
+        
+        Returns:
+        -------
+        Path: The written SVG file (the first one for output_format='svg+gz'). Returns 
+              None if the pathway or base image is not available.
+        """
+        svg_pathway_object = self.__write_svg_map(color_function, *args, path=path, output_name=output_name,
+                                                  output_format=output_format, shared_image=shared_image,
+                                                  image_url=image_url)
+        return None if svg_pathway_object is None else self.output_path
+
+    def __write_svg_map(self, color_function, *args, path, output_name, output_format, shared_image,
+                        image_url):
+        # Writes the SVG files of the map and returns the document, which does
+        # not embed the base image, or None if there is no pathway to create
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {output_format!r}, expected one of {list(OUTPUT_FORMATS)}")
+
         if self.base_image is None or self.pathway is None:
             print('No pathway to create')
             svg_pathway_object = None
         else:
-            svg_pathway_object = create_svg_content(self.pathway, self.base_image,
-                                                    color_function, *args)
             # Create directory for SVG outputs
             
             if path is None:
@@ -369,20 +453,56 @@ class KeggPathwayMap:
                         " the files will be stored in the default output directory:")
                     print(out_dir)
             os.makedirs(out_dir, exist_ok=True)
+
+            image_href = None
+            if shared_image or image_url is not None:
+                # The base image is written once per map number and referenced by
+                # all SVGs of the map instead of being embedded into each of them
+                png_path = self.base_image.write_shared_png(out_dir / SHARED_IMAGE_DIR)
+                if image_url is None:
+                    image_href = f"{SHARED_IMAGE_DIR}/{png_path.name}"
+                else:
+                    image_href = f"{image_url.rstrip('/')}/{png_path.name}"
+
+            # The uncolored document of the map is created once and colored copies
+            # of it are rendered. The base image is not embedded into the document
+            # but streamed into the file while writing it.
+            template = svg_templates.get(self.pathway, self.base_image, embed_image=False,
+                                         image_href=image_href)
+            svg_pathway_object = template.render(color_function, *args)
             if output_name is None:
-                file_path = out_dir / f"{self.pathway.org}{self.map_id[-5:]}.svg"
-            else:
-                file_path = out_dir / f"{output_name}.svg"
-            with open(file_path, 'wb') as file:
-                file.write(b'\n')
-                file.write(b'\n')
-                file.write(ET.tostring(svg_pathway_object))
-            print(f'wrote {file_path}')
+                output_name = f"{self.pathway.org}{self.map_id[-5:]}"
+            file_paths = [out_dir / f"{output_name}{suffix}" for suffix in OUTPUT_FORMATS[output_format]]
+            # The document is serialized once and compressed on the fly if needed
+            write_svg_files(svg_pathway_object, file_paths, self.base_image, prefix=b'\n\n')
+            file_path = file_paths[0]
+            self.output_path = file_path
+            print(f"wrote {', '.join(str(file_path) for file_path in file_paths)}")
 
         return svg_pathway_object
 
 
-def download_kegg_resources(map_ids: [str] = None, orgs: [str] = None, reload: bool = False):
+def _is_resource_resolved(kind: str, name: str) -> bool:
+    # Whether all files of a resource of the resource manifest exist or are
+    # recorded as bad requests: the REST file of a REST resource, the base
+    # image of a map number, or the reference KGML files of a map together
+    # with the organism specific KGML files of its prefixes
+    working_dir = Path(config.working_dir)
+    if kind == 'rest':
+        return is_resolved(working_dir / 'rest_data' / f'{name}.txt', name)
+    map_number = name[-5:]
+    if kind == 'png':
+        return is_resolved(working_dir / 'maps_png' / f'map{map_number}{BASE_IMAGE_SUFFIX}', map_number)
+    kgml_data = working_dir / 'kgml_data'
+    files = [(kgml_data / file_type / f'{file_type}{map_number}.xml', f'{file_type}{map_number}')
+             for file_type in ('ko', 'ec', 'rn')]
+    files += [(kgml_data / 'orgs' / f'{org}{map_number}.xml', f'{org}{map_number}')
+              for org in check_map_prefix(name[:-5])]
+    return all(is_resolved(file_path, arg) for file_path, arg in files)
+
+
+def download_kegg_resources(map_ids: [str] = None, orgs: [str] = None, reload: bool = False,
+                            n_parallel: int = N_PARALLEL, sync: bool = False):
     """
     Downloads various KEGG resources based on provided map IDs and organisms.
 
@@ -393,7 +513,18 @@ def download_kegg_resources(map_ids: [str] = None, orgs: [str] = None, reload: b
                                       be downloaded for each organism combined with map IDs.
         reload (bool, optional): If True, forces re-download of all resources even if 
                                  they are already present locally. Defaults to False.
+        n_parallel (int, optional): Number of files downloaded simultaneously.
+                                    Defaults to N_PARALLEL.
+        sync (bool, optional): If True, the resources already present are revalidated 
+                               unless they were validated against the current KEGG 
+                               release before, and only the changed files are 
+                               downloaded and processed again. Missing resources are 
+                               downloaded either way. Defaults to False.
     """
+    if sync and not reload:
+        # Request the current KEGG release; files validated against it are not revisited
+        sync_kegg_release(refresh=True)
+
     args_list = ['pathway', 'br', 'md', 'ko', 'gn', 'compound', 'glycan', 'rn', 'rc',
                  'enzyme', 'ne', 'variant', 'ds', 'drug', 'dgroup']
     # If nap_ids is not provided i.e. is None. use all available map ids in KEGG database.
@@ -413,6 +544,17 @@ def download_kegg_resources(map_ids: [str] = None, orgs: [str] = None, reload: b
                 processed_map_ids.append(org + map_id)
 
     # download the KEGG resources i.e., PNG maps, KGML files and REST data
-    download_base_png_maps(map_ids, reload=reload)
-    download_kgml(processed_map_ids, reload=reload)
-    download_rest_data(args_list, reload=reload)
+    download_base_png_maps(map_ids, reload=reload, n_parallel=n_parallel, sync=sync)
+    download_kgml(processed_map_ids, reload=reload, n_parallel=n_parallel, sync=sync)
+    download_rest_data(args_list, reload=reload, n_parallel=n_parallel, sync=sync)
+
+    # Maps constructed later in this process need not check these resources
+    # again, unless they could not be downloaded
+    def mark_resolved(kind, names):
+        resource_manifest.mark_verified(kind, [name for name in dict.fromkeys(names)
+                                               if _is_resource_resolved(kind, name)])
+
+    mark_resolved('png', [map_id[-5:] for map_id in map_ids])
+    # The reference KGML files are downloaded along with the organism specific ones
+    mark_resolved('kgml', [map_id[-5:] for map_id in map_ids] + processed_map_ids)
+    mark_resolved('rest', args_list)
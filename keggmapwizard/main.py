@@ -26,11 +26,14 @@ Usage:
 
 Example:
     python main.py download_kegg_resources --map_ids 520 --orgs hsa --reload True
+    python main.py download_kegg_resources --sync True
 """
 
 import fire
+from keggmapwizard.download_data import N_PARALLEL
 from keggmapwizard.kegg_pathway_map import download_kegg_resources
 from keggmapwizard.kegg_pathway_map import KeggPathwayMap
+from keggmapwizard.batch_render import render_maps
 
 
 class KeggCLI:
@@ -43,20 +46,25 @@ class KeggCLI:
     retrieval and visualization of KEGG data.
     
     Methods:
-        download_kegg_resources(map_ids, orgs=None, reload=False):
+        download_kegg_resources(map_ids, orgs=None, reload=False, n_parallel=N_PARALLEL, sync=False):
             Downloads KEGG resources for the specified map IDs and organisms.
-            The resources can be reloaded if specified.
+            The resources can be reloaded or incrementally synced if specified.
         
         create_svg_map(map_ids, orgs='', reload=False):
             Creates SVG pathway maps for the specified map IDs and organisms, 
             optionally reloading resources if specified.
+
+        render_maps(map_ids, orgs='', reload=False, n_processes=None):
+            Creates SVG pathway maps for all combinations of the specified map 
+            IDs and organisms in parallel worker processes.
     
     Usage:
         To use this class, instantiate it and call the desired methods with 
         appropriate parameters. The CLI can be run directly to interact with 
         KEGG resources via command line.
     """
-    def download_kegg_resources(self, map_ids = None, orgs = None,reload: bool = False):
+    def download_kegg_resources(self, map_ids = None, orgs = None,reload: bool = False,
+                                n_parallel: int = N_PARALLEL, sync: bool = False):
         """
         Downloads KEGG resources for the specified map IDs and organisms.
         
@@ -77,6 +85,14 @@ class KeggCLI:
             reload (bool, optional): A flag indicating whether to reload the 
             resources. If set to True, the method will download the resources 
             again, even if they already exist.
+
+            n_parallel (int, optional): The number of files downloaded 
+            simultaneously.
+
+            sync (bool, optional): A flag indicating whether to sync the 
+            resources already present with the current KEGG release. Only the 
+            files that changed since they were last validated are downloaded 
+            again.
         
         Returns:
             The result of the download operation, which include status messages 
@@ -91,7 +107,7 @@ class KeggCLI:
                     orgs = list(orgs)
                 else:
                     orgs=[orgs]
-        return download_kegg_resources(map_ids, orgs,reload)
+        return download_kegg_resources(map_ids, orgs,reload, n_parallel, sync=sync)
 
 
     def create_svg_map(self, map_ids, orgs='', reload=False):
@@ -144,7 +160,65 @@ class KeggCLI:
                 combined_id = f"{org}{map_id}"  # Concatenate map_id and org
 
                 pathway_map = KeggPathwayMap(map_id=combined_id, reload=reload)
-                pathway_map.create_svg_map()
+                pathway_map.write_svg_map()
+
+    def render_maps(self, map_ids, orgs='', reload=False, n_processes=None, path=None, output_format='svg',
+                    shared_image=False, image_url=None, verbose=False):
+        """
+        Creates SVG pathway maps for the specified map IDs and organisms in parallel.
+        
+        This method works like create_svg_map, but distributes the combinations 
+        of map IDs and organisms over a pool of worker processes. The required 
+        resources are downloaded once before rendering starts. The time taken 
+        and any failure are reported for every map.
+        
+        Parameters:
+            map_ids (list or str): A list of KEGG map IDs or a comma-separated 
+            string of map IDs for which SVG maps should be created.
+            
+            orgs (list, tuple, or str, optional): A list of organism identifiers 
+            to be included in the SVG maps. If not provided, the reference maps 
+            are created.
+        
+            reload (bool, optional): A flag indicating whether to download the 
+            resources again before creating the SVG maps.
+
+            n_processes (int, optional): The number of worker processes. Defaults 
+            to the number of CPUs.
+
+            path (str, optional): The directory in which the SVG_output directory 
+            is created. Defaults to the working directory.
+
+            output_format (str, optional): 'svg' (default), 'svgz' for 
+            gzip-compressed maps, or 'svg+gz' for plain maps together with 
+            precompressed .svg.gz copies.
+
+            shared_image (bool, optional): If True, the base image of every map 
+            number is written once to base_images/map#####.<hash>.png in the 
+            output directory and referenced by the SVGs instead of being 
+            embedded into each of them.
+
+            image_url (str, optional): The URL the shared base images are 
+            served from; implies shared_image.
+
+            verbose (bool, optional): If True, the progress messages of creating 
+            every map are printed as well, as by create_svg_map.
+        
+        Returns:
+            list: A RenderResult with the output file, time taken and error of 
+            every map.
+        """
+        if not isinstance(map_ids, list):
+            map_ids = [s.strip() for s in str(map_ids).split(',')]
+        if not isinstance(orgs, list):
+            if isinstance(orgs, tuple):
+                orgs = list(orgs)
+            else:
+                orgs = [s.strip() for s in str(orgs).split(',')]
+
+        return render_maps(map_ids, orgs, path=path, n_processes=n_processes, reload=reload,
+                           output_format=output_format, shared_image=shared_image, image_url=image_url,
+                           verbose_maps=verbose)
 
 def cli():
     """
@@ -165,9 +239,11 @@ def cli():
         python main.py download_kegg_resources --map_ids "['00400', '00440']" --orgs "['gma', 'mus']"
         python main.py download_kegg_resources --map_ids 00400,00430 --orgs hsa,mus --reload True
         python main.py download_kegg_resources --map_ids 430 --orgs mmu --reload True
+        python main.py download_kegg_resources --orgs hsa --n_parallel 8
         python main.py create_svg_map --map_ids "['00400', '00440']" --orgs "['gma', 'mus']"
         python main.py create_svg_map --map_ids 00400,00430 --orgs hsa,mus --reload True
         python main.py create_svg_map --map_ids 430 --orgs mmu --reload True
+        python main.py render_maps --map_ids 00010,00400,00430 --orgs hsa,mmu --n_processes 4
     """
     fire.Fire(KeggCLI)
 
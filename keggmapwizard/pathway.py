@@ -1,9 +1,12 @@
+import os
 from pathlib import Path
 from keggmapwizard.config import config
 from keggmapwizard.kegg_file import KgmlFile
-from keggmapwizard.pathway_component import PathwayComponent
+from keggmapwizard.pathway_component import PathwayComponent, write_inconsistent_kgml
+from keggmapwizard.geometry import GeometryColumns
 from keggmapwizard.geometry_annotation import GeometryAnnotation
 from keggmapwizard.annotation_settings import ANNOTATION_SETTINGS
+from keggmapwizard.annotation_index import annotation_cache
 
 
 class Pathway:
@@ -14,6 +17,14 @@ class Pathway:
         # Lazy-load containers
         self._kegg_files = None
         self._org_files = None
+        # Cached pathway components and the versions of the files they were built from
+        self._pathway_components = None
+        self._pathway_components_versions = None
+        # Versions of the REST files the cached components were annotated from
+        self._rest_file_versions = None
+        # Entry ids and geometries of the inconsistent KGML entries found while
+        # building the pathway components, by KGML file name
+        self.inconsistent_kgml = {}
 
     @property
     def kegg_files(self):
@@ -41,8 +52,69 @@ class Pathway:
 
     @property
     def pathway_components(self):
-        # Load pathway components separately if needed (placeholder call)
-        return self.__create_pathway_components()
+        # Build the pathway components once and share them until one of the
+        # underlying KGML files is reloaded. The annotations of the shared
+        # components are read-only; PathwayComponent.copy returns a component
+        # to change. Changed REST files are detected by rest_file_versions,
+        # which the template cache calls once per render.
+        versions = tuple(f.version for f in self.kegg_files + self.org_files)
+        if self._pathway_components is None or versions != self._pathway_components_versions:
+            self._rest_file_versions = self.__stat_rest_files()
+            components = self.__create_pathway_components()
+            for component in components:
+                component.freeze()
+            self._pathway_components = tuple(components)
+            self._pathway_components_versions = versions
+        return self._pathway_components
+
+    def rest_file_versions(self) -> tuple:
+        """
+        Returns the paths, modification times and sizes of the REST files of
+        the annotations, and drops the pathway components if one of the REST
+        files changed since they were built.
+
+        Returns:
+            tuple: A (path, mtime_ns, size) tuple per REST file, with None
+                   times and sizes for missing files.
+        """
+        versions = self.__stat_rest_files()
+        if versions != self._rest_file_versions:
+            self._pathway_components = None
+            self._rest_file_versions = versions
+        return versions
+
+    def __stat_rest_files(self):
+        # The modification times and sizes of the REST files of the annotations
+        versions = []
+        for rest_file in self.rest_files:
+            try:
+                stat = os.stat(rest_file)
+                versions.append((str(rest_file), stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                versions.append((str(rest_file), None, None))
+        return tuple(versions)
+
+    @property
+    def organisms(self):
+        # The organisms of the org files, or [None] for a reference map
+        if len(self.org_files) == 0:
+            return [None]
+        # Extract valid organism identifiers
+        return [file.organism for file in self.org_files if file.organism is not None]
+
+    @property
+    def rest_files(self):
+        # The REST files the pathway components are annotated from
+        rest_data = Path(config.working_dir) / 'rest_data'
+        sources = dict.fromkeys(source for sources in self.__rest_sources(self.organisms).values()
+                                for source in sources)
+        return [rest_data / f'{source}.txt' for source in sources]
+
+    def reload(self):
+        # Reload all KGML files; the pathway components are rebuilt on next access
+        for f in self.kegg_files + self.org_files:
+            f.reload()
+        self._pathway_components = None
 
     @property
     def title(self):
@@ -66,47 +138,48 @@ class Pathway:
         # Combine all KEGG and organism files into one list
         files = self.kegg_files + self.org_files
         # Determine the list of organisms based on org_files
-        organisms = []
-        if len(self.org_files) == 0:
-            organisms = [None]
-        else:
-            # Extract valid organism identifiers
-            for file in self.org_files:
-                if file.organism is not None:
-                    organisms.append(file.organism)
+        organisms = self.organisms
         # Initialize a dictionary to store merged pathway components    
         merged_data = {}
+        # The names of the annotations of each merged component by entry id, so
+        # merging stays linear in the number of files, e.g. of organisms
+        annotation_names = {}
+        # Inconsistent entries are collected per file and written after merging
+        inconsistent_kgml = {}
         # Iterate through each file and its entries
         for file in files:
-            for entry in file.entries:
-                graphics = entry.find('graphics')
+            entries = file.entries
+            # Read the graphics of all entries of the file at once
+            geometries = GeometryColumns.from_entries(entries)
+            conflicts = inconsistent_kgml.setdefault(file.file_name, [])
+            for row, entry in enumerate(entries):
                 entry_data = {
                     "id": entry.get('id'),
                     "name": [entry.get('name')],
-                    "type": [entry.get('type')],
-                    "graphics": {
-                        "type": graphics.get('type'),
-                        "x": graphics.get('x'),
-                        "y": graphics.get('y'),
-                        "height": graphics.get('height'),
-                        "width": graphics.get('width'),
-                        "coords": graphics.get('coords')
-                    }
+                    "type": [entry.get('type')]
                 }
                 # Create a PathwayComponent object using entry data
-                pathway_component = PathwayComponent(entry_data)
+                pathway_component = PathwayComponent(entry_data, geometries.geometry(row))
                 # Retrieve additional annotation data for this component
                 pathway_component.retrive_pathway_annotation_data()
                 # Check if an equivalent component already exists in merged_data
-                equivalent_pathway_component = pathway_component.is_equivalent(merged_data, file.file_name)
+                equivalent_pathway_component = pathway_component.is_equivalent(merged_data, file.file_name, conflicts)
                 # If a match is found, merge them and update the dictionary
                 if equivalent_pathway_component is not None:
-                    updated_pathway_component = pathway_component.merge_pathway_components(equivalent_pathway_component)
+                    updated_pathway_component = pathway_component.merge_pathway_components(
+                        equivalent_pathway_component, annotation_names[pathway_component.pathway_component_id])
                     merged_data.update(updated_pathway_component)
 
                 else:
                     # Otherwise, insert as a new unique component
                     merged_data.update({pathway_component.pathway_component_id: pathway_component})
+                    annotation_names[pathway_component.pathway_component_id] = {
+                        data['name'] for data in pathway_component.pathway_annotation_data}
+        # Report the inconsistent entries, writing one log file per KGML file
+        self.inconsistent_kgml = {file_name: conflicts for file_name, conflicts in inconsistent_kgml.items()
+                                  if conflicts}
+        for file_name, conflicts in self.inconsistent_kgml.items():
+            write_inconsistent_kgml(file_name, conflicts)
         # Initialize final list to hold fully annotated pathway components
         pathway_components = []
         
@@ -123,13 +196,11 @@ class Pathway:
         # Return the completed list of annotated pathway components
         return pathway_components
 
-    def __provide_annotations(self, organisms:[]):
-        # Dictionary to hold all annotation results
-        annotations = {}
+    def __rest_sources(self, organisms: list) -> dict:
+        # The names of the REST files of each annotation type
+        sources = {}
         # Iterate through each annotation type and its config settings
         for key, value in ANNOTATION_SETTINGS.items():
-            # Temporary dictionary to store annotations for this specific key
-            data_dict = {}
             # Get the REST file specifier from the annotation settings
             rest_file = value['rest_file']
             # If it's set to 'org', use the input organisms list instead
@@ -138,39 +209,15 @@ class Pathway:
             # Ensure rest_file is a list even if a single string is provided
             if isinstance(rest_file, str):
                 rest_file = [rest_file]
-
-            # Iterate through each rest file (i.e., organism or data source)
             # Skip empty strings
-            for rf in filter(None, rest_file): 
-
-                # Construct full path to the annotation file
-                file_path = Path(config.working_dir) / 'rest_data' / f"{rf}.txt"
-                try:
-                    # Open the file for reading
-                    with open(file_path, 'r') as file:
-                        # Read line by line
-                        for line in file:
-                            # Split line into fields
-                            data = line.strip().split('\t')
-                            key_anno = data[0]
-                            # If data has less than 2 fields, default values
-                            if len(data) < 2:
-                                value_anno = ""
-                            else:
-                                # Choose value based on the annotation type
-                                if key == 'Gene':
-                                    value_anno = data[3]
-                                else:
-                                    value_anno = data[1]
-                            # Save to current annotation dictionary
-                            data_dict[key_anno] = value_anno
-                # Handle missing file exceptions
-                except FileNotFoundError:
-                    print(f"File not found: {file_path}")
-                    # Insert empty default if file is missing
-                    data_dict[key] = ''
-                 # Update main annotations dictionary with the current annotation data
-                annotations.update({key: data_dict})
-
-        # Return full annotations dictionary
-        return annotations
\ No newline at end of file
+            sources[key] = list(filter(None, rest_file))
+        return sources
+
+    def __provide_annotations(self, organisms:[]):
+        # The REST files are looked up through the process-wide annotation cache,
+        # so annotations are shared between pathways and only the annotations
+        # of the entries in this pathway are loaded
+        rest_data = Path(config.working_dir) / 'rest_data'
+        # Map each annotation type to the annotations of its REST files
+        return {key: annotation_cache.lookup(rest_data, sources)
+                for key, sources in self.__rest_sources(organisms).items()}
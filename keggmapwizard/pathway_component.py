@@ -1,20 +1,63 @@
 import os
 from pathlib import Path
+from types import MappingProxyType
 from keggmapwizard.config import config
 from keggmapwizard.geometry import geometry_factory
 
 
 class PathwayComponent:
-    def __init__(self, entry: dict):
-        self.entry = entry
+    # Components of all maps may be held in memory at once, so they are kept
+    # without __dict__: the entry is reduced to its name and type and the
+    # geometry attributes are read from the geometry object on access
+    __slots__ = ('pathway_component_id', '_entry_name', '_entry_type', '__pc_entry_shape_object',
+                 'pathway_annotation_data')
+
+    def __init__(self, entry: dict, geometry=None):
+        # The geometry is created from the graphics of the entry, unless it is
+        # given, e.g. by the GeometryColumns of the KGML file of the entry
         self.pathway_component_id = entry['id']
-        self.__pc_entry_shape_object = geometry_factory(entry)
-        self.pathway_component_geometry = self.__pc_entry_shape_object.geometry_coords
-        self.pathway_component_geometry_shape = self.__pc_entry_shape_object.geometry_shape
+        self._entry_name = entry['name'][0]
+        self._entry_type = entry['type'][0]
+        if geometry is None and 'graphics' in entry:
+            geometry = geometry_factory(entry)
+        if geometry is None:
+            raise ValueError(f"Unknown graphics type of entry {entry['id']}")
+        self.__pc_entry_shape_object = geometry
+
+    @property
+    def entry(self):
+        # The id, name and type of the entry the component was created from
+        return {'id': self.pathway_component_id, 'name': [self._entry_name], 'type': [self._entry_type]}
+
+    @property
+    def pathway_component_geometry(self):
+        # The SVG attributes of the shape, created on access
+        return self.__pc_entry_shape_object.geometry_coords
+
+    @property
+    def pathway_component_geometry_shape(self):
+        return self.__pc_entry_shape_object.geometry_shape
+
+    def freeze(self):
+        # Makes the annotations read-only, so the component can be shared
+        # between renders without copying it: dicts become mappingproxies and
+        # lists tuples
+        self.pathway_annotation_data = _freeze(self.pathway_annotation_data)
+
+    def copy(self):
+        # A copy with its own, changeable annotations; the entry and the
+        # geometry are not changed after creation and are shared
+        component = PathwayComponent.__new__(PathwayComponent)
+        component.pathway_component_id = self.pathway_component_id
+        component._entry_name = self._entry_name
+        component._entry_type = self._entry_type
+        component.__pc_entry_shape_object = self.__pc_entry_shape_object
+        component.pathway_annotation_data = _thaw(self.pathway_annotation_data)
+        return component
 
     def retrive_pathway_annotation_data(self):
-        entry_name = self.entry['name']
-        entry_type = self.entry['type']
+        entry_name = [self._entry_name]
+        entry_type = [self._entry_type]
 
         if "map" in entry_type[0]:
             name = entry_name[0]
@@ -22,41 +65,102 @@ class PathwayComponent:
 
         self.pathway_annotation_data = [{'name': entry_name[0], 'type': entry_type[0]}]
 
-    def is_equivalent(self, existing_pcs, file_name):
+    def is_equivalent(self, existing_pcs, file_name, conflicts: list = None):
+        """
+        Returns the existing component with the id of this component, if any.
+
+        Components with the same id but a different geometry are inconsistent
+        KGML entries. Their id and geometry are added to conflicts, if given,
+        and written to the Inconsistent_KGML directory of the working directory
+        otherwise.
+
+        Args:
+            existing_pcs (dict): The existing components by entry id.
+            file_name (str): The name of the KGML file of this component.
+            conflicts (list, optional): Collects the entry id and geometry of
+                                        every inconsistent entry, in order.
+
+        Returns:
+            dict: The existing component by entry id, or None if there is none.
+        """
         entry_id = self.pathway_component_id
-        if entry_id in existing_pcs and existing_pcs[
-            entry_id].pathway_component_geometry == self.pathway_component_geometry:
-            return {entry_id: existing_pcs[entry_id]}
-        elif entry_id in existing_pcs and existing_pcs[
-            entry_id].pathway_component_geometry != self.pathway_component_geometry:
-            # Check if the directory already exists
-            dir_name = "Inconsistent_KGML"
-            if not os.path.exists(dir_name):
-                # Create the directory
-                os.makedirs(dir_name)
-            file_path = Path(config.working_dir) / dir_name / f'{file_name}.txt'
-
-            with open(file_path, 'a') as file:
-                file.write(f"{entry_id}: {self.pathway_component_geometry}\n")  # Corrected the write format
-
-            return {entry_id: existing_pcs[entry_id]}
-
-        else:
+        if entry_id not in existing_pcs:
             return None
+        geometry = self.pathway_component_geometry
+        if existing_pcs[entry_id].pathway_component_geometry != geometry:
+            if conflicts is not None:
+                conflicts.append((entry_id, geometry))
+            else:
+                write_inconsistent_kgml(file_name, [(entry_id, geometry)])
+        return {entry_id: existing_pcs[entry_id]}
 
-    def merge_pathway_components(self, equivalent_pathway_component):
-        entry_id = self.pathway_component_id
-        existing_data_annotations = equivalent_pathway_component[entry_id].pathway_annotation_data
+    def merge_pathway_components(self, equivalent_pathway_component, annotation_names: set = None):
+        """
+        Adds the annotation of this component to the equivalent component, unless
+        the equivalent component already has an annotation of the same name.
 
-        anotation_exists = False
-        for data in existing_data_annotations:
+        Args:
+            equivalent_pathway_component (dict): The equivalent component by entry id.
+            annotation_names (set, optional): The names of the annotations of the
+                equivalent component. It is updated with the added annotation, so
+                callers merging many components keep one set per component and
+                every merge takes constant time. By default the names are
+                collected from the annotations of the equivalent component.
 
-            if data["name"] == self.pathway_annotation_data[0]['name']:
-                anotation_exists = True
-                break
+        Returns:
+            dict: The equivalent component by entry id.
+        """
+        entry_id = self.pathway_component_id
+        existing_data_annotations = equivalent_pathway_component[entry_id].pathway_annotation_data
+        if annotation_names is None:
+            annotation_names = {data["name"] for data in existing_data_annotations}
 
-        if not anotation_exists:
-            existing_data_annotations.append(self.pathway_annotation_data[0])
+        annotation = self.pathway_annotation_data[0]
+        if annotation['name'] not in annotation_names:
+            existing_data_annotations.append(annotation)
+            annotation_names.add(annotation['name'])
             equivalent_pathway_component[entry_id].pathway_annotation_data = existing_data_annotations
 
         return equivalent_pathway_component
+
+
+def _freeze(value):
+    # A read-only copy of annotations: mappingproxies of tuples of mappingproxies
+    if isinstance(value, (dict, MappingProxyType)):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    # A changeable copy of frozen annotations: dicts of lists of dicts
+    if isinstance(value, (dict, MappingProxyType)):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_thaw(item) for item in value]
+    return value
+
+
+def write_inconsistent_kgml(file_name: str, conflicts: list) -> Path:
+    """
+    Appends the geometries of inconsistent KGML entries to
+    <working_dir>/Inconsistent_KGML/<file_name>.txt, one line per entry.
+
+    Args:
+        file_name (str): The name of the KGML file of the entries.
+        conflicts (list): The entry id and geometry of every entry.
+
+    Returns:
+        Path: The path of the file.
+    """
+    dir_path = Path(config.working_dir) / "Inconsistent_KGML"
+    # Create the directory if it does not exist yet
+    if not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+    file_path = dir_path / f'{file_name}.txt'
+
+    # Write all entries at once
+    with open(file_path, 'a') as file:
+        file.write(''.join(f"{entry_id}: {geometry}\n" for entry_id, geometry in conflicts))
+    return file_path
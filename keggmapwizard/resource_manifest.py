@@ -0,0 +1,92 @@
+"""
+This module provides a process-wide manifest of the KEGG resources that have
+already been verified, i.e. found on disk, downloaded or identified as not
+existing. Resources that could not be downloaded for other reasons, e.g. a
+network error or a temporary server error, are not verified, so they are
+checked again when next needed.
+
+Checking whether the resources of a map are present looks up bad requests and
+stats every required file. The manifest lets every resource be checked once per
+process, when it is first needed, so constructing further maps that use the
+same resources does not touch the file system at all.
+"""
+import threading
+from keggmapwizard.config import config
+
+
+class ResourceManifest:
+    """
+    A process-wide record of verified resources.
+
+    Resources are identified by their kind (e.g. 'rest', 'kgml', 'png') and
+    name (e.g. 'ko', 'hsa00010', '00010') within the current working directory.
+
+    Methods:
+        ensure(kind, names, check, reload=False): Verifies the resources that
+            have not been verified yet in this process.
+        is_verified(kind, name): Checks whether a resource has been verified.
+        mark_verified(kind, names): Records resources verified elsewhere.
+        discard(kind, name): Forgets a resource, so it is checked again.
+        clear(): Forgets all resources.
+    """
+
+    def __init__(self):
+        self._verified = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(kind: str, name: str) -> tuple:
+        return config.working_dir, kind, name
+
+    def is_verified(self, kind: str, name: str) -> bool:
+        """Checks whether a resource has been verified in this process."""
+        return self._key(kind, name) in self._verified
+
+    def ensure(self, kind: str, names: list, check, reload: bool = False, resolved=None) -> list:
+        """
+        Verifies resources that have not been verified yet in this process.
+
+        Args:
+            kind (str): The kind of the resources, e.g. 'rest'.
+            names (list): The names of the resources, e.g. ['ko', 'compound'].
+            check (callable): Called with the list of resources to verify. It
+                              downloads the resources that are missing.
+            reload (bool): If True, all resources are passed to check, whether
+                           they have been verified or not.
+            resolved (callable, optional): Called with the name of a resource
+                              after check, returns whether the resource is
+                              present or known to be unavailable. Only these
+                              resources are recorded as verified, so a download
+                              that failed, e.g. because of a network error, is
+                              tried again when the resource is next needed. If
+                              None, all resources passed to check are recorded.
+
+        Returns:
+            list: The names of the resources passed to check.
+        """
+        names = list(dict.fromkeys(names))
+        if not reload:
+            names = [name for name in names if not self.is_verified(kind, name)]
+        if names:
+            check(names)
+            self.mark_verified(kind, [name for name in names if resolved is None or resolved(name)])
+        return names
+
+    def mark_verified(self, kind: str, names: list) -> None:
+        """Records resources that were verified elsewhere, e.g. by a bulk download."""
+        with self._lock:
+            self._verified.update(self._key(kind, name) for name in names)
+
+    def discard(self, kind: str, name: str) -> None:
+        """Forgets a resource, e.g. after its file was deleted."""
+        with self._lock:
+            self._verified.discard(self._key(kind, name))
+
+    def clear(self) -> None:
+        """Forgets all resources, so they are checked again when next needed."""
+        with self._lock:
+            self._verified.clear()
+
+
+# Create a process-wide manifest instance, shared by all maps of the process.
+resource_manifest = ResourceManifest()
@@ -0,0 +1,290 @@
+"""
+This module provides a per-shape index of the annotations of the SVG documents
+created by create_svg_content.
+
+create_svg_content writes the title lines and data annotations of every shape
+into its <title> and <desc> elements as text. Instead of parsing this text
+back, color functions look the annotations up in the ShapeIndex that
+create_svg_content keeps on the document it returns.
+"""
+import ast
+from urllib.parse import unquote
+from xml.etree import ElementTree as ET
+
+
+class ShapeEntry:
+    """
+    The annotations of a single shape of an SVG document.
+
+    Attributes:
+        shape_id (str): The ID of the shape.
+        element (ET.Element): The shape element.
+        titles (list): The title lines of the shape, as shown in its <title> element.
+        annotations (list): The data annotations of the shape, i.e. dictionaries
+                            with the type, name and description of an annotation.
+        position (int): The position of the shape in the document.
+    """
+
+    def __init__(self, shape_id: str, element: ET.Element, titles: list, annotations: list,
+                 position: int = 0):
+        self.shape_id = shape_id
+        self.element = element
+        self.titles = list(titles)
+        self.annotations = list(annotations)
+        self.position = position
+
+    def identifiers(self):
+        """
+        Yields the identifiers of the annotations of the shape.
+
+        Every annotation is identified by its name, e.g. 'K00844', 'EC:2.7.1.1'
+        or 'hsa:3098'. Names with a database prefix other than an organism,
+        e.g. 'EC:2.7.1.1', are identified without the prefix as well.
+
+        Yields:
+            tuple: The identifier and the position of the title line of the
+            annotation, or None if the annotation has no title line.
+        """
+        # The title lines are created along with the annotations, one per annotation
+        aligned = len(self.titles) == len(self.annotations)
+        for i, details in enumerate(self.annotations):
+            if not isinstance(details, dict) or not details.get('name'):
+                continue
+            name = details['name']
+            if aligned:
+                title_position = i
+            else:
+                title_position = next((j for j, item in enumerate(self.titles) if item.startswith(name)), None)
+            yield name, title_position
+            if ':' in name and details.get('type') != 'Gene':
+                yield name.split(':', 1)[1], title_position
+
+    def __repr__(self):
+        return f'<ShapeEntry: {self.shape_id} - {self.titles}>'
+
+    def set_titles(self, titles: list) -> None:
+        """
+        Replaces the title lines of the shape and writes them to its <title> element.
+
+        Args:
+            titles (list): The new title lines.
+        """
+        self.titles = list(titles)
+        title_element = _find_child(self.element, 'title')
+        if title_element is not None:
+            title_element.text = str(self.titles)
+
+
+class ShapeIndex:
+    """
+    An index of the shapes of an SVG document and their annotations, in
+    document order, with an inverted index from annotation identifiers to
+    the shapes annotated with them.
+
+    Methods:
+        add(element, titles, annotations): Adds a shape to the index.
+        get(shape_id): Returns the entry of a shape.
+        lookup(identifier): Returns the shapes annotated with an identifier.
+        match(identifiers): Returns the shapes annotated with any of the identifiers.
+        from_document(doc): Builds the index of a document from the text of
+                            its <title> and <desc> elements.
+    """
+
+    def __init__(self):
+        self._entries = []
+        # Shape ids and identifiers refer to the positions of the entries, so
+        # copies of the index can share them
+        self._by_shape_id = {}
+        self._by_identifier = {}
+        self._shared = False
+        # The index and the shape elements a copy creates its entries from
+        self._source = None
+        self._elements = None
+
+    def __iter__(self):
+        return (self._entry(position) for position in range(len(self._entries)))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _entry(self, position: int) -> ShapeEntry:
+        # Returns the entry at a position. The entries of a copy are created
+        # from the entries of its source when they are first needed.
+        entry = self._entries[position]
+        if entry is None:
+            source = self._source._entry(position)
+            entry = ShapeEntry(source.shape_id, self._elements[position], source.titles, source.annotations,
+                               position)
+            self._entries[position] = entry
+        return entry
+
+    def add(self, element: ET.Element, titles: list, annotations: list) -> ShapeEntry:
+        """
+        Adds a shape to the index.
+
+        Args:
+            element (ET.Element): The shape element.
+            titles (list): The title lines of the shape.
+            annotations (list): The data annotations of the shape.
+
+        Returns:
+            ShapeEntry: The entry of the shape.
+        """
+        if self._shared:
+            # Stop sharing the lookups with the copies of the index
+            self._by_shape_id = dict(self._by_shape_id)
+            self._by_identifier = {identifier: list(matches) for identifier, matches in self._by_identifier.items()}
+            self._shared = False
+        position = len(self._entries)
+        entry = ShapeEntry(element.get('shape_id'), element, titles, annotations, position)
+        self._entries.append(entry)
+        self._by_shape_id.setdefault(entry.shape_id, position)
+        for identifier, title_position in entry.identifiers():
+            self._by_identifier.setdefault(identifier, []).append((position, title_position))
+        return entry
+
+    def get(self, shape_id: str):
+        """Returns the entry of a shape, or None if there is no such shape."""
+        position = self._by_shape_id.get(shape_id)
+        return None if position is None else self._entry(position)
+
+    def lookup(self, identifier: str) -> list:
+        """
+        Returns the shapes annotated with an identifier. Identifiers are matched
+        exactly, so 'K0001' does not match 'K00012'.
+
+        Args:
+            identifier (str): The identifier, e.g. 'K00844' or 'hsa:3098'.
+
+        Returns:
+            list: Tuples of the entry of a shape and the position of the title
+            line of the annotation (None if there is none).
+        """
+        return [(self._entry(position), title_position)
+                for position, title_position in self._by_identifier.get(identifier, ())]
+
+    def match(self, identifiers) -> dict:
+        """
+        Returns the shapes annotated with any of the identifiers.
+
+        The cost depends on the number of identifiers and matching shapes
+        only, not on the number of shapes of the document.
+
+        Args:
+            identifiers: The identifiers to match exactly.
+
+        Returns:
+            dict: The positions of the matching title lines (a set) by entry,
+            in document order.
+        """
+        matches = {}
+        for identifier in identifiers:
+            for position, title_position in self._by_identifier.get(identifier, ()):
+                title_positions = matches.setdefault(position, set())
+                if title_position is not None:
+                    title_positions.add(title_position)
+        return {self._entry(position): matches[position] for position in sorted(matches)}
+
+    def copy(self, elements) -> 'ShapeIndex':
+        """
+        Returns a copy of the index for a copy of its document.
+
+        The copy shares the lookups of the index; its entries are created when
+        they are first accessed. Copying therefore takes constant time per shape.
+
+        Args:
+            elements: The shape elements of the copied document, in document order.
+
+        Returns:
+            ShapeIndex: The index with the same entries, referencing the given elements.
+        """
+        index = ShapeIndex()
+        index._elements = list(elements)
+        index._entries = [None] * len(self._entries)
+        index._source = self
+        index._by_shape_id = self._by_shape_id
+        index._by_identifier = self._by_identifier
+        index._shared = self._shared = True
+        return index
+
+    @classmethod
+    def from_document(cls, doc: ET.Element):
+        """
+        Builds the index of a document that does not carry one, e.g. a document
+        read from an SVG file, from the text of its <title> and <desc> elements.
+
+        The text is parsed as Python literals only; it is never evaluated.
+
+        Args:
+            doc (ET.Element): The SVG document.
+
+        Returns:
+            ShapeIndex: The index of the shapes of the document.
+        """
+        index = cls()
+        # Documents parsed from a file carry the SVG namespace in their tags
+        group = next((element for element in doc.iter() if _local_name(element) == 'g'), None)
+        if group is None:
+            return index
+        for element in group:
+            title_element = _find_child(element, 'title')
+            desc_element = _find_child(element, 'desc')
+            titles = _literal(title_element.text if title_element is not None else None)
+            annotations = _literal(desc_element.text if desc_element is not None else None)
+            annotations = [dict(details, description=unquote(details['description']))
+                           if isinstance(details, dict) and 'description' in details else details
+                           for details in annotations]
+            index.add(element, titles, annotations)
+        return index
+
+
+def _local_name(element: ET.Element) -> str:
+    # Returns the tag of an element without namespace
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def _find_child(element: ET.Element, name: str):
+    # Returns the first child with the given tag, ignoring namespaces
+    return next((child for child in element if _local_name(child) == name), None)
+
+
+def _literal(text) -> list:
+    # Parses the text of a <title> or <desc> element into a list
+    if not text:
+        return []
+    try:
+        value = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return [text]
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+class SvgDocument(ET.Element):
+    """
+    The root element of an SVG document created by create_svg_content, carrying
+    the ShapeIndex of its shapes.
+    """
+
+    def __init__(self, tag, attrib={}, **extra):
+        super().__init__(tag, attrib, **extra)
+        self.shape_index = ShapeIndex()
+
+
+def get_shape_index(doc: ET.Element) -> ShapeIndex:
+    """
+    Returns the ShapeIndex of an SVG document.
+
+    Documents created by create_svg_content carry their index. For other
+    documents the index is built from the text of the <title> and <desc>
+    elements of their shapes.
+
+    Args:
+        doc (ET.Element): The SVG document.
+
+    Returns:
+        ShapeIndex: The index of the shapes of the document.
+    """
+    shape_index = getattr(doc, 'shape_index', None)
+    if shape_index is None:
+        shape_index = ShapeIndex.from_document(doc)
+    return shape_index
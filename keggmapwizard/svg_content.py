@@ -1,5 +1,7 @@
 from xml.etree import ElementTree as ET
 from urllib.parse import quote
+from keggmapwizard.svg_writer import IMAGE_HREF_PREFIX
+from keggmapwizard.shape_index import SvgDocument
 
 # Define variables to be used later
 FILL_COLOR = "transparent"
@@ -14,7 +16,7 @@ def _create_namespace(base_image, title):
     # baseprofile, and xmlns attributes
 
     svg_tag = 'kegg-svg-' + base_image.map_id[-5:]
-    doc = ET.Element('svg', title=f"{title}", id=f"{svg_tag}", width=f"{str(int(base_image.image_width))}",
+    doc = SvgDocument('svg', title=f"{title}", id=f"{svg_tag}", width=f"{str(int(base_image.image_width))}",
                      height=f"{base_image.image_height}", version='1.1',
                      baseprofile=f"{BASE_PROFILE}",
                      xmlns="http://www.w3.org/2000/svg")
@@ -32,7 +34,20 @@ def _create_namespace(base_image, title):
     return doc
 
 
-def create_svg_content(pathway, base_image, color_function, *args):
+def create_svg_content(pathway, base_image, color_function, *args, embed_image=True, image_href=None):
+    # If embed_image is False, the image element only references the base image
+    # with an empty data URI. The document must then be serialized with
+    # svg_writer.iter_svg or write_svg, which stream the image into it.
+    # If image_href is given, the image element references it instead, e.g. a
+    # shared PNG file written by BaseImage.write_shared_png, and no image is
+    # embedded at all.
+    doc = create_svg_template(pathway, base_image, embed_image=embed_image, image_href=image_href)
+    return apply_color_function(doc, base_image, color_function, *args)
+
+
+def create_svg_template(pathway, base_image, embed_image=True, image_href=None):
+    # Creates the uncolored document: the shapes, the base image pattern and the
+    # empty shape-color-defs element. apply_color_function completes it.
     # Assign the value of fill_color to the variable fill
     pathway_components = pathway.pathway_components
     
@@ -45,21 +60,19 @@ def create_svg_content(pathway, base_image, color_function, *args):
 
     # Iterate over each item in the data list
     for item in pathway_components:
-        # Iterate over each details in the 'data_annotation' list of the current item
-        for details in item.pathway_annotation_data['data_annotation']:
-            # Check if the 'description' key exists in the details dictionary
-            if "description" in details:
-                # If it exists, quote the value of the 'description' key and assign
-                # it back to the same key
-                details['description'] = quote(details['description'])
-        # Get the value of the 'visualizatin_class' key from the current item and
-        # assign it to the visualization_class variable
-        visualization_class = item.pathway_annotation_data['visualizatin_class']
-        # Insert the string 'shape' at the beginning of the visualization_class list
-        visualization_class.insert(0, 'shape')
-        # # Join the elements of the visualization_class list with a space and
-        # assign the result back to the visualization_class variable
-        visualization_class = ' '.join(visualization_class)
+        # The annotations of the pathway components are read-only and shared
+        # between renders, so the document gets its own copies of them
+        titles = item.pathway_annotation_data['title']
+        if isinstance(titles, tuple):
+            titles = list(titles)
+        annotations = [dict(details) for details in item.pathway_annotation_data['data_annotation']]
+        # Quote the descriptions of the 'data_annotation' list of the current item
+        data_annotation = [dict(details, description=quote(details['description']))
+                           if "description" in details else details
+                           for details in annotations]
+        # Prefix the 'visualizatin_class' list of the current item with the string
+        # 'shape' and join the elements with a space
+        visualization_class = ' '.join(['shape', *item.pathway_annotation_data['visualizatin_class']])
 
         # Create an XML subelement with the tag specified by the value of the 'shape' key
         # from the current item, and set the 'shape_id', 'stroke', 'fill', and 'style'
@@ -83,13 +96,17 @@ def create_svg_content(pathway, base_image, color_function, *args):
         # Set the text content of the desc element to the value of the 'data_annotation'
         # key from the current item
         desc = ET.SubElement(shape_event, 'desc')
-        desc.text = f"{item.pathway_annotation_data['data_annotation']}"
+        desc.text = f"{data_annotation}"
 
         # add a title element to the shape_event
         # Set the text content of the title element to the value of the 'title'
         # key from the current item
         title = ET.SubElement(shape_event, 'title')
-        title.text = f"{item.pathway_annotation_data['title']}"
+        title.text = f"{titles}"
+
+        # Index the title lines and annotations of the shape, so color functions
+        # can look them up instead of parsing the text of the title element
+        doc.shape_index.add(shape_event, titles, annotations)
 
     # append the group element to the doc XML element
     doc.append(group)
@@ -108,8 +125,11 @@ def create_svg_content(pathway, base_image, color_function, *args):
     # create the image element within the pattern element
     image = ET.SubElement(pattern, 'image')
     # Set the 'xlink:href' attribute of the image element using the value of
-    # the image_data variable
-    image.set('xlink:href', f'data:image/png;base64,{base_image.image}')
+    # the image_data variable, or the reference to the shared image file
+    if image_href is not None:
+        image.set('xlink:href', image_href)
+    else:
+        image.set('xlink:href', f'{IMAGE_HREF_PREFIX}{base_image.image}' if embed_image else IMAGE_HREF_PREFIX)
     # Set the 'width' and 'height' attribute of the image element using the value of the
     # width and height variable
     image.set('width', base_image.image_width)
@@ -123,7 +143,12 @@ def create_svg_content(pathway, base_image, color_function, *args):
     defs = ET.Element('defs', id="shape-color-defs")
     # Append the defs element to the doc XML element
     doc.append(defs)
+    return doc
+
 
+def apply_color_function(doc, base_image, color_function, *args):
+    # Colors a document created by create_svg_template with the color function
+    # and adds the base image rectangle and the legend of the colors
     #  # Check if the color_function parameter is not None
     colors = None
     if color_function is not None:
@@ -170,7 +195,8 @@ def define_legend(colors, base_image, doc, color_func):
     y_coord_rect = 20
     filtered_colors = [color for color in colors if color != 'white']
 
-    filtered_colors = list(set(filtered_colors))
+    # Remove duplicate colors, keeping the order of the query sets for the labels
+    filtered_colors = list(dict.fromkeys(filtered_colors))
     if len(filtered_colors) == 1:
         inner_rect2 = ET.Element('rect',
                                  x=str(int(base_image.image_width) + 10),
@@ -0,0 +1,175 @@
+"""
+This module provides a cache of uncolored SVG documents of pathway maps, so a
+map colored many times, e.g. once per sample, is only created once.
+
+An SvgTemplate holds the uncolored document created by create_svg_template,
+with its group of shapes pre-serialized. Every render parses a new copy of the
+shapes from the serialized group, which is several times faster than creating
+them from the pathway components, and applies the color function to the copy.
+
+The module-level svg_templates cache keeps the templates of the most recently
+rendered maps of a process. A template is created again when one of the files
+it was created from changes, including the REST files of its annotations.
+"""
+import copy
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from xml.etree import ElementTree as ET
+from keggmapwizard.config import config
+from keggmapwizard.shape_index import SvgDocument
+from keggmapwizard.svg_content import create_svg_template, apply_color_function
+
+# Maximum number of templates kept in the process-wide template cache
+MAX_CACHED_TEMPLATES = 16
+
+
+class SvgTemplate:
+    """
+    The uncolored SVG document of a pathway map.
+
+    Attributes:
+        base_image (BaseImage): The base image of the map.
+        embed_image (bool): Whether the document embeds the base image.
+        image_href (str): The reference to the shared base image file, if the
+                          document does not embed the image.
+
+    Methods:
+        copy(): Returns a new uncolored document.
+        render(color_function=None, *args): Returns a new document colored by
+                                            the color function.
+    """
+
+    def __init__(self, pathway, base_image, embed_image=True, image_href=None):
+        self.base_image = base_image
+        self.embed_image = embed_image
+        self.image_href = image_href
+        doc = create_svg_template(pathway, base_image, embed_image=embed_image, image_href=image_href)
+        self._root_tag = doc.tag
+        self._root_attrib = dict(doc.attrib)
+        self._shape_index = doc.shape_index
+        # The group of shapes makes up nearly all of the document and holds no
+        # namespaced attributes, so it can be serialized and parsed again. The
+        # few other elements are copied.
+        self._children = list(doc)
+        self._group_position = next(i for i, child in enumerate(self._children) if child.tag == 'g')
+        self._group = ET.tostring(self._children[self._group_position])
+
+    def copy(self) -> SvgDocument:
+        """
+        Returns a new uncolored document, equal to the document created by
+        create_svg_template, with its own shape index.
+
+        Returns:
+            SvgDocument: The uncolored document.
+        """
+        doc = SvgDocument(self._root_tag, self._root_attrib)
+        for i, child in enumerate(self._children):
+            if i == self._group_position:
+                group = ET.fromstring(self._group)
+                group.tail = child.tail
+                doc.append(group)
+                doc.shape_index = self._shape_index.copy(group)
+            else:
+                doc.append(copy.deepcopy(child))
+        return doc
+
+    def render(self, color_function=None, *args) -> SvgDocument:
+        """
+        Returns a new document colored by the color function, equal to the
+        document created by create_svg_content.
+
+        Args:
+            color_function (callable, optional): The color function.
+            *args: Additional arguments of the color function.
+
+        Returns:
+            SvgDocument: The colored document.
+        """
+        return apply_color_function(self.copy(), self.base_image, color_function, *args)
+
+
+def _file_versions(pathway, base_image) -> tuple:
+    # The modification times and sizes of the files a template is created from:
+    # the KGML files, the REST files of the annotations and the base image
+    paths = [f.file_path for f in pathway.kegg_files + pathway.org_files]
+    if getattr(base_image, 'image_path', None) is not None:
+        paths.append(base_image.image_path)
+    versions = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            versions.append((str(path), stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            versions.append((str(path), None, None))
+    # Checking the REST files also drops the pathway components annotated
+    # from outdated REST files
+    return tuple(versions) + pathway.rest_file_versions()
+
+
+class TemplateCache:
+    """
+    A process-wide cache of the SvgTemplates of pathway maps.
+
+    Templates are keyed by the working directory, the map id and the KGML files
+    of the pathway, and are created again when one of their KGML files, the
+    REST files their titles and descriptions are taken from, or their base
+    image file changed. The least recently used template is evicted first when
+    more than max_templates templates are cached.
+
+    Methods:
+        get(pathway, base_image, embed_image=True, image_href=None): Returns
+            the template of a pathway map.
+        clear(): Drops all cached templates.
+    """
+
+    def __init__(self, max_templates: int = MAX_CACHED_TEMPLATES):
+        self.max_templates = max_templates
+        self._templates = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._templates)
+
+    def get(self, pathway, base_image, embed_image=True, image_href=None) -> SvgTemplate:
+        """
+        Returns the template of a pathway map, creating it if it is not cached
+        or outdated.
+
+        Args:
+            pathway (Pathway): The pathway of the map.
+            base_image (BaseImage): The base image of the map.
+            embed_image (bool): Whether the documents embed the base image.
+            image_href (str, optional): The reference to the shared base image
+                                        file, see create_svg_template.
+
+        Returns:
+            SvgTemplate: The template of the map.
+        """
+        files = pathway.kegg_files + pathway.org_files
+        key = (str(Path(config.working_dir)), pathway.map_id, tuple(f.file_name for f in files), embed_image,
+               image_href)
+        versions = _file_versions(pathway, base_image)
+        with self._lock:
+            cached = self._templates.get(key)
+            if cached is not None and cached[0] == versions:
+                self._templates.move_to_end(key)
+                return cached[1]
+
+        template = SvgTemplate(pathway, base_image, embed_image=embed_image, image_href=image_href)
+        with self._lock:
+            self._templates[key] = (versions, template)
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+        return template
+
+    def clear(self) -> None:
+        """Drops all cached templates."""
+        with self._lock:
+            self._templates.clear()
+
+
+# Create a process-wide cache instance, shared by all maps of the process.
+svg_templates = TemplateCache()
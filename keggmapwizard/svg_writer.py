@@ -0,0 +1,202 @@
+"""
+This module provides a streaming serializer for the SVG documents created by
+create_svg_content.
+
+Instead of materializing the whole document with ET.tostring, the document is
+serialized element by element and the base image is encoded chunk by chunk
+straight from its base image file. The root, its groups (e.g. the group of
+shapes) and its definitions are written as start tag, children one at a time
+and end tag, so only a single shape or definition is serialized at a time. The
+output is byte-identical to ET.tostring of a document with the image embedded.
+Besides the element tree itself, the memory used does not grow with the size
+of the map: neither the encoded image, nor the serialized group of shapes,
+nor the serialized document is held in memory as a whole.
+
+iter_svg yields the document as chunks of bytes, which can be written to a file
+handle (write_svg) or returned as the body of a WSGI response. write_svg_files
+writes the chunks to several files at once and gzip-compresses them on the fly
+for files named *.svgz or *.gz. embed_base_image embeds the image into the
+document itself, for callers that need the complete document as an element.
+"""
+import gzip
+from contextlib import ExitStack
+from xml.etree import ElementTree as ET
+
+# Prefix of the href of the base image. An image element whose href is just
+# this prefix references the base image without embedding it.
+IMAGE_HREF_PREFIX = 'data:image/png;base64,'
+# Placeholder of the image payload while the image element is serialized
+_PAYLOAD_PLACEHOLDER = '__KMW_BASE_IMAGE_PAYLOAD__'
+# Serialized elements are joined into chunks of at least this number of bytes
+CHUNK_SIZE = 64 * 1024
+# Elements whose children are serialized one at a time: the root, the groups
+# of shapes and the definitions, e.g. of gradients
+_STREAMED_TAGS = ('svg', 'g', 'defs')
+# Files with these suffixes are written gzip-compressed
+COMPRESSED_SUFFIXES = ('.svgz', '.gz')
+
+
+def _find_image_path(doc: ET.Element) -> list:
+    # Returns the elements from the root down to the image element referencing
+    # the base image, or an empty list if the document embeds no such image
+    def search(element, path):
+        path.append(element)
+        if element.tag == 'image' and element.get('xlink:href') == IMAGE_HREF_PREFIX:
+            return True
+        for child in element:
+            if search(child, path):
+                return True
+        path.pop()
+        return False
+
+    path = []
+    search(doc, path)
+    return path
+
+
+def _split_element(element: ET.Element) -> tuple:
+    # Serializes an element without its children and returns the start tag
+    # including the text, and the end tag including the tail
+    shallow = ET.Element(element.tag, element.attrib)
+    shallow.text = element.text
+    end_tag = f'</{element.tag}>'.encode()
+    serialized = ET.tostring(shallow, short_empty_elements=False)
+    tail = b''
+    if element.tail:
+        # The tail is escaped like the text of an element
+        tail_element = ET.Element('tail')
+        tail_element.text = element.tail
+        tail = ET.tostring(tail_element)[len(b'<tail>'):-len(b'</tail>')]
+    return serialized[:-len(end_tag)], end_tag + tail
+
+
+def _iter_image(image: ET.Element, base_image):
+    # Serializes the image element with the placeholder as payload and streams
+    # the encoded base image in its place
+    placeholder = ET.Element(image.tag, image.attrib)
+    placeholder.set('xlink:href', IMAGE_HREF_PREFIX + _PAYLOAD_PLACEHOLDER)
+    placeholder.text = image.text
+    placeholder.tail = image.tail
+    for child in image:
+        placeholder.append(child)
+    before, after = ET.tostring(placeholder).split(_PAYLOAD_PLACEHOLDER.encode(), 1)
+    yield before
+    for chunk in base_image.iter_base64():
+        yield chunk.encode()
+    yield after
+
+
+def _iter_elements(element: ET.Element, image_path: list, base_image):
+    # Yields the serialized element. The elements on the path to the image and
+    # the containers of many children are split up, so their children are
+    # serialized one at a time; all other subtrees, e.g. a single shape, are
+    # small and serialized as a whole.
+    on_image_path = bool(image_path) and element is image_path[0]
+    if on_image_path and len(image_path) == 1:
+        yield from _iter_image(element, base_image)
+    elif on_image_path or (element.tag in _STREAMED_TAGS and len(element) > 0):
+        start_tag, end_tag = _split_element(element)
+        yield start_tag
+        child_path = image_path[1:] if on_image_path else []
+        for child in element:
+            yield from _iter_elements(child, child_path if child_path and child is child_path[0] else [],
+                                      base_image)
+        yield end_tag
+    else:
+        yield ET.tostring(element)
+
+
+def iter_svg(doc: ET.Element, base_image=None, chunk_size: int = CHUNK_SIZE):
+    """
+    Serializes an SVG document chunk by chunk.
+
+    Args:
+        doc (ET.Element): The SVG document created by create_svg_content.
+        base_image (BaseImage, optional): The base image to embed into the image
+                                          element of a document created with
+                                          embed_image=False. If None, the
+                                          document is serialized as it is.
+        chunk_size (int): Small elements are joined into chunks of at least
+                          this number of bytes.
+
+    Yields:
+        bytes: Consecutive chunks of the serialized document. Joined, they are
+        equal to ET.tostring of the document with the image embedded.
+    """
+    image_path = _find_image_path(doc) if base_image is not None else []
+    buffer = []
+    size = 0
+    for piece in _iter_elements(doc, image_path, base_image):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def embed_base_image(doc: ET.Element, base_image) -> ET.Element:
+    """
+    Embeds the base image into the image element of a document created with
+    embed_image=False, so ET.tostring of the document includes the image.
+    Documents referencing a shared base image file are not changed.
+
+    Args:
+        doc (ET.Element): The SVG document created by create_svg_content.
+        base_image (BaseImage): The base image to embed.
+
+    Returns:
+        ET.Element: The document.
+    """
+    image_path = _find_image_path(doc)
+    if image_path:
+        image_path[-1].set('xlink:href', IMAGE_HREF_PREFIX + ''.join(base_image.iter_base64()))
+    return doc
+
+
+def write_svg(doc: ET.Element, file, base_image=None) -> None:
+    """
+    Writes an SVG document to a binary file handle without serializing it in memory.
+
+    Args:
+        doc (ET.Element): The SVG document created by create_svg_content.
+        file: A file object opened in binary mode.
+        base_image (BaseImage, optional): The base image to embed, see iter_svg.
+    """
+    for chunk in iter_svg(doc, base_image):
+        file.write(chunk)
+
+
+def write_svg_files(doc: ET.Element, paths: list, base_image=None, prefix: bytes = b'',
+                    compresslevel: int = 9) -> None:
+    """
+    Writes an SVG document to several files while serializing it once.
+
+    Files named *.svgz or *.gz are gzip-compressed as the chunks are written,
+    so neither the serialized nor the compressed document is held in memory.
+    The gzip header holds neither file name nor timestamp, so the compressed files only change
+    when the document changes.
+
+    Args:
+        doc (ET.Element): The SVG document created by create_svg_content.
+        paths (list): The paths of the files to write.
+        base_image (BaseImage, optional): The base image to embed, see iter_svg.
+        prefix (bytes): Bytes written before the document.
+        compresslevel (int): The gzip compression level of compressed files.
+    """
+    with ExitStack() as stack:
+        files = []
+        for path in paths:
+            file = stack.enter_context(open(path, 'wb'))
+            if str(path).endswith(COMPRESSED_SUFFIXES):
+                # No file name and timestamp in the gzip header
+                file = stack.enter_context(gzip.GzipFile(filename='', fileobj=file, mode='wb',
+                                                         compresslevel=compresslevel, mtime=0))
+            files.append(file)
+        for file in files:
+            file.write(prefix)
+        for chunk in iter_svg(doc, base_image):
+            for file in files:
+                file.write(chunk)
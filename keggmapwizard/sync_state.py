@@ -0,0 +1,220 @@
+"""
+This module records the state of the local KEGG data for incremental syncs:
+the current KEGG release and, for every downloaded file, the release it was
+last validated against and the validators of the response it was written from
+(ETag, Last-Modified and the SHA-256 of the content).
+
+With download_kegg_resources(sync=True), a downloaded file is only revisited
+if it was not validated against the current KEGG release yet. It is then
+requested with If-None-Match/If-Modified-Since headers, and is not rewritten if
+its content did not change. Its modification time, and with it the caches keyed
+by it (KGML entry caches, SVG templates, the annotation index), stay valid.
+
+The state of a working directory is kept in <working_dir>/sync_state.json and
+loaded once per process by load_sync_state.
+"""
+import os
+import re
+import json
+import hashlib
+import threading
+from pathlib import Path
+
+SYNC_STATE_FILE = 'sync_state.json'
+# Version of the state file format; files of other versions are ignored
+SYNC_STATE_VERSION = 1
+# The REST endpoint reporting the current KEGG release
+KEGG_INFO_URL = 'https://rest.kegg.jp/info/kegg'
+# Number of bytes hashed at a time when hashing files on disk
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def parse_kegg_release(info: str):
+    """
+    Extracts the KEGG release from the response of the info endpoint.
+
+    Args:
+        info (str): The text returned by https://rest.kegg.jp/info/kegg, with a
+                    line like 'kegg  Release 112.0+/10-17, Oct 24'.
+
+    Returns:
+        str: The release, e.g. '112.0+/10-17', or None if it is not found.
+    """
+    match = re.search(r'Release\s+([^\s,]+)', info)
+    return match.group(1) if match else None
+
+
+def file_digest(file_path) -> str:
+    """Returns the SHA-256 of the content of a file as a hex string."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        while chunk := file.read(_HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SyncState:
+    """
+    The KEGG release and the validators of the downloaded files of a working
+    directory.
+
+    Files are identified by their path relative to the working directory, e.g.
+    'kgml_data/ko/ko00010.xml'. The state is held in memory and written to the
+    state file by save, which the download functions call once after their
+    downloads.
+
+    Attributes:
+        path (Path): The state file.
+        release (str): The most recent KEGG release requested, or None.
+        release_checked (bool): Whether the release was requested in this process.
+
+    Methods:
+        is_current(file_path): Whether a file was validated against the release.
+        conditional_headers(file_path): The request headers to revalidate a file.
+        is_unchanged(file_path, digest): Whether the downloaded content equals
+            the file on disk.
+        record(file_path, headers, digest): Records the validators of a file.
+        save(): Writes the state file.
+    """
+
+    def __init__(self, working_dir):
+        self.working_dir = Path(working_dir)
+        self.path = self.working_dir / SYNC_STATE_FILE
+        self.release = None
+        self.release_checked = False
+        self._files = {}
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, 'r') as file:
+                state = json.load(file)
+            if state.get('version') == SYNC_STATE_VERSION:
+                self.release = state.get('release')
+                self._files = state.get('files', {})
+        except (OSError, ValueError):
+            # No state yet, or an unreadable one: every file is revalidated
+            pass
+
+    def __len__(self):
+        return len(self._files)
+
+    def _key(self, file_path) -> str:
+        file_path = Path(file_path)
+        try:
+            return file_path.relative_to(self.working_dir).as_posix()
+        except ValueError:
+            return file_path.as_posix()
+
+    def validators(self, file_path) -> dict:
+        """Returns the recorded validators of a file, or an empty dict."""
+        with self._lock:
+            return dict(self._files.get(self._key(file_path), {}))
+
+    def is_current(self, file_path) -> bool:
+        """
+        Checks whether a file exists and was downloaded or validated against
+        the current release, so it need not be revalidated.
+        """
+        return (self.release is not None and os.path.isfile(file_path)
+                and self.validators(file_path).get('release') == self.release)
+
+    def conditional_headers(self, file_path) -> dict:
+        """
+        Returns the request headers that let the server answer 304 Not
+        Modified if the file did not change. Headers are only sent for files
+        that still exist.
+
+        Args:
+            file_path: The path of the downloaded file.
+
+        Returns:
+            dict: The If-None-Match and If-Modified-Since headers, if known.
+        """
+        if not os.path.isfile(file_path):
+            return {}
+        validators = self.validators(file_path)
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    def is_unchanged(self, file_path, digest: str) -> bool:
+        """
+        Checks whether downloaded content equals the file on disk.
+
+        The recorded digest is used if there is one; files downloaded before
+        syncing was used are hashed.
+
+        Args:
+            file_path: The path of the downloaded file.
+            digest (str): The SHA-256 of the downloaded content.
+
+        Returns:
+            bool: True if the file exists and has the same content.
+        """
+        if not os.path.isfile(file_path):
+            return False
+        recorded = self.validators(file_path).get('sha256')
+        if recorded is None:
+            recorded = file_digest(file_path)
+        return recorded == digest
+
+    def record(self, file_path, headers=None, digest: str = None) -> None:
+        """
+        Records the validators of a downloaded or revalidated file, and that
+        it is current with the release.
+
+        Args:
+            file_path: The path of the file.
+            headers: The response headers, holding ETag and Last-Modified.
+            digest (str, optional): The SHA-256 of the content. If None, the
+                                    recorded digest is kept.
+        """
+        key = self._key(file_path)
+        with self._lock:
+            validators = self._files.setdefault(key, {})
+            if headers is not None:
+                for name, header in (('etag', 'ETag'), ('last_modified', 'Last-Modified')):
+                    if headers.get(header):
+                        validators[name] = headers.get(header)
+            if digest is not None:
+                validators['sha256'] = digest
+            if self.release is not None:
+                validators['release'] = self.release
+
+    def save(self) -> None:
+        """
+        Writes the state file. It is written to a temporary file first and
+        then moved into place, so readers never see a partially written state.
+        """
+        with self._lock:
+            state = {'version': SYNC_STATE_VERSION, 'release': self.release, 'files': self._files}
+            os.makedirs(self.working_dir, exist_ok=True)
+            temp_path = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+            with open(temp_path, 'w') as file:
+                json.dump(state, file, indent=0, sort_keys=True)
+            os.replace(temp_path, self.path)
+
+
+# The loaded states of this process, by working directory
+_sync_states = {}
+_sync_states_lock = threading.Lock()
+
+
+def load_sync_state(working_dir) -> SyncState:
+    """
+    Returns the sync state of a working directory, reading the state file the
+    first time it is needed in this process.
+
+    Args:
+        working_dir: The working directory.
+
+    Returns:
+        SyncState: The state shared by all downloads of the process.
+    """
+    with _sync_states_lock:
+        key = str(Path(working_dir))
+        if key not in _sync_states:
+            _sync_states[key] = SyncState(working_dir)
+        return _sync_states[key]
@@ -0,0 +1,165 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from keggmapwizard.annotation_index import (AnnotationIndex, AnnotationLookup, AnnotationCache,
+                                            ChainedAnnotationLookup, parse_rest_line, INDEX_FILE_NAME)
+
+
+class TestParseRestLine(unittest.TestCase):
+
+    def test_reference_line(self):
+        self.assertEqual(parse_rest_line("K00001\tE1.1.1.1, adh; alcohol dehydrogenase\n", 1),
+                         ("K00001", "E1.1.1.1, adh; alcohol dehydrogenase"))
+
+    def test_gene_line(self):
+        self.assertEqual(parse_rest_line("hsa:10\tCDS\t8:18391..18401\tNAT2; N-acetyltransferase 2\n", 3),
+                         ("hsa:10", "NAT2; N-acetyltransferase 2"))
+
+    def test_short_line(self):
+        self.assertEqual(parse_rest_line("C00001\n", 1), ("C00001", ""))
+        self.assertEqual(parse_rest_line("hsa:10\tCDS\n", 3), ("hsa:10", ""))
+
+
+class TestAnnotationIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.write('ko', "K00001\tadh; alcohol dehydrogenase\nK00002\tAKR1A1; aldehyde reductase\n")
+        self.write('hsa', "hsa:10\tCDS\t8:1..2\tNAT2; N-acetyltransferase 2\n")
+        self.index = AnnotationIndex(self.directory)
+
+    def tearDown(self):
+        self.index.close()
+        for file in self.directory.glob("*"):
+            file.unlink()
+        self.directory.rmdir()
+
+    def write(self, source, text, mtime=None):
+        path = self.directory / f'{source}.txt'
+        with open(path, 'w') as file:
+            file.write(text)
+        if mtime is not None:
+            os.utime(path, ns=(mtime, mtime))
+
+    def test_update_indexes_all_rest_files(self):
+        self.write('bad_requests', "xyz\n")
+        self.assertEqual(sorted(self.index.update()), ['hsa', 'ko'])
+        self.assertTrue((self.directory / INDEX_FILE_NAME).exists())
+        # Unchanged files are not indexed again
+        self.assertEqual(self.index.update(), [])
+
+    def test_lookup(self):
+        ko = self.index.lookup(['ko'])
+        self.assertIsInstance(ko, AnnotationLookup)
+        self.assertIn('K00001', ko)
+        self.assertEqual(ko['K00002'], 'AKR1A1; aldehyde reductase')
+        self.assertNotIn('K0000', ko)
+        self.assertEqual(ko.get('K99999', ''), '')
+        with self.assertRaises(KeyError):
+            ko['K99999']
+
+    def test_gene_description_column(self):
+        genes = self.index.lookup(['hsa'])
+        self.assertEqual(genes['hsa:10'], 'NAT2; N-acetyltransferase 2')
+
+    def test_changed_file_is_reindexed(self):
+        self.index.update()
+        self.write('ko', "K00003\thom; homoserine dehydrogenase\n", mtime=10 ** 18)
+        self.assertEqual(self.index.update(), ['ko'])
+        ko = self.index.lookup(['ko'])
+        self.assertNotIn('K00001', ko)
+        self.assertIn('K00003', ko)
+
+    def test_index_shared_between_instances(self):
+        self.index.update()
+        other = AnnotationIndex(self.directory)
+        with patch('builtins.open', side_effect=AssertionError('REST file must not be parsed again')):
+            self.assertEqual(other.lookup(['ko'])['K00001'], 'adh; alcohol dehydrogenase')
+        other.close()
+
+    def test_missing_source(self):
+        with patch('builtins.print') as mock_print:
+            lookup = self.index.lookup(['ko', 'eco'])
+        mock_print.assert_called_once()
+        self.assertEqual(lookup.sources, ['ko'])
+
+    def test_last_source_wins(self):
+        self.write('eco', "K00001\tx\tx\tfrom eco\n")
+        lookup = self.index.lookup(['ko', 'eco'])
+        self.assertEqual(lookup['K00001'], 'from eco')
+        self.assertEqual(lookup['K00002'], 'AKR1A1; aldehyde reductase')
+
+###############################################################################
+
+class TestAnnotationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.write('ko', "K00001\tadh; alcohol dehydrogenase\n")
+        for org in ('hsa', 'mmu', 'eco'):
+            self.write(org, f"{org}:1\tCDS\t1..2\t{org} gene\n")
+        self.cache = AnnotationCache(max_organisms=2)
+
+    def tearDown(self):
+        self.cache.clear()
+        for file in self.directory.glob("*"):
+            file.unlink()
+        self.directory.rmdir()
+
+    def write(self, source, text, mtime=None):
+        path = self.directory / f'{source}.txt'
+        with open(path, 'w') as file:
+            file.write(text)
+        if mtime is not None:
+            os.utime(path, ns=(mtime, mtime))
+
+    def test_rest_file_parsed_once(self):
+        with patch('keggmapwizard.annotation_index.parse_rest_line', wraps=parse_rest_line) as mock_parse:
+            for _ in range(5):
+                self.assertEqual(self.cache.lookup(self.directory, ['ko'])['K00001'],
+                                 'adh; alcohol dehydrogenase')
+        self.assertEqual(mock_parse.call_count, 1)
+
+    def test_lookups_shared(self):
+        first = self.cache.lookup(self.directory, ['ko'])
+        second = self.cache.lookup(self.directory, ['ko'])
+        self.assertIs(first, second)
+
+    def test_several_sources(self):
+        lookup = self.cache.lookup(self.directory, ['hsa', 'mmu'])
+        self.assertIsInstance(lookup, ChainedAnnotationLookup)
+        self.assertEqual(lookup['hsa:1'], 'hsa gene')
+        self.assertEqual(lookup['mmu:1'], 'mmu gene')
+
+    def test_changed_file_reloaded(self):
+        first = self.cache.lookup(self.directory, ['ko'])
+        self.write('ko', "K00002\tAKR1A1\n", mtime=10 ** 18)
+        second = self.cache.lookup(self.directory, ['ko'])
+        self.assertIsNot(first, second)
+        self.assertIn('K00002', second)
+
+    def test_invalidate(self):
+        first = self.cache.lookup(self.directory, ['ko'])
+        self.cache.invalidate(self.directory / 'ko.txt')
+        self.assertIsNot(first, self.cache.lookup(self.directory, ['ko']))
+
+    def test_organism_files_evicted_least_recently_used(self):
+        hsa = self.cache.lookup(self.directory, ['hsa'])
+        mmu = self.cache.lookup(self.directory, ['mmu'])
+        self.assertIs(self.cache.lookup(self.directory, ['hsa']), hsa)
+        self.cache.lookup(self.directory, ['eco'])
+        # mmu was used least recently and is evicted, hsa stays cached
+        self.assertIs(self.cache.lookup(self.directory, ['hsa']), hsa)
+        self.assertIsNot(self.cache.lookup(self.directory, ['mmu']), mmu)
+        # Reference files are not counted towards the organism limit
+        ko = self.cache.lookup(self.directory, ['ko'])
+        self.cache.lookup(self.directory, ['eco'])
+        self.cache.lookup(self.directory, ['hsa'])
+        self.assertIs(self.cache.lookup(self.directory, ['ko']), ko)
+
+###############################################################################
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import time
+import tempfile
+import unittest
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from keggmapwizard.bad_requests import (BadRequestStore, bad_request_store, is_bad_request, time_to_live,
+                                        BAD_REQUESTS_DB, NOT_FOUND_TTL, TRANSIENT_TTL)
+
+
+def _record_many(directory, prefix, n):
+    # Records bad requests from a separate process
+    store = BadRequestStore(directory)
+    for i in range(n):
+        store.record(f'{prefix}{i}', 404)
+
+
+class TestBadRequestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_status_codes(self):
+        self.assertTrue(is_bad_request(404))
+        self.assertTrue(is_bad_request(503))
+        self.assertFalse(is_bad_request(403))
+        self.assertEqual(time_to_live(400), NOT_FOUND_TTL)
+        self.assertEqual(time_to_live(429), TRANSIENT_TTL)
+
+    def test_record_and_lookup(self):
+        store = BadRequestStore(self.path)
+        store.record('hsa00010', 404, now=1000.0)
+        store.record('hsa00010', 404, now=2000.0)
+        store.record('mmu00010', 503, now=2000.0)
+
+        bad_requests = store.lookup(['hsa00010', 'mmu00010', 'gma00010'], now=2001.0)
+        self.assertEqual(sorted(bad_requests), ['hsa00010', 'mmu00010'])
+        self.assertEqual(bad_requests['hsa00010'].attempts, 2)
+        self.assertEqual(bad_requests['hsa00010'].failed_at, 2000.0)
+        self.assertEqual(bad_requests['hsa00010'].expires_at, 2000.0 + NOT_FOUND_TTL)
+        self.assertEqual(bad_requests['mmu00010'].status, 503)
+        self.assertEqual(len(store), 2)
+
+    def test_expired_requests_not_returned(self):
+        store = BadRequestStore(self.path)
+        store.record('hsa00010', 404, now=0.0)
+        store.record('mmu00010', 503, now=0.0)
+        self.assertEqual(list(store.lookup(['hsa00010', 'mmu00010'], now=TRANSIENT_TTL + 1)), ['hsa00010'])
+        self.assertEqual(store.lookup(['hsa00010', 'mmu00010'], now=NOT_FOUND_TTL + 1), {})
+
+    def test_lookup_many(self):
+        store = BadRequestStore(self.path)
+        for i in range(0, 2000, 2):
+            store.record(f'org{i}', 404)
+        bad_requests = store.lookup([f'org{i}' for i in range(2000)])
+        self.assertEqual(len(bad_requests), 1000)
+
+    def test_migrate_keeps_newer_records(self):
+        store = BadRequestStore(self.path, legacy_file=None)
+        store.record('hsa00010', 503)
+        (self.path / 'bad_requests.txt').write_text('hsa00010\nmmu00010\n\n')
+        self.assertEqual(store.migrate(), 2)
+        bad_requests = store.lookup(['hsa00010', 'mmu00010'])
+        self.assertEqual(bad_requests['hsa00010'].status, 503)
+        self.assertEqual(bad_requests['mmu00010'].status, 404)
+        self.assertTrue((self.path / 'bad_requests.txt.migrated').exists())
+        self.assertEqual(store.migrate(), 0)
+
+    def test_migrated_requests_dated_from_migration(self):
+        # An old text file does not make all of its requests expire at once
+        legacy_path = self.path / 'bad_requests.txt'
+        legacy_path.write_text('hsa00010\n')
+        os.utime(legacy_path, (0, 0))
+        now = time.time()
+        store = BadRequestStore(self.path)
+        bad_request = store.lookup(['hsa00010'])['hsa00010']
+        self.assertGreaterEqual(bad_request.failed_at, now)
+        self.assertEqual(bad_request.expires_at, bad_request.failed_at + NOT_FOUND_TTL)
+
+    def test_concurrent_threads(self):
+        store = bad_request_store(self.path)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda i: store.record(f'org{i % 50}', 404), range(200)))
+        bad_requests = store.lookup([f'org{i}' for i in range(50)])
+        self.assertEqual(len(bad_requests), 50)
+        self.assertEqual({bad_request.attempts for bad_request in bad_requests.values()}, {4})
+
+    @unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), 'requires forked processes')
+    def test_concurrent_processes(self):
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_record_many, args=(self.path, f'p{p}_', 50)) for p in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+        self.assertEqual(len(BadRequestStore(self.path)), 200)
+
+    def test_store_recreated_after_deletion(self):
+        store = bad_request_store(self.path)
+        store.record('hsa00010', 404)
+        for file in self.path.glob(f'{BAD_REQUESTS_DB}*'):
+            os.remove(file)
+        self.assertEqual(bad_request_store(self.path).lookup(['hsa00010']), {})
+
+###############################################################################
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,14 @@
 import unittest  # Import the unittest module for creating unit tests.
 from unittest.mock import patch, mock_open  # Import patch and mock_open for mocking file operations.
 import json  # Import the json module to handle JSON data.
+import base64
+import tempfile
+from pathlib import Path
 
 
-from keggmapwizard.base_image import BaseImage  
+from keggmapwizard.base_image import (BaseImage, BASE_IMAGE_SUFFIX, write_base_image,
+                                      read_base_image_header, migrate_json_base_image,
+                                      migrate_json_base_images)
 
 class TestBaseImage(unittest.TestCase):
     """Test case class for the BaseImage class."""
@@ -48,6 +53,105 @@ class TestBaseImage(unittest.TestCase):
         # Ensure that the file was opened with the correct path and mode.
         mock_file.assert_called_once_with(image_path, 'r')
 
+    @patch("builtins.open", side_effect=AssertionError("image must not be read"))
+    def test_initialization_does_not_read_store(self, mock_file):
+        """Test that a BaseImage with an image path does not read the file on creation."""
+        base_image = BaseImage("test_map", None, "100", "200", image_path="dummy_path")
+        self.assertEqual(base_image.image_path, "dummy_path")
+        mock_file.assert_not_called()
+
+
+class TestBaseImageStore(unittest.TestCase):
+    """Test case class for the base image file format."""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.image_path = self.test_dir / f"map00010{BASE_IMAGE_SUFFIX}"
+        self.png_bytes = bytes(range(256)) * 10 + b"tail"
+
+    def tearDown(self):
+        for file in self.test_dir.glob("*"):
+            file.unlink()
+        self.test_dir.rmdir()
+
+    def test_write_and_read_header(self):
+        """Test that the dimensions are read back from the header."""
+        write_base_image(self.image_path, 1200, 900, self.png_bytes)
+        self.assertEqual(read_base_image_header(self.image_path), (1200, 900))
+        # No temporary files are left behind
+        self.assertEqual(list(self.test_dir.glob("*.tmp")), [])
+
+    def test_read_header_rejects_other_files(self):
+        """Test that files without the magic bytes are rejected."""
+        with open(self.image_path, "wb") as file:
+            file.write(b"not a base image file")
+        with self.assertRaises(ValueError):
+            read_base_image_header(self.image_path)
+
+    def test_from_store(self):
+        """Test that from_store reads the dimensions and the image lazily."""
+        write_base_image(self.image_path, 200, 100, self.png_bytes)
+        base_image = BaseImage.from_store("map00010", self.image_path)
+        self.assertEqual(base_image.image_width, "200")
+        self.assertEqual(base_image.image_height, "100")
+        self.assertEqual(base_image.image, base64.b64encode(self.png_bytes).decode())
+
+    def test_iter_base64_chunks(self):
+        """Test that the streamed chunks concatenate to the complete encoding."""
+        write_base_image(self.image_path, 200, 100, self.png_bytes)
+        base_image = BaseImage.from_store("map00010", self.image_path)
+        chunks = list(base_image.iter_base64(chunk_size=100))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks), base64.b64encode(self.png_bytes).decode())
+
+    def test_iter_png(self):
+        """Test that the PNG is read back from base image files and base64 images."""
+        write_base_image(self.image_path, 200, 100, self.png_bytes)
+        base_image = BaseImage.from_store("map00010", self.image_path)
+        self.assertEqual(b''.join(base_image.iter_png(chunk_size=100)), self.png_bytes)
+        encoded = BaseImage("map00010", base64.b64encode(self.png_bytes).decode(), "100", "200")
+        self.assertEqual(b''.join(encoded.iter_png()), self.png_bytes)
+        self.assertEqual(encoded.content_hash, base_image.content_hash)
+
+    def test_write_shared_png(self):
+        """Test that the shared PNG is named by its content and written once."""
+        write_base_image(self.image_path, 200, 100, self.png_bytes)
+        base_image = BaseImage.from_store("map00010", self.image_path)
+        png_path = base_image.write_shared_png(self.test_dir)
+        self.assertEqual(png_path.name, f"map00010.{base_image.content_hash}.png")
+        self.assertEqual(png_path.read_bytes(), self.png_bytes)
+        self.assertEqual(list(self.test_dir.glob("*.tmp")), [])
+
+        # An existing file of the same content is not written again
+        same = BaseImage("map00010", base_image.image, "100", "200")
+        with patch("builtins.open", side_effect=AssertionError("file must not be written")):
+            self.assertEqual(same.write_shared_png(self.test_dir), png_path)
+
+        # A changed image gets its own file
+        changed = BaseImage("map00010", base64.b64encode(b"changed").decode(), "100", "200")
+        self.assertNotEqual(changed.write_shared_png(self.test_dir), png_path)
+
+    def test_migrate_json_base_image(self):
+        """Test the conversion of a base image from the former JSON format."""
+        json_path = self.test_dir / "map00010.json"
+        with open(json_path, "w") as file:
+            json.dump(dict(width=200, height=100, image=base64.b64encode(self.png_bytes).decode()), file)
+
+        self.assertEqual(migrate_json_base_image(json_path), self.image_path)
+        base_image = BaseImage.from_store("map00010", self.image_path)
+        self.assertEqual(base_image.image, base64.b64encode(self.png_bytes).decode())
+
+    def test_migrate_json_base_images_directory(self):
+        """Test the conversion of all JSON base images of a directory."""
+        for number in ("00010", "00020"):
+            with open(self.test_dir / f"map{number}.json", "w") as file:
+                json.dump(dict(width=1, height=2, image=base64.b64encode(b"png").decode()), file)
+
+        migrated = migrate_json_base_images(self.test_dir, remove_json=True)
+        self.assertEqual(len(migrated), 2)
+        self.assertEqual(list(self.test_dir.glob("*.json")), [])
+        self.assertEqual(read_base_image_header(self.test_dir / f"map00020{BASE_IMAGE_SUFFIX}"), (1, 2))
+
 # This block allows the test to be run directly from the command line.
 if __name__ == "__main__":
     unittest.main()  # Run all the test cases defined in the TestBaseImage class.
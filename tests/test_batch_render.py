@@ -0,0 +1,139 @@
+import io
+import os
+import tempfile
+import unittest
+import multiprocessing
+from pathlib import Path
+from unittest.mock import patch
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+from keggmapwizard.batch_render import render_map, render_maps, RenderResult
+
+
+class _StandInMap:
+    """Stand-in for KeggPathwayMap recording the process that rendered a map."""
+
+    def __init__(self, map_id=None, reload=False):
+        if map_id.endswith('99999'):
+            raise ValueError('unknown map')
+        self.map_id = map_id
+        self.output_path = None
+
+    def write_svg_map(self, color_function=None, *args, path=None, output_name=None, output_format='svg',
+                      shared_image=False, image_url=None):
+        if self.map_id.endswith('00000'):
+            print('No pathway to create')
+            return None
+        self.output_path = Path(path) / f'{self.map_id}.{output_format}'
+        with open(self.output_path, 'w') as file:
+            file.write(f'{os.getpid()} {color_function(*args) if color_function else ""}')
+        return self.output_path
+
+
+def _color(*args):
+    return '-'.join(args)
+
+
+@patch('keggmapwizard.batch_render.download_kegg_resources')
+@patch('keggmapwizard.batch_render.KeggPathwayMap', _StandInMap)
+class TestBatchRender(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_render_map_success(self, mock_download):
+        result = render_map('hsa00010', _color, ('red', 'blue'), self.path)
+        self.assertTrue(result.ok)
+        self.assertEqual(result.output_path, Path(self.path) / 'hsa00010.svg')
+        self.assertIsNone(result.error)
+        self.assertGreaterEqual(result.seconds, 0)
+        self.assertTrue(result.output_path.read_text().endswith('red-blue'))
+
+    def test_render_map_output_format(self, mock_download):
+        results = render_maps(['00010'], ['hsa'], path=self.path, n_processes=1, download=False,
+                              verbose=False, output_format='svgz')
+        self.assertEqual(results[0].output_path, Path(self.path) / 'hsa00010.svgz')
+
+    def test_render_map_reports_failure(self, mock_download):
+        result = render_map('hsa99999', path=self.path)
+        self.assertFalse(result.ok)
+        self.assertEqual(result.error, 'ValueError: unknown map')
+        self.assertIsNone(result.output_path)
+
+    def test_render_map_without_pathway(self, mock_download):
+        result = render_map('00000', path=self.path)
+        self.assertFalse(result.ok)
+        self.assertIsNone(result.error)
+        self.assertIn('no pathway to create', repr(result))
+
+    def test_render_map_verbose_prints_messages(self, mock_download):
+        for verbose, expected in ((True, 'No pathway to create\n'), (False, '')):
+            with self.subTest(verbose=verbose), redirect_stdout(io.StringIO()) as output:
+                render_map('00000', path=self.path, verbose=verbose)
+            self.assertEqual(output.getvalue(), expected)
+
+    def test_render_maps_verbose_prints_download_output(self, mock_download):
+        mock_download.side_effect = lambda *args, **kwargs: print('Downloading')
+        with redirect_stdout(io.StringIO()) as output:
+            render_maps(['00010'], ['hsa'], path=self.path, n_processes=1, verbose=True)
+        self.assertIn('Downloading', output.getvalue())
+        self.assertIn('[1/1] <RenderResult: hsa00010 - ok', output.getvalue())
+        with redirect_stdout(io.StringIO()) as output:
+            render_maps(['00010'], ['hsa'], path=self.path, n_processes=1, verbose=False)
+        self.assertEqual(output.getvalue(), '')
+
+    def test_render_maps_verbose_maps_prints_messages(self, mock_download):
+        # The progress messages of every map are printed, in the calling process and in the workers
+        for n_processes in (1, 2):
+            with self.subTest(n_processes=n_processes), redirect_stdout(io.StringIO()) as output, \
+                    patch('keggmapwizard.batch_render.ProcessPoolExecutor', ThreadPoolExecutor):
+                render_maps(['00000'], ['hsa', 'mmu'], path=self.path, n_processes=n_processes, download=False,
+                            verbose=False, verbose_maps=True)
+            self.assertEqual(output.getvalue(), 'No pathway to create\n' * 2)
+        with redirect_stdout(io.StringIO()) as output:
+            render_maps(['00000'], ['hsa'], path=self.path, n_processes=1, download=False, verbose=False)
+        self.assertEqual(output.getvalue(), '')
+
+    def test_render_maps_serial(self, mock_download):
+        results = render_maps(['00010', '99999'], ['hsa', 'mmu'], _color, 'red', path=self.path,
+                              n_processes=1, verbose=False)
+        self.assertEqual(len(results), 4)
+        self.assertEqual({result.map_id for result in results if result.ok}, {'hsa00010', 'mmu00010'})
+        self.assertEqual({result.map_id for result in results if not result.ok}, {'hsa99999', 'mmu99999'})
+        # Resources are downloaded once for all maps and organisms
+        mock_download.assert_called_once_with(['00010', '99999'], ['hsa', 'mmu'], reload=False)
+
+    def test_render_maps_reference_maps(self, mock_download):
+        results = render_maps(['00010'], path=self.path, n_processes=1, download=False, verbose=False)
+        self.assertEqual([result.map_id for result in results], ['00010'])
+        mock_download.assert_not_called()
+
+    @unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(),
+                         'the stand-in map is only inherited by forked workers')
+    def test_render_maps_process_pool(self, mock_download):
+        with patch('keggmapwizard.batch_render.ProcessPoolExecutor',
+                   _fork_executor()):
+            results = render_maps(['00010', '00020', '00030'], ['hsa', 'mmu'], _color, 'red',
+                                  path=self.path, n_processes=2, verbose=False)
+        self.assertEqual(len(results), 6)
+        self.assertTrue(all(isinstance(result, RenderResult) and result.ok for result in results))
+        pids = {int(result.output_path.read_text().split()[0]) for result in results}
+        self.assertNotIn(os.getpid(), pids)
+        self.assertLessEqual(len(pids), 2)
+
+
+def _fork_executor():
+    from concurrent.futures import ProcessPoolExecutor
+
+    def executor(*args, **kwargs):
+        return ProcessPoolExecutor(*args, mp_context=multiprocessing.get_context('fork'), **kwargs)
+    return executor
+
+###############################################################################
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,7 +8,9 @@ Created on Wed Oct 16 12:36:21 2024
 import unittest
 from unittest.mock import MagicMock, patch
 import xml.etree.ElementTree as ET
-from keggmapwizard.color_function_base import color_all, color_org, color_custom_annotations, set_gradient  
+from keggmapwizard.color_function_base import (color_all, color_org, color_custom_annotations, set_gradient,
+                                               extend_colors, color_signature, QUERY_SET_PALETTE,
+                                               GradientRegistry)
 
 
 class TestColorFunctions(unittest.TestCase):
@@ -124,6 +126,96 @@ class TestColorFunctions(unittest.TestCase):
                 self.assertEqual(element.get('stroke-width'), '3')
                 self.assertEqual(element.get('fill-opacity'), '0.15')
                 
+    def test_color_org_matches_organism(self):
+        root, colors = color_org('mmu', 'green', data=self.data)
+        self.assertEqual(colors, ['green'])
+        for element in root.find('.//g'):
+            self.assertEqual(element.get('fill'), 'green')
+            self.assertEqual(element.get('fill-opacity'), '0.15')
+
+    def test_color_custom_annotations_single_query(self):
+        root, colors = color_custom_annotations({'q1': ['K08034']}, 'red', data=self.data)
+        rect1, rect2 = root.find('.//g')
+        self.assertEqual(rect1.get('fill'), f"url(#gradient_{color_signature(['red'])})")
+        self.assertEqual(rect1.get('fill-opacity'), '0.5')
+        self.assertEqual(rect1.find('title').text,
+                         "['q1:K08034 (TCF2, HNF1B)', 'mmu:21410 (Hnf1b, HNF-1-beta, HNF-1B, "
+                         "HNF-1Beta, Hnf1beta, LFB3, Tcf-2, Tcf2, vHNF1)']")
+        self.assertEqual(rect2.get('fill'), 'transparent')
+        self.assertEqual(rect2.find('title').text, "['K06054 (HES1)', 'mmu:15205 (Hes1, Hry, bHLHb39)']")
+
+    def test_color_custom_annotations_multiple_queries(self):
+        root, colors = color_custom_annotations({'q1': ['K08034'], 'q2': ['mmu:21410', 'K06054']},
+                                                ['red', 'blue'], data=self.data)
+        rect1, rect2 = root.find('.//g')
+        self.assertEqual(rect1.get('fill'), f"url(#gradient_{color_signature(['red', 'blue'])})")
+        self.assertEqual(rect2.get('fill'), f"url(#gradient_{color_signature(['white', 'blue'])})")
+        self.assertEqual(rect1.find('title').text,
+                         "['q1:K08034 (TCF2, HNF1B)', 'q2:mmu:21410 (Hnf1b, HNF-1-beta, HNF-1B, "
+                         "HNF-1Beta, Hnf1beta, LFB3, Tcf-2, Tcf2, vHNF1)']")
+        stops = root.find(f".//linearGradient[@id='gradient_{color_signature(['white', 'blue'])}']")
+        self.assertEqual([stop.get('stop-color') for stop in stops], ['white', 'white', 'blue', 'blue'])
+
+    def test_color_custom_annotations_many_sets(self):
+        # Ten genomes; all but the first get their color from the palette
+        query = {f'genome{i}': ['K08034'] if i % 2 else ['K08034', 'K06054'] for i in range(10)}
+        root, colors = color_custom_annotations(query, ['black'], data=self.data)
+        self.assertEqual(colors, ['black'] + QUERY_SET_PALETTE[:9])
+        rect1, rect2 = root.find('.//g')
+        gradients = root.findall('.//linearGradient')
+        self.assertEqual(len(gradients), 2)
+        self.assertEqual(len(root.findall('defs')), 1)
+        stops = root.find(f".//linearGradient[@id='{rect2.get('fill')[5:-1]}']")
+        self.assertEqual([stop.get('stop-color') for stop in stops][::2],
+                         [color if i % 2 == 0 else 'white' for i, color in enumerate(colors)])
+        self.assertEqual(rect1.find('title').text.count('genome'), 10)
+
+    def test_color_custom_annotations_shared_gradient(self):
+        # Shapes matching the same query sets share one gradient
+        root, colors = color_custom_annotations({'q1': ['K08034', 'K06054'], 'q2': ['mmu:21410', 'mmu:15205']},
+                                                ['red', 'blue'], data=self.data)
+        rect1, rect2 = root.find('.//g')
+        self.assertEqual(rect1.get('fill'), rect2.get('fill'))
+        self.assertEqual(len(root.findall('.//linearGradient')), 1)
+
+    def test_color_custom_annotations_empty_query(self):
+        root, colors = color_custom_annotations({}, data=self.data)
+        self.assertIsNone(colors)
+
+    def test_gradient_registry(self):
+        shape_defs = ET.SubElement(self.root, 'defs', id='shape-color-defs')
+        rect1, rect2 = self.group
+        registry = GradientRegistry(self.root)
+        gradient_id = registry.apply(rect1, ['red', 'white'])
+        self.assertEqual(registry.apply(rect2, ('red', 'white')), gradient_id)
+        self.assertEqual(registry.apply(rect2, ['white', 'red']), f"gradient_{color_signature(['white', 'red'])}")
+        self.assertEqual(len(registry), 2)
+        self.assertEqual(len(shape_defs), 2)
+        self.assertEqual(rect1.get('fill'), f'url(#{gradient_id})')
+        self.assertEqual(rect1.get('stroke'), f'url(#{gradient_id})')
+        # A second registry of the document reuses the emitted gradients
+        GradientRegistry(self.root).apply(rect1, ['red', 'white'])
+        self.assertEqual(len(shape_defs), 2)
+
+    def test_gradient_registry_creates_defs(self):
+        rect1, rect2 = self.group
+        GradientRegistry(self.root).apply(rect1, ['red'])
+        self.assertEqual(len(self.root.find("defs[@id='shape-color-defs']")), 1)
+
+    def test_extend_colors(self):
+        self.assertEqual(extend_colors(['red'], 1), ['red'])
+        self.assertEqual(extend_colors(['red'], 3), ['red', 'yellow', 'blue'])
+        colors = extend_colors([], 40)
+        self.assertEqual(colors[:len(QUERY_SET_PALETTE)], QUERY_SET_PALETTE)
+        self.assertEqual(len(set(colors)), 40)
+
+    def test_color_custom_annotations_exact_match(self):
+        # Partial identifiers do not match
+        root, colors = color_custom_annotations({'q1': ['K0803', 'mmu:2141']}, 'red', data=self.data)
+        for element in root.find('.//g'):
+            self.assertEqual(element.get('fill'), 'transparent')
+            self.assertIsNone(element.get('fill-opacity'))
+
     def test_set_gradient(self):
         """Test set_gradient function."""
         shape_element = ET.SubElement(self.group, 'shape', shape_id='shape1')
@@ -0,0 +1,63 @@
+import ast
+import unittest
+import xml.etree.ElementTree as ET
+from keggmapwizard.color_function_base import color_signature
+from keggmapwizard.color_functions_color_groups import (add_linear_gradient_groups, check_anno,
+                                                         assess_no_of_groups, define_color,
+                                                         remove_duplicate_groups)
+
+
+class TestColorGroups(unittest.TestCase):
+
+    def setUp(self):
+        self.root = ET.Element('svg')
+        group = ET.SubElement(self.root, 'g', {'name': 'shapes'})
+        for shape_id, title in (("7", "['K08034 (TCF2, HNF1B)', 'mmu:21410 (Hnf1b)']"),
+                                ("8", "['K06054 (HES1)', 'mmu:15205 (Hes1)']")):
+            shape = ET.SubElement(group, 'rect', shape_id=shape_id, fill='transparent')
+            names = [line.split()[0] for line in ast.literal_eval(title)]
+            ET.SubElement(shape, 'desc').text = str([{'type': 'K', 'name': name, 'description': ''}
+                                                     for name in names])
+            ET.SubElement(shape, 'title').text = title
+
+    def test_check_anno(self):
+        title_text, percentage = check_anno(['K08034 (TCF2)', 'mmu:21410 (Hnf1b)'],
+                                            [{'g1': ['K08034'], 'g2': ['K99999']}], 1, {'g1': {0}})
+        self.assertEqual(title_text, ['group1:g1:K08034 (TCF2)', 'mmu:21410 (Hnf1b)'])
+        self.assertEqual(percentage, 50)
+
+    def test_assess_no_of_groups(self):
+        self.assertEqual(assess_no_of_groups({'a': ['K1']}), (1, [[{'a': ['K1']}]]))
+        self.assertEqual(assess_no_of_groups([[{'a': ['K1']}], [{'b': ['K2']}]])[0], 2)
+
+    def test_define_color(self):
+        self.assertEqual(define_color([0, 25, 50, 75, 100])[0], ['white', 'yellow', 'red', 'blue', 'green'])
+
+    def test_remove_duplicate_groups(self):
+        self.assertEqual(remove_duplicate_groups(['group1:a:group1:b:K1']), ['group1:a:b:K1'])
+
+    def test_add_linear_gradient_groups(self):
+        query = [[{'a': ['K08034']}], [{'b': ['K08034'], 'c': ['K06054']}]]
+        root, legend_colors = add_linear_gradient_groups(query, data=self.root)
+        rect1, rect2 = root.find('.//g')
+        self.assertEqual(legend_colors, ['yellow', 'red', 'blue', 'green'])
+        self.assertEqual(rect1.get('fill'), f"url(#gradient_{color_signature(['green', 'red'])})")
+        self.assertEqual(rect1.get('fill-opacity'), '0.5')
+        self.assertEqual(rect1.find('title').text, "['group2:b:group1:a:K08034 (TCF2, HNF1B)', 'mmu:21410 (Hnf1b)']")
+        stops = root.find(f".//linearGradient[@id='gradient_{color_signature(['white', 'red'])}']")
+        self.assertEqual([stop.get('stop-color') for stop in stops], ['white', 'white', 'red', 'red'])
+        # All gradients are emitted once into the shape-color-defs element
+        self.assertEqual(len(root.findall('defs')), 1)
+        self.assertEqual(len(root.find("defs[@id='shape-color-defs']")), 2)
+
+    def test_add_linear_gradient_groups_exact_match(self):
+        root, legend_colors = add_linear_gradient_groups({'a': ['K0803', 'mmu:2141']}, data=self.root)
+        self.assertEqual(legend_colors, ['yellow', 'red', 'blue', 'green'])
+        for shape in root.find('.//g'):
+            self.assertEqual(shape.get('fill'), 'transparent')
+            self.assertNotIn('group1', shape.find('title').text)
+
+###############################################################################
+
+if __name__ == '__main__':
+    unittest.main()
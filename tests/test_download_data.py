@@ -19,6 +19,14 @@ from keggmapwizard.download_data import download_data, download_rest_data, extra
 from keggmapwizard.config import config
 import tempfile
 import base64
+import hashlib
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from keggmapwizard.download_data import download_many, make_transparent
+from keggmapwizard.base_image import BaseImage, BASE_IMAGE_SUFFIX, read_base_image_header
+from keggmapwizard.sync_state import SyncState, load_sync_state
+from keggmapwizard.bad_requests import bad_request_store, BAD_REQUESTS_DB
 DATA_DIR = config.working_dir
 
 
@@ -26,13 +34,13 @@ DATA_DIR = config.working_dir
 class TestDownloadData(unittest.TestCase):
     
     @patch('pathlib.Path.mkdir')  # Prevent actual directory creation
-    @patch('urllib.request.urlopen')
+    @patch('keggmapwizard.download_data.session')
     @patch('builtins.open', new_callable=mock_open)
-    def test_download_kgml_file(self, mock_file, mock_urlopen, mock_mkdir):
-        # Mock the response from urlopen
-        mock_urlopen.return_value.__enter__.return_value.read.return_value = b'<xml>data</xml>'
+    def test_download_kgml_file(self, mock_file, mock_session, mock_mkdir):
+        # Mock the response of the HTTP session
+        mock_session.get.return_value = b'<xml>data</xml>'
         
-        url = 'http://rest.kegg.jp/get/sample/kgml'
+        url = 'https://rest.kegg.jp/get/sample/kgml'
         arg = 'sample'
         path = 'test_directory'
         
@@ -43,11 +51,11 @@ class TestDownloadData(unittest.TestCase):
         mock_file().write.assert_called_once_with('<xml>data</xml>')
 
     @patch('pathlib.Path.mkdir')  # Prevent actual directory creation
-    @patch('urllib.request.urlopen')
+    @patch('keggmapwizard.download_data.session')
     @patch('builtins.open', new_callable=mock_open)
-    def test_download_png_file(self, mock_file, mock_urlopen, mock_mkdir):
-        # Mock the response from urlopen
-        mock_urlopen.return_value.__enter__.return_value.read.return_value = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR'
+    def test_download_png_file(self, mock_file, mock_session, mock_mkdir):
+        # Mock the response of the HTTP session
+        mock_session.get.return_value = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR'
         
         url = 'https://www.genome.jp/kegg/pathway/map/map1.png'
         arg = '1'
@@ -60,11 +68,11 @@ class TestDownloadData(unittest.TestCase):
         mock_file().write.assert_called_once_with(b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR')
         
     @patch('pathlib.Path.mkdir')  # Prevent actual directory creation
-    @patch('urllib.request.urlopen')
+    @patch('keggmapwizard.download_data.session')
     @patch('builtins.open', new_callable=mock_open)
-    def test_download_rest_file(self, mock_file, mock_urlopen, mock_mkdir):
-        # Mock the response from urlopen
-        mock_urlopen.return_value.__enter__.return_value.read.return_value = b'This is a test.'
+    def test_download_rest_file(self, mock_file, mock_session, mock_mkdir):
+        # Mock the response of the HTTP session
+        mock_session.get.return_value = b'This is a test.'
         
         url = 'http://example.com/data'
         arg = 'test'
@@ -76,13 +84,12 @@ class TestDownloadData(unittest.TestCase):
         mock_file.assert_called_once_with(Path(path) / 'test.txt', 'w')
         mock_file().write.assert_called_once_with('This is a test.')
 
-    @patch('pathlib.Path.touch')  # Prevent FileNotFoundError
-    @patch('pathlib.Path.mkdir')  # Prevent actual directory creation
-    @patch('urllib.request.urlopen')
+    @patch('keggmapwizard.download_data.bad_request_store')
+    @patch('keggmapwizard.download_data.session')
     @patch('builtins.open', new_callable=mock_open)
-    def test_http_error_handling(self, mock_open_func, mock_urlopen, mock_mkdir, mock_touch):
+    def test_http_error_handling(self, mock_open_func, mock_session, mock_store):
         # Mock an HTTP error
-        mock_urlopen.side_effect = urllib.error.HTTPError(
+        mock_session.get.side_effect = urllib.error.HTTPError(
             url='http://example.com',
             code=404,
             msg='Not Found',
@@ -97,9 +104,10 @@ class TestDownloadData(unittest.TestCase):
         # Invoke the function
         download_data(url, arg, path, verbose=False)
     
-        # Check that bad request logging was triggered
-        mock_open_func.assert_any_call(Path(path) / 'bad_requests.txt', 'a')
-        mock_open_func().write.assert_any_call('test\n')
+        # Check that the bad request was recorded in the store of the directory
+        mock_store.assert_called_once_with(path)
+        mock_store.return_value.record.assert_called_once_with('test', 404)
+        mock_open_func.assert_not_called()
         
 ###############################################################################
 
@@ -172,6 +180,45 @@ class TestDownloadData(unittest.TestCase):
         # Assertions
         self.assertEqual(mock_download_data.call_count, 2)  # Ensure download_data was called twice even if files exist
 
+    @patch('keggmapwizard.download_data.annotation_cache')
+    @patch('keggmapwizard.download_data.download_many')
+    @patch('keggmapwizard.download_data.check_bad_requests', side_effect=lambda args, *rest: args)
+    def test_reload_invalidates_annotation_cache(self, mock_check_bad_requests, mock_download_many,
+                                                 mock_cache):
+        mock_cache.index.return_value.update.return_value = ['ko']
+        with patch('builtins.print'):
+            download_rest_data(['ko'], reload=True, verbose=True)
+
+        expected_path = Path(DATA_DIR) / "rest_data"
+        mock_cache.invalidate.assert_called_once_with(expected_path / 'ko.txt')
+        mock_cache.index.assert_called_once_with(expected_path)
+        mock_cache.index.return_value.update.assert_called_once_with(['ko'])
+
+    @patch('keggmapwizard.download_data.annotation_cache')
+    @patch('keggmapwizard.download_data.download_many', return_value=['ko'])
+    @patch('keggmapwizard.download_data.fetch_kegg_release', return_value='112.0')
+    def test_sync_revalidates_files_of_older_releases(self, mock_release, mock_download_many, mock_cache):
+        with tempfile.TemporaryDirectory() as working_dir:
+            rest_data = Path(working_dir) / "rest_data"
+            rest_data.mkdir()
+            for name in ('ko', 'gn'):
+                (rest_data / f'{name}.txt').write_text(name)
+            sync_state = load_sync_state(working_dir)
+            sync_state.release = '112.0'
+            sync_state.record(rest_data / 'gn.txt')
+            sync_state.release = '111.0'
+            sync_state.record(rest_data / 'ko.txt')
+
+            with patch('keggmapwizard.download_data.config', MagicMock(working_dir=working_dir)):
+                download_rest_data(['ko', 'gn'], verbose=False, sync=True)
+
+            # Only ko.txt was validated against an older release
+            jobs = mock_download_many.call_args.args[0]
+            self.assertEqual([job[1] for job in jobs], ['ko'])
+            self.assertIs(mock_download_many.call_args.kwargs['sync_state'], sync_state)
+            mock_cache.invalidate.assert_called_once_with(rest_data / 'ko.txt')
+            self.assertTrue((Path(working_dir) / 'sync_state.json').is_file())
+
 ###############################################################################
 
 class TestPNGFunctions(unittest.TestCase):
@@ -180,6 +227,7 @@ class TestPNGFunctions(unittest.TestCase):
         self.test_dir = Path(tempfile.mkdtemp())
         self.png_path = self.test_dir / "test_img.png"
         self.json_path = self.png_path.with_suffix(".json")
+        self.store_path = self.png_path.with_suffix(BASE_IMAGE_SUFFIX)
 
         # Create mock config and dependency functions
         self.mock_config = MagicMock()
@@ -193,71 +241,59 @@ class TestPNGFunctions(unittest.TestCase):
             file.unlink()
         self.test_dir.rmdir()
         
-    @patch("keggmapwizard.download_data.Image.open")
-    @patch("keggmapwizard.download_data.BytesIO")
-    @patch("keggmapwizard.download_data.base64.b64encode", return_value=b"mock_base64_encoded_data")
-    @patch("keggmapwizard.download_data.open", new_callable=mock_open)
+    @patch("keggmapwizard.download_data.write_base_image")
     @patch("keggmapwizard.download_data.os.path.isfile", return_value=True)
-    def test_encode_png_mocks(self, mock_isfile, mock_open_file, mock_b64encode, mock_bytes_io, mock_image_open):
-        # Setup mock image
-        mock_img = MagicMock(spec=Image.Image)
-        converted_img = MagicMock(spec=Image.Image)
-        converted_img.size = (1, 1)
-        
-        # Mock pixel access
-        mock_pixdata = MagicMock()
-        mock_pixdata.__getitem__.return_value = (255, 255, 255, 255)
-        mock_pixdata.__setitem__ = MagicMock()
-    
-        converted_img.load.return_value = mock_pixdata
-        converted_img.save = MagicMock()
-        converted_img.close = MagicMock()
-        mock_img.convert.return_value = converted_img
-        mock_image_open.return_value = mock_img
-    
-        # Mock BytesIO buffer
-        mock_buffer = BytesIO()
-        mock_bytes_io.return_value = mock_buffer
-    
+    def test_encode_png_mocks(self, mock_isfile, mock_write):
         # Execute
-        encode_png(Path("test_image.png"))
-    
-        # Assert image operations
-        mock_image_open.assert_called_once_with(Path("test_image.png"))
-        mock_img.convert.assert_called_once_with("RGBA")
-        converted_img.save.assert_called_once_with(mock_buffer, "PNG")
-        converted_img.close.assert_called_once()
-        mock_pixdata.__setitem__.assert_called_with((0, 0), (255, 255, 255, 0))
-    
-        # Combine written output for JSON parsing
-        handle = mock_open_file()
-        written_data = ''.join(call.args[0] for call in handle.write.call_args_list)
-        written_json = json.loads(written_data)
-    
-        # Check JSON structure
-        self.assertEqual(written_json["width"], 1)
-        self.assertEqual(written_json["height"], 1)
-        self.assertEqual(written_json["image"], "mock_base64_encoded_data")
+        encode_png(self.png_path)
+
+        # The processed image is written next to the PNG file
+        mock_write.assert_called_once()
+        image_path, width, height, png_bytes = mock_write.call_args.args
+        self.assertEqual(image_path, self.store_path)
+        self.assertEqual((width, height), (2, 2))
+        img = Image.open(BytesIO(png_bytes))
+        self.assertEqual(img.mode, "RGBA")
+        self.assertEqual(img.getpixel((0, 0)), (255, 255, 255, 0))
+
+    def test_make_transparent_pixels(self):
+        img = Image.new("RGBA", (6, 1))
+        pixels = [(255, 255, 255, 255),  # white -> transparent
+                  (128, 128, 128, 255),  # grey -> black with transparency
+                  (254, 254, 254, 255),  # light grey
+                  (0, 0, 0, 255),        # black is kept
+                  (255, 0, 0, 255),      # colors are kept
+                  (10, 10, 20, 255)]     # almost grey is kept
+        for x, pixel in enumerate(pixels):
+            img.putpixel((x, 0), pixel)
+
+        result = make_transparent(img)
+
+        self.assertEqual([result.getpixel((x, 0)) for x in range(6)],
+                         [(255, 255, 255, 0), (0, 0, 0, 127), (0, 0, 0, 1),
+                          (0, 0, 0, 255), (255, 0, 0, 255), (10, 10, 20, 255)])
+
+    def test_make_transparent_rejects_translucent_grey(self):
+        img = Image.new("RGBA", (1, 1), (128, 128, 128, 100))
+        with self.assertRaises(AssertionError):
+            make_transparent(img)
 
     @patch("os.path.isfile", return_value=True)
-    def test_encode_png_creates_json(self, mock_isfile):
+    def test_encode_png_creates_base_image(self, mock_isfile):
         encode_png(self.png_path)
-        self.assertTrue(self.json_path.exists())
-
-        with open(self.json_path) as f:
-            data = json.load(f)
-        self.assertEqual(data["width"], 2)
-        self.assertEqual(data["height"], 2)
-        self.assertIn("image", data)
+        self.assertTrue(self.store_path.exists())
+        self.assertFalse(self.json_path.exists())
 
-        decoded = base64.b64decode(data["image"])
+        self.assertEqual(read_base_image_header(self.store_path), (2, 2))
+        base_image = BaseImage.from_store("00010", self.store_path)
+        decoded = base64.b64decode(base_image.image)
         img = Image.open(BytesIO(decoded)).convert("RGBA")
         self.assertEqual(img.getpixel((0, 0)), (255, 255, 255, 0))
 
     @patch("os.path.isfile", return_value=False)
     def test_encode_png_skips_if_missing(self, mock_isfile):
         encode_png(Path("nonexistent.png"))
-        self.assertFalse(self.json_path.exists())
+        self.assertFalse(self.store_path.exists())
 
     @patch("keggmapwizard.download_data.check_input", return_value=["ko12345", "ko67890"])
     @patch("keggmapwizard.download_data.check_bad_requests", return_value=["ko12345"])
@@ -272,6 +308,23 @@ class TestPNGFunctions(unittest.TestCase):
         mock_encode.assert_called_once()
         
 
+    @patch("keggmapwizard.download_data.download_data")
+    def test_download_base_png_maps_migrates_json(self, mock_download):
+        # A base image cached in the former JSON format is converted, not downloaded
+        maps_png = self.test_dir / "maps_png"
+        maps_png.mkdir()
+        with open(maps_png / "map00010.json", 'w') as file:
+            json.dump(dict(width=2, height=3, image=base64.b64encode(b"png").decode()), file)
+
+        with patch("keggmapwizard.download_data.config", MagicMock(working_dir=str(self.test_dir))):
+            download_base_png_maps(["00010"], verbose=False)
+
+        mock_download.assert_not_called()
+        self.assertEqual(read_base_image_header(maps_png / f"map00010{BASE_IMAGE_SUFFIX}"), (2, 3))
+        for file in maps_png.glob("*"):
+            file.unlink()
+        maps_png.rmdir()
+
     @patch("builtins.print")
     @patch("keggmapwizard.download_data.check_input", return_value=[])
     @patch("keggmapwizard.config", new_callable=lambda: MagicMock(working_dir=str(Path(tempfile.mkdtemp()))))
@@ -282,6 +335,150 @@ class TestPNGFunctions(unittest.TestCase):
 
 ###############################################################################
 
+class _StandInHandler(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the KEGG servers: '/missing...' paths answer 404. The
+    bodies (str or bytes) of paths can be changed through server.bodies; requests with the
+    ETag of the current body answer 304.
+    """
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        # Keep the request open for a moment so that concurrent requests overlap
+        time.sleep(0.05)
+        with server.lock:
+            server.active -= 1
+        if self.path.startswith('/missing'):
+            self.send_error(404)
+            return
+        body = server.bodies.get(self.path, f'data for {self.path}')
+        body = body.encode() if isinstance(body, str) else body
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if self.headers.get('If-None-Match') == etag:
+            with server.lock:
+                server.not_modified += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDownloadMany(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _StandInHandler)
+        self.server.lock = threading.Lock()
+        self.server.active = 0
+        self.server.max_active = 0
+        self.server.bodies = {}
+        self.server.not_modified = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.path = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for file in self.path.glob("*"):
+            file.unlink()
+        self.path.rmdir()
+
+    def test_downloads_all_files_in_parallel(self):
+        jobs = [(f'{self.base_url}/list/arg{i}', f'arg{i}', self.path) for i in range(8)]
+        with patch('keggmapwizard.http_session.MAX_CONNECTIONS_PER_HOST', 8):
+            download_many(jobs, n_parallel=4, verbose=False)
+
+        for i in range(8):
+            with open(self.path / f'arg{i}.txt') as file:
+                self.assertEqual(file.read(), f'data for /list/arg{i}')
+        self.assertGreater(self.server.max_active, 1)
+        self.assertLessEqual(self.server.max_active, 4)
+
+    def test_per_host_limit(self):
+        jobs = [(f'{self.base_url}/list/arg{i}', f'arg{i}', self.path) for i in range(8)]
+        with patch('keggmapwizard.http_session.MAX_CONNECTIONS_PER_HOST', 2):
+            download_many(jobs, n_parallel=8, verbose=False)
+
+        self.assertEqual(len(list(self.path.glob('*.txt'))), 8)
+        self.assertLessEqual(self.server.max_active, 2)
+
+    def test_bad_requests_logged_once(self):
+        jobs = [(f'{self.base_url}/missing{i}', f'missing{i}', self.path) for i in range(6)]
+        jobs.append((f'{self.base_url}/list/ok', 'ok', self.path))
+        download_many(jobs + jobs[:3], n_parallel=4, verbose=False)
+
+        bad_requests = bad_request_store(self.path).lookup([job[1] for job in jobs])
+        self.assertEqual(sorted(bad_requests), [f'missing{i}' for i in range(6)])
+        self.assertEqual(sorted(bad_request.attempts for bad_request in bad_requests.values()), [1, 1, 1, 2, 2, 2])
+        self.assertEqual({bad_request.status for bad_request in bad_requests.values()}, {404})
+        self.assertTrue((self.path / 'ok.txt').exists())
+
+    def test_on_complete_called_for_every_job(self):
+        jobs = [(f'{self.base_url}/list/arg{i}', f'arg{i}', self.path) for i in range(5)]
+        completed = []
+        download_many(jobs, n_parallel=3, verbose=False,
+                      on_complete=lambda arg, path: completed.append(arg))
+        self.assertEqual(sorted(completed), [f'arg{i}' for i in range(5)])
+
+    def test_sync_rewrites_changed_files_only(self):
+        jobs = [(f'{self.base_url}/list/arg{i}', f'arg{i}', self.path) for i in range(3)]
+        sync_state = SyncState(self.path)
+        self.assertEqual(sorted(download_many(jobs, n_parallel=3, verbose=False, sync_state=sync_state)),
+                         ['arg0', 'arg1', 'arg2'])
+        for i in range(3):
+            os.utime(self.path / f'arg{i}.txt', ns=(0, 0))
+
+        # The unchanged files are answered with 304 and not rewritten
+        self.server.bodies['/list/arg1'] = 'changed'
+        self.assertEqual(download_many(jobs, n_parallel=3, verbose=False, sync_state=sync_state), ['arg1'])
+        self.assertEqual(self.server.not_modified, 2)
+        self.assertEqual((self.path / 'arg1.txt').read_text(), 'changed')
+        self.assertEqual([os.stat(self.path / f'arg{i}.txt').st_mtime_ns for i in (0, 2)], [0, 0])
+
+    def test_sync_failed_write_not_recorded(self):
+        url = f'{self.base_url}/list/arg0'
+        sync_state = SyncState(self.path)
+        self.assertTrue(download_data(url, 'arg0', self.path, verbose=False, sync_state=sync_state))
+        validators = sync_state.validators(self.path / 'arg0.txt')
+
+        # The changed content cannot be decoded, so the old file stays on disk
+        self.server.bodies['/list/arg0'] = b'\xff\xfe changed'
+        with self.assertRaises(UnicodeDecodeError):
+            download_data(url, 'arg0', self.path, verbose=False, sync_state=sync_state)
+        self.assertEqual((self.path / 'arg0.txt').read_text(), 'data for /list/arg0')
+        # The validators of the old file are kept, so the next sync revalidates it
+        self.assertEqual(sync_state.validators(self.path / 'arg0.txt'), validators)
+
+        self.server.bodies['/list/arg0'] = 'changed'
+        self.assertTrue(download_data(url, 'arg0', self.path, verbose=False, sync_state=sync_state))
+        self.assertEqual((self.path / 'arg0.txt').read_text(), 'changed')
+
+    def test_sync_keeps_files_downloaded_before(self):
+        # Files downloaded without validators are compared with the downloaded content
+        jobs = [(f'{self.base_url}/list/arg{i}', f'arg{i}', self.path) for i in range(2)]
+        download_many(jobs, n_parallel=1, verbose=False)
+        os.utime(self.path / 'arg0.txt', ns=(0, 0))
+        self.server.bodies['/list/arg1'] = 'changed'
+
+        sync_state = SyncState(self.path)
+        self.assertEqual(download_many(jobs, n_parallel=1, verbose=False, sync_state=sync_state), ['arg1'])
+        self.assertEqual(os.stat(self.path / 'arg0.txt').st_mtime_ns, 0)
+        self.assertEqual(sync_state.conditional_headers(self.path / 'arg0.txt'),
+                         {'If-None-Match': f'"{hashlib.sha256(b"data for /list/arg0").hexdigest()[:16]}"'})
+
+###############################################################################
+
 class TestCheckInput(unittest.TestCase):
 
     def setUp(self):
@@ -364,55 +561,55 @@ class TestCheckInput(unittest.TestCase):
 class TestCheckBadRequests(unittest.TestCase):
     
     def setUp(self):
-        # Setup a temporary directory if needed
-        self.path = Path("test_path")
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name)
         self.bad_file = "bad_requests.txt"
 
-    @patch("os.path.isfile", return_value=False)
-    def test_no_bad_requests_file(self, mock_isfile):
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_no_bad_requests_file(self):
         # Test check missing file
         args = ["map00010", "map00020"]
         result = check_bad_requests(args, self.path, self.bad_file, verbose=False, reload=False)
         self.assertEqual(result, args)
-
-    @patch("os.path.isfile")
-    def test_check_bad_requests(self, mock_isfile):
-        # Filters known bad requests	
-        # Mock os.path.isfile to return True (simulate existence of bad_requests_file)
-        mock_isfile.return_value = True
-
-        # Simulate the content of the bad_requests_file using mock_open
-        mock_file_content = "map12345\nmap45678\n"
-        with patch("builtins.open", mock_open(read_data=mock_file_content)) as mock_file:
-            # Define input arguments
-            args_list = ["map12345", "map23456"]
-            path = Path("/mock/path")
-            bad_requests_file = "bad_requests.txt"
-            verbose = False
-            reload = False
-
-            # Call the function
-            result = check_bad_requests(args_list, path, self.bad_file, reload = reload, verbose = verbose)
-
-            # Check the filtered result
-            expected_result = ["map23456"]  # Only file3.txt is not in bad_requests_file
-            self.assertEqual(result, expected_result)
-
-            # Verify the bad_requests_file was opened with the correct path
-            mock_file.assert_called_once_with(Path(path) / bad_requests_file, "r")
-        
-    @patch("os.path.isfile", return_value=True)
-    @patch("builtins.open", new_callable=mock_open, read_data="map00010\nmap00030")
-    def test_filter_bad_requests_without_reload_verbose_off(self, mock_file, mock_isfile):
+        # No store is created as long as no request failed
+        self.assertFalse((self.path / BAD_REQUESTS_DB).exists())
+
+    def test_check_bad_requests(self):
+        # Filters known bad requests of the store
+        bad_request_store(self.path).record("map12345", 404)
+        result = check_bad_requests(["map12345", "map23456"], self.path, self.bad_file, reload=False, verbose=False)
+        self.assertEqual(result, ["map23456"])
+
+    def test_legacy_bad_requests_file_migrated(self):
+        # Bad requests of the text file of earlier versions are imported into the store
+        (self.path / self.bad_file).write_text("map00010\nmap00030\n")
         args = ["map00010", "map00020", "map00030"]
         result = check_bad_requests(args, self.path, self.bad_file, verbose=False, reload=False)
         # map00010 and map00030 should be filtered out
         self.assertEqual(result, ["map00020"])
-        
-    @patch("os.path.isfile", return_value=True)
-    @patch("builtins.open", new_callable=mock_open, read_data="map00010\nmap00030")
-    def test_filter_bad_requests_with_reload_verbose_on(self, mock_file, mock_isfile):
+        self.assertFalse((self.path / self.bad_file).exists())
+        self.assertTrue((self.path / f"{self.bad_file}.migrated").exists())
+        self.assertEqual(check_bad_requests(args, self.path, self.bad_file, verbose=False, reload=False),
+                         ["map00020"])
+
+    def test_custom_bad_requests_file_deprecated(self):
+        # A file name given by the caller is ignored with a warning, and the file is left alone
+        custom_file = self.path / "failed_maps.txt"
+        custom_file.write_text("map00010\n")
+        bad_request_store(self.path).record("map00020", 404)
+        with self.assertWarns(FutureWarning):
+            result = check_bad_requests(["map00010", "map00020"], self.path, "failed_maps.txt",
+                                        verbose=False, reload=False)
+        self.assertEqual(result, ["map00010"])
+        self.assertEqual(custom_file.read_text(), "map00010\n")
+        self.assertFalse((self.path / "failed_maps.txt.migrated").exists())
+
+    def test_filter_bad_requests_with_reload_verbose_on(self):
         # Keeps bad entries if reload=True, prints retry message
+        for arg in ("map00010", "map00030"):
+            bad_request_store(self.path).record(arg, 404)
         args = ["map00010", "map00020", "map00030"]
         with patch("sys.stdout", new=StringIO()) as fake_out:
             result = check_bad_requests(args, self.path, self.bad_file, verbose=True, reload=True)
@@ -421,6 +618,14 @@ class TestCheckBadRequests(unittest.TestCase):
             self.assertIn("map00010 was previously identified as a bad request. Attempting to download again.", output)
             self.assertIn("map00030 was previously identified as a bad request. Attempting to download again.", output)
 
+    def test_expired_bad_requests_downloaded_again(self):
+        # A transient failure is retried once its time to live has passed
+        store = bad_request_store(self.path)
+        store.record("map00010", 503, now=time.time() - 2 * 60 * 60)
+        store.record("map00020", 404, now=time.time() - 2 * 60 * 60)
+        result = check_bad_requests(["map00010", "map00020"], self.path, self.bad_file, verbose=False, reload=False)
+        self.assertEqual(result, ["map00010"])
+
     def test_empty_args_list(self):
         result = check_bad_requests([], self.path, self.bad_file, verbose=False, reload=False)
         self.assertEqual(result, [])
@@ -5,7 +5,8 @@ Created on Wed Jul 30 15:58:53 2025
 @author: aparn
 """
 import unittest
-from keggmapwizard.geometry import Geometry, Line, Circle, Rectangle, geometry_factory 
+import xml.etree.ElementTree as ET
+from keggmapwizard.geometry import Geometry, Line, Circle, Rectangle, geometry_factory, GeometryColumns
 
 class TestGeometry(unittest.TestCase):
 
@@ -124,6 +125,44 @@ class TestGeometry(unittest.TestCase):
         data = {'graphics': {'type': 'unknown'}}
         result = geometry_factory(data)
         self.assertIsNone(result)
+
+    def test_geometry_columns_match_geometry_factory(self):
+        # Tests that the column-wise geometries equal those of the factory, including the order of the attributes
+        root = ET.fromstring(
+            '<pathway>'
+            '<entry id="1"><graphics type="rectangle" x="100" y="50" width="46" height="17"/></entry>'
+            '<entry id="2"><graphics type="roundrectangle" x="101" y="51" width="80" height="25"/></entry>'
+            '<entry id="3"><graphics type="circle" x="10" y="20" width="9" height="9"/></entry>'
+            '<entry id="4"><graphics type="line" coords="1,2,3,4,5,6"/></entry>'
+            '<entry id="5"><graphics type="unknown"/></entry>'
+            '</pathway>')
+        entries = root.findall('entry')
+        columns = GeometryColumns.from_entries(entries)
+        self.assertEqual(len(columns), 5)
+        for row, entry in enumerate(entries[:4]):
+            expected = geometry_factory({'graphics': dict(entry.find('graphics').items())})
+            geometry = columns.geometry(row)
+            self.assertEqual(list(geometry.geometry_coords.items()), list(expected.geometry_coords.items()))
+            self.assertEqual(geometry.geometry_shape, expected.geometry_shape)
+        self.assertIsNone(columns.geometry(4))
+
+    def test_geometries_are_compact(self):
+        # Tests that geometries are kept without __dict__
+        data = {'graphics': {'x': '10', 'y': '20', 'width': '40', 'height': '20', 'type': 'rectangle'}}
+        self.assertFalse(hasattr(geometry_factory(data), '__dict__'))
+        columns = GeometryColumns(['circle'], ['10'], ['20'], ['40'], ['40'], [None])
+        self.assertFalse(hasattr(columns.geometry(0), '__dict__'))
+
+    def test_geometry_columns_odd_coordinates_raises(self):
+        # Tests that an odd number of line coordinates raises an error when the columns are built
+        with self.assertRaises(AssertionError):
+            GeometryColumns(['line'], [None], [None], [None], [None], ['10,20,30'])
+
+    def test_geometry_columns_create_new_attributes(self):
+        # Tests that every access creates new attributes, so changing them does not change the columns
+        columns = GeometryColumns(['circle'], ['10'], ['20'], ['40'], ['40'], [None])
+        columns.geometry(0).geometry_coords['cx'] += 1
+        self.assertEqual(columns.geometry(0).geometry_coords['cx'], 10)
    
 ###############################################################################
 
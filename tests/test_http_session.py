@@ -0,0 +1,105 @@
+import threading
+import unittest
+import urllib.error
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from keggmapwizard.http_session import HttpSession
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    """Local HTTP/1.1 stand-in recording the client port of every request."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.client_ports.append(self.client_address[1])
+        if self.path == '/missing':
+            self._send(404, b'not found')
+        elif self.path == '/redirect':
+            self.send_response(301)
+            self.send_header('Location', '/list/target')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/close':
+            self._send(200, b'closing', close=True)
+        else:
+            self._send(200, f'data for {self.path}'.encode())
+
+    def _send(self, status, body, close=False):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        if close:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHttpSession(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _KeepAliveHandler)
+        self.server.lock = threading.Lock()
+        self.server.client_ports = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.session = HttpSession(max_connections_per_host=2, timeout=5)
+
+    def tearDown(self):
+        self.session.close()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def test_get_returns_body(self):
+        self.assertEqual(self.session.get(f'{self.base_url}/list/ko'), b'data for /list/ko')
+
+    def test_connection_is_reused(self):
+        # Sequential requests to one host travel over the same connection
+        for i in range(5):
+            self.session.get(f'{self.base_url}/list/arg{i}')
+        self.assertEqual(len(self.server.client_ports), 5)
+        self.assertEqual(len(set(self.server.client_ports)), 1)
+
+    def test_concurrent_requests_limited_to_pool_size(self):
+        threads = [threading.Thread(target=self.session.get, args=(f'{self.base_url}/list/arg{i}',))
+                   for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.server.client_ports), 10)
+        self.assertLessEqual(len(set(self.server.client_ports)), 2)
+
+    def test_http_error_raised(self):
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self.session.get(f'{self.base_url}/missing')
+        self.assertEqual(context.exception.code, 404)
+        # The connection remains usable after an error response
+        self.assertEqual(self.session.get(f'{self.base_url}/list/ko'), b'data for /list/ko')
+
+    def test_redirect_followed(self):
+        response = self.session.fetch(f'{self.base_url}/redirect')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.body, b'data for /list/target')
+        self.assertTrue(response.url.endswith('/list/target'))
+
+    def test_connection_closed_by_server(self):
+        self.assertEqual(self.session.get(f'{self.base_url}/close'), b'closing')
+        self.assertEqual(self.session.get(f'{self.base_url}/list/ko'), b'data for /list/ko')
+        self.assertEqual(len(set(self.server.client_ports)), 2)
+
+    def test_unreachable_host_raises_url_error(self):
+        port = self.server.server_address[1]
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+        with self.assertRaises(urllib.error.URLError):
+            HttpSession(timeout=1).get(f'http://127.0.0.1:{port}/list/ko')
+
+###############################################################################
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,11 +5,13 @@ Created on Wed Jul 30 10:40:05 2025
 @author: aparn
 """
 
+import os
+import json
+import tempfile
 import unittest
 from unittest.mock import patch
 from pathlib import Path
-from xml.etree.ElementTree import Element
-from keggmapwizard.kegg_file import KgmlFile
+from keggmapwizard.kegg_file import KgmlFile, parse_kgml, read_kgml_header, ENTRY_CACHE_VERSION
 
 class TestKgmlFile(unittest.TestCase):
     def setUp(self):
@@ -45,54 +47,149 @@ class TestKgmlFile(unittest.TestCase):
         expected = Path(self.data_dir) / "kgml_data" / "orgs" / "b00001.xml"
         self.assertEqual(kgml_org.file_path, expected)
 
-    @patch("xml.etree.ElementTree.parse")
+    def write_kgml(self, data_dir, entries=''):
+        # Write a KGML file with the given entries to <data_dir>/kgml_data/ko
+        kgml = KgmlFile(map_id=self.map_id, file_type=self.file_type, data_directory=data_dir)
+        kgml.file_directory.mkdir(parents=True)
+        kgml.file_path.write_text('<?xml version="1.0"?>\n'
+                                  '<pathway name="path:eco00010" org="eco" number="00010" title="Glycolysis">'
+                                  f'{entries}</pathway>')
+        return kgml
+
+    @patch("keggmapwizard.kegg_file.parse_kgml", wraps=parse_kgml)
     def test_file_contents_loads_once(self, mock_parse):
-        # Simulate an XML root with mock attributes
-        root = Element("pathway", attrib={"org": "eco", "title": "Glycolysis", "number": "00010"})
-        mock_parse.return_value.getroot.return_value = root
-
-        # First access triggers parsing
-        contents1 = self.kgml.file_contents
-        # Second access should use cached version
-        contents2 = self.kgml.file_contents
-        # Confirm both accesses return the same object
-        self.assertIs(contents1, contents2)
-        # Ensure XML file was parsed only once
-        mock_parse.assert_called_once()
-
-    @patch("xml.etree.ElementTree.parse")
-    def test_metadata_properties(self, mock_parse):
-        # Mock pathway XML with org, title, and number attributes
-        root = Element("pathway", attrib={"org": "eco", "title": "Glycolysis", "number": "00010"})
-        mock_parse.return_value.getroot.return_value = root
-
-        # Trigger parsing
-        _ = self.kgml.file_contents
-
-        # Validate individual metadata extraction
-        self.assertEqual(self.kgml.organism, "eco")
-        self.assertEqual(self.kgml.title, "Glycolysis")
-        self.assertEqual(self.kgml.pathway_number, "00010")
-
-    @patch("xml.etree.ElementTree.parse")
-    def test_entries_property(self, mock_parse):
-        # Create XML with multiple <entry> elements
-        root = Element("pathway")
-        entry1 = Element("entry", attrib={"id": "1"})
-        entry2 = Element("entry", attrib={"id": "2"})
-        root.extend([entry1, entry2])  # Add entries to root
-        mock_parse.return_value.getroot.return_value = root
-
-        # Verify that entries are parsed and retrieved correctly
-        entries = self.kgml.entries
-        self.assertEqual(len(entries), 2)
-        self.assertEqual(entries[0].attrib["id"], "1")
-        self.assertEqual(entries[1].attrib["id"], "2")
-
-    @patch("xml.etree.ElementTree.parse", side_effect=FileNotFoundError("mocked missing file"))
-    def test_read_file_missing(self, mock_parse):
+        with tempfile.TemporaryDirectory() as data_dir:
+            kgml = self.write_kgml(data_dir)
+            # First access triggers parsing
+            contents1 = kgml.file_contents
+            # Second access should use cached version
+            contents2 = kgml.file_contents
+            # Confirm both accesses return the same object
+            self.assertIs(contents1, contents2)
+            # Ensure XML file was parsed only once
+            mock_parse.assert_called_once()
+
+    def test_metadata_properties(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            kgml = self.write_kgml(data_dir)
+            # Validate individual metadata extraction
+            self.assertEqual(kgml.organism, "eco")
+            self.assertEqual(kgml.title, "Glycolysis")
+            self.assertEqual(kgml.pathway_number, "00010")
+
+    @patch("keggmapwizard.kegg_file.parse_kgml")
+    def test_header_read_without_parsing_entries(self, mock_parse):
+        # The metadata is read from the start of the file only, once
+        with tempfile.TemporaryDirectory() as data_dir:
+            kgml = self.write_kgml(data_dir)
+            # Anything after the root start tag is never parsed
+            kgml.file_path.write_text('<pathway org="eco" title="Glycolysis" number="00010"><entry <<< truncated')
+            with patch("keggmapwizard.kegg_file.read_kgml_header", wraps=read_kgml_header) as mock_header:
+                self.assertEqual((kgml.organism, kgml.title, kgml.pathway_number), ("eco", "Glycolysis", "00010"))
+                self.assertEqual(kgml.header, {"org": "eco", "title": "Glycolysis", "number": "00010"})
+                mock_header.assert_called_once()
+            mock_parse.assert_not_called()
+
+    def test_header_missing_file(self):
+        with patch('builtins.print'):
+            self.assertIsNone(self.kgml.header)
+            self.assertIsNone(self.kgml.title)
+
+    def test_entries_property(self):
+        # Create XML with multiple <entry> elements, relations and reactions
+        entries = ('<entry id="1" name="ko:K00001" type="ortholog">'
+                   '<graphics type="rectangle" x="1" y="2" width="46" height="17"/>'
+                   '<graphics type="circle" x="1" y="2" width="8"/></entry>'
+                   '<entry id="2" name="cpd:C00001" type="compound"><component id="5"/></entry>'
+                   '<relation entry1="1" entry2="2" type="ECrel"><subtype name="compound" value="2"/></relation>'
+                   '<reaction id="3" name="rn:R00001" type="reversible"><substrate id="2" name="cpd:C00001"/>'
+                   '</reaction>')
+        with tempfile.TemporaryDirectory() as data_dir:
+            kgml = self.write_kgml(data_dir, entries)
+            # Verify that entries are parsed and retrieved correctly
+            entries = kgml.entries
+            self.assertEqual(len(entries), 2)
+            self.assertEqual(entries[0].attrib, {"id": "1", "name": "ko:K00001", "type": "ortholog"})
+            self.assertEqual(entries[1].attrib["id"], "2")
+            # Only the first graphics of an entry is kept; relations and reactions are dropped
+            self.assertEqual([child.get('type') for child in entries[0]], ['rectangle'])
+            self.assertEqual(len(entries[1]), 0)
+            self.assertEqual([child.tag for child in kgml.file_contents], ['entry', 'entry'])
+
+    def test_entries_cached_next_to_file(self):
+        entries = '<entry id="1" name="ko:K00001" type="ortholog"><graphics type="line" coords="1,2,3,4"/></entry>'
+        with tempfile.TemporaryDirectory() as data_dir:
+            kgml = self.write_kgml(data_dir, entries)
+            self.assertEqual(len(kgml.entries), 1)
+            self.assertTrue(kgml.entry_cache_path.is_file())
+            self.assertEqual(kgml.entry_cache_path.parent, kgml.file_path.parent)
+            # The cache is plain JSON, which cannot execute code when loaded
+            cache = json.loads(kgml.entry_cache_path.read_text())
+            self.assertEqual(cache['entries'], [[{'id': '1', 'name': 'ko:K00001', 'type': 'ortholog'},
+                                                 {'type': 'line', 'coords': '1,2,3,4'}]])
+
+            # A new instance reads the cache instead of parsing the file
+            with patch("keggmapwizard.kegg_file.parse_kgml") as mock_parse:
+                cached = KgmlFile(map_id=self.map_id, file_type=self.file_type, data_directory=data_dir)
+                self.assertEqual(cached.entries[0].find('graphics').get('coords'), '1,2,3,4')
+                self.assertEqual(cached.title, 'Glycolysis')
+                mock_parse.assert_not_called()
+
+            # The cache is not used once the file changed
+            kgml.file_path.write_text('<pathway org="eco" title="Changed" number="00010"></pathway>')
+            os.utime(kgml.file_path, ns=(0, 0))
+            changed = KgmlFile(map_id=self.map_id, file_type=self.file_type, data_directory=data_dir)
+            self.assertEqual(changed.title, 'Changed')
+            self.assertEqual(changed.entries, [])
+
+    def test_corrupt_entry_cache_is_ignored(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            kgml = self.write_kgml(data_dir)
+            for corrupt in (b'not json', b'[1, 2]', b'{"version": 2}'):
+                kgml.entry_cache_path.write_bytes(corrupt)
+                reread = KgmlFile(map_id=self.map_id, file_type=self.file_type, data_directory=data_dir)
+                self.assertEqual(reread.title, 'Glycolysis')
+                self.assertEqual(reread.entries, [])
+
+    def test_malformed_entry_cache_is_ignored(self):
+        # Caches of the current file that are valid JSON of another structure
+        # are ignored and the entries are parsed from the KGML file again
+        entries = '<entry id="1" name="ko:K00001" type="ortholog"><graphics type="circle" x="1" y="2"/></entry>'
+        with tempfile.TemporaryDirectory() as data_dir:
+            kgml = self.write_kgml(data_dir, entries)
+            stat = kgml.file_path.stat()
+            for root, cached in (({'title': 'Glycolysis'}, [1]), ({'title': 'Glycolysis'}, [[{'id': 1}, None]]),
+                                 ({'title': 'Glycolysis'}, [[{'id': '1'}, 'circle']]),
+                                 ({'title': 'Glycolysis'}, {'1': None}), (['Glycolysis'], [])):
+                kgml.entry_cache_path.write_text(json.dumps({
+                    'version': ENTRY_CACHE_VERSION, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                    'root': root, 'entries': cached}))
+                reread = KgmlFile(map_id=self.map_id, file_type=self.file_type, data_directory=data_dir)
+                with patch("keggmapwizard.kegg_file.parse_kgml", wraps=parse_kgml) as mock_parse:
+                    self.assertEqual([entry.get('id') for entry in reread.entries], ['1'])
+                mock_parse.assert_called_once()
+                self.assertEqual(reread.entries[0].find('graphics').get('type'), 'circle')
+
+    @patch("keggmapwizard.kegg_file.parse_kgml", wraps=parse_kgml)
+    def test_reload(self, mock_parse):
+        # Reloading discards the parsed contents and increments the version
+        with tempfile.TemporaryDirectory() as data_dir:
+            kgml = self.write_kgml(data_dir)
+            _ = kgml.file_contents
+            self.assertEqual(kgml.version, 0)
+            self.assertEqual(kgml.title, 'Glycolysis')
+            kgml.reload()
+            self.assertEqual(kgml.version, 1)
+            kgml.file_path.write_text('<pathway org="eco" title="Reloaded" number="00010"></pathway>')
+            os.utime(kgml.file_path, ns=(0, 0))
+            self.assertEqual(kgml.title, 'Reloaded')
+            _ = kgml.file_contents
+            self.assertEqual(mock_parse.call_count, 2)
+
+    def test_read_file_missing(self):
         # Simulate missing file error
-        contents = self.kgml.file_contents
+        with patch('builtins.print'):
+            contents = self.kgml.file_contents
         # Expect graceful fallback (returns None)
         self.assertIsNone(contents)
 
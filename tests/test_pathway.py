@@ -5,9 +5,14 @@ Created on Mon Jul 28 21:36:54 2025
 @author: aparn
 """
 
+import os
+import tempfile
 import unittest
+import xml.etree.ElementTree as ET
+from pathlib import Path
 from unittest.mock import patch, MagicMock, mock_open
 from keggmapwizard.pathway import Pathway
+from keggmapwizard.annotation_index import annotation_cache
 
 
 class TestPathway(unittest.TestCase):
@@ -91,22 +96,205 @@ class TestPathway(unittest.TestCase):
         self.assertEqual(len(result), 1)
         self.assertTrue(result[0].pathway_annotation_data['annotated'])
 
-    @patch('builtins.open', new_callable=mock_open, read_data="GENE0001\tDesc\tX\tAnnotatedValue\n")
-    @patch('pathlib.Path.exists', return_value=True)
+    @patch('keggmapwizard.pathway.Pathway._Pathway__provide_annotations', return_value={})
+    @patch('keggmapwizard.pathway.GeometryAnnotation')
+    @patch('keggmapwizard.pathway.KgmlFile')
+    @patch('keggmapwizard.pathway.config')
+    def test_pathway_components_merge_many_organisms(self, mock_config, MockKgmlFile, MockGeomAnn, mock_provide):
+        # The entries of 50 organism files are merged in one pass, each annotation once
+        mock_config.working_dir = '/mock_dir'
+        organisms = [f'o{i:02d}' for i in range(50)]
+
+        def kgml_file(map_id, file_type, working_dir):
+            org = map_id[:-5]
+            root = ET.fromstring(
+                '<pathway>'
+                f'<entry id="1" name="{org}:1 {org}:2" type="gene">'
+                '<graphics type="rectangle" x="10" y="10" width="46" height="17"/></entry>'
+                '<entry id="2" name="ko:K00001" type="ortholog">'
+                '<graphics type="line" coords="1,2,3,4"/></entry>'
+                '</pathway>')
+            return MagicMock(entries=root.findall('entry'), organism=org, file_name=map_id, version=0)
+
+        MockKgmlFile.side_effect = kgml_file
+        MockGeomAnn.return_value.get_annotation.side_effect = lambda data, annotations: list(data)
+
+        pathway = Pathway(':'.join(organisms) + ':00010', ['orgs'])
+        components = {pc.pathway_component_id: pc for pc in pathway.pathway_components}
+
+        self.assertEqual([data['name'] for data in components['1'].pathway_annotation_data],
+                         [f'{org}:1 {org}:2' for org in organisms])
+        self.assertEqual(list(components['2'].pathway_annotation_data), [{'name': 'ko:K00001', 'type': 'ortholog'}])
+        self.assertEqual(components['2'].pathway_component_geometry, {'d': 'M 1,2 L 3,4'})
+
+    @patch('keggmapwizard.pathway.write_inconsistent_kgml')
+    @patch('keggmapwizard.pathway.Pathway._Pathway__provide_annotations', return_value={})
+    @patch('keggmapwizard.pathway.GeometryAnnotation')
+    @patch('keggmapwizard.pathway.KgmlFile')
+    @patch('keggmapwizard.pathway.config')
+    def test_inconsistent_kgml_report(self, mock_config, MockKgmlFile, MockGeomAnn, mock_provide, mock_write):
+        # Entries with the same id and a different geometry are reported and written once per file
+        mock_config.working_dir = '/mock_dir'
+
+        def kgml_file(map_id, file_type, working_dir):
+            x = 10 if file_type == 'ko' else 20
+            root = ET.fromstring(
+                '<pathway>'
+                f'<entry id="1" name="ko:K00001" type="ortholog"><graphics type="circle" x="{x}" y="10" width="8"/></entry>'
+                f'<entry id="2" name="ko:K00002" type="ortholog"><graphics type="circle" x="{x}" y="10" width="8"/></entry>'
+                '<entry id="3" name="ko:K00003" type="ortholog"><graphics type="circle" x="5" y="5" width="8"/></entry>'
+                f'<entry id="1" name="ko:K00004" type="ortholog"><graphics type="circle" x="{x}" y="30" width="8"/></entry>'
+                '</pathway>')
+            return MagicMock(entries=root.findall('entry'), file_name=f'{file_type}00010', version=0)
+
+        MockKgmlFile.side_effect = kgml_file
+        MockGeomAnn.return_value.get_annotation.side_effect = lambda data, annotations: list(data)
+
+        pathway = Pathway('00010', ['ko', 'ec', 'rn'])
+        self.assertEqual(len(pathway.pathway_components), 3)
+        # Every inconsistent entry is reported, also several with the same id in one file
+        conflicts = [('1', {'r': 4.0, 'cx': 20, 'cy': 10}), ('2', {'r': 4.0, 'cx': 20, 'cy': 10}),
+                     ('1', {'r': 4.0, 'cx': 20, 'cy': 30})]
+        self.assertEqual(pathway.inconsistent_kgml,
+                         {'ko00010': [('1', {'r': 4.0, 'cx': 10, 'cy': 30})], 'ec00010': conflicts,
+                          'rn00010': conflicts})
+        self.assertEqual(mock_write.call_args_list,
+                         [unittest.mock.call('ko00010', [('1', {'r': 4.0, 'cx': 10, 'cy': 30})]),
+                          unittest.mock.call('ec00010', conflicts), unittest.mock.call('rn00010', conflicts)])
+
+    @patch('keggmapwizard.pathway.Pathway._Pathway__provide_annotations', return_value={})
+    @patch('keggmapwizard.pathway.KgmlFile')
+    @patch('keggmapwizard.pathway.config')
+    def test_unknown_graphics_type_raises(self, mock_config, MockKgmlFile, mock_provide):
+        # Entries with a graphics type without SVG shape are rejected
+        mock_config.working_dir = '/mock_dir'
+        root = ET.fromstring('<pathway><entry id="7" name="ko:K00001" type="ortholog">'
+                             '<graphics type="hexagon" x="10" y="10" width="8" height="8"/></entry></pathway>')
+        MockKgmlFile.return_value = MagicMock(entries=root.findall('entry'), file_name='ko00010', version=0)
+
+        pathway = Pathway('00010', ['ko'])
+        with self.assertRaisesRegex(ValueError, 'Unknown graphics type of entry 7'):
+            pathway.pathway_components
+
+    @patch('keggmapwizard.pathway.Pathway._Pathway__create_pathway_components')
+    @patch('keggmapwizard.pathway.KgmlFile')
+    @patch('keggmapwizard.pathway.config')
+    def test_pathway_components_cached(self, mock_config, MockKgmlFile, mock_create):
+        mock_config.working_dir = '/mock_dir'
+        mock_file = MagicMock(version=0)
+        MockKgmlFile.return_value = mock_file
+        mock_create.side_effect = lambda: [MagicMock()]
+
+        pathway = Pathway('00010', ['ko'])
+        first = pathway.pathway_components
+        second = pathway.pathway_components
+
+        self.assertIsInstance(first, tuple)
+        self.assertIs(second, first)
+        self.assertEqual(len(second), 1)
+        mock_create.assert_called_once()
+
+        # Components are rebuilt after an underlying file was reloaded
+        mock_file.version = 1
+        pathway.pathway_components
+        self.assertEqual(mock_create.call_count, 2)
+
+        # Reloading the pathway reloads its files and rebuilds the components
+        pathway.reload()
+        mock_file.reload.assert_called_once()
+        pathway.pathway_components
+        self.assertEqual(mock_create.call_count, 3)
+
+    @patch('keggmapwizard.pathway.ANNOTATION_SETTINGS', {'K': {'rest_file': 'ko'}})
+    @patch('keggmapwizard.pathway.KgmlFile')
+    @patch('keggmapwizard.pathway.config')
+    def test_pathway_components_shared_and_rest_files(self, mock_config, MockKgmlFile):
+        with tempfile.TemporaryDirectory() as working_dir:
+            mock_config.working_dir = working_dir
+            rest_file = Path(working_dir) / 'rest_data' / 'ko.txt'
+            rest_file.parent.mkdir()
+            rest_file.write_text('K00001\tfirst description\n')
+            root = ET.fromstring('<pathway><entry id="1" name="ko:K00001" type="ortholog">'
+                                 '<graphics type="circle" x="10" y="10" width="8"/></entry></pathway>')
+            MockKgmlFile.return_value = MagicMock(entries=root.findall('entry'), file_name='ko00010', version=0)
+
+            pathway = Pathway('00010', ['ko'])
+            first = pathway.pathway_components[0]
+            # The components are shared, with read-only annotations
+            self.assertIs(pathway.pathway_components[0], first)
+            with self.assertRaises(TypeError):
+                first.pathway_annotation_data['title'] = []
+            with self.assertRaises(TypeError):
+                first.pathway_annotation_data['data_annotation'][0]['name'] = 'changed'
+            # Copies of the components can be changed
+            copy = first.copy()
+            copy.pathway_annotation_data['title'].append('changed')
+            copy.pathway_annotation_data['data_annotation'][0]['name'] = 'changed'
+            self.assertNotIn('changed', first.pathway_annotation_data['title'])
+            self.assertEqual(first.pathway_annotation_data['data_annotation'][0]['name'], 'K00001')
+            self.assertEqual(copy.pathway_component_geometry, first.pathway_component_geometry)
+
+            # Accessing the components does not check the REST files
+            with patch('keggmapwizard.pathway.os.stat') as mock_stat:
+                pathway.pathway_components
+            mock_stat.assert_not_called()
+
+            # The components are annotated again after a REST file changed
+            versions = pathway.rest_file_versions()
+            self.assertEqual(versions[0][0], str(rest_file))
+            self.assertIs(pathway.pathway_components[0], first)
+            rest_file.write_text('K00001\tsecond description\n')
+            os.utime(rest_file, ns=(0, 0))
+            self.assertNotEqual(pathway.rest_file_versions(), versions)
+            with patch.object(Pathway, '_Pathway__create_pathway_components',
+                              wraps=pathway._Pathway__create_pathway_components) as mock_create:
+                second = pathway.pathway_components[0]
+                pathway.pathway_components
+            mock_create.assert_called_once()
+            self.assertIn('second description', str(second.pathway_annotation_data))
+            self.assertNotIn('first description', str(second.pathway_annotation_data))
+            annotation_cache.clear()
+
     @patch('keggmapwizard.pathway.config')
     @patch('keggmapwizard.pathway.ANNOTATION_SETTINGS', {
         'Gene': {'rest_file': 'eco'},
         'Compound': {'rest_file': 'compound'}
     })
-    def test_provide_annotations(self, mock_config, mock_exists, mock_open_file):
-        mock_config.working_dir = '/mock_dir'
-        pathway = Pathway('eco00010', ['orgs'])
-        annotations = pathway._Pathway__provide_annotations(['eco'])
+    def test_provide_annotations(self, mock_config):
+        with tempfile.TemporaryDirectory() as working_dir:
+            mock_config.working_dir = working_dir
+            rest_data = Path(working_dir) / 'rest_data'
+            rest_data.mkdir()
+            with open(rest_data / 'eco.txt', 'w') as file:
+                file.write("GENE0001\tDesc\tX\tAnnotatedValue\n")
+
+            pathway = Pathway('eco00010', ['orgs'])
+            with patch('builtins.print'):
+                annotations = pathway._Pathway__provide_annotations(['eco'])
+
+            self.assertIn('Gene', annotations)
+            self.assertIn('Compound', annotations)
+            self.assertIn('GENE0001', annotations['Gene'])
+            self.assertEqual(annotations['Gene']['GENE0001'], 'AnnotatedValue')
+            self.assertNotIn('GENE0002', annotations['Gene'])
+            self.assertNotIn('C00001', annotations['Compound'])
+            annotation_cache.clear()
 
-        self.assertIn('Gene', annotations)
-        self.assertIn('Compound', annotations)
-        self.assertIn('GENE0001', annotations['Gene'])
-        self.assertEqual(annotations['Gene']['GENE0001'], 'AnnotatedValue')
+    @patch('keggmapwizard.pathway.KgmlFile')
+    @patch('keggmapwizard.pathway.config')
+    @patch('keggmapwizard.pathway.ANNOTATION_SETTINGS', {
+        'Gene': {'rest_file': 'org'},
+        'Compound': {'rest_file': 'compound'},
+        'Other': {'rest_file': ''}
+    })
+    def test_rest_files(self, mock_config, MockKgmlFile):
+        mock_config.working_dir = '/dir'
+        MockKgmlFile.side_effect = lambda name, file_type, working_dir: MagicMock(organism=name[:-5])
+        rest_data = Path('/dir') / 'rest_data'
+        self.assertEqual(Pathway('eco:hsa:00010', ['orgs']).rest_files,
+                         [rest_data / 'eco.txt', rest_data / 'hsa.txt', rest_data / 'compound.txt'])
+        # Reference maps are annotated from the reference REST files only
+        self.assertEqual(Pathway('00010', ['ko']).rest_files, [rest_data / 'compound.txt'])
 
     @patch('keggmapwizard.pathway.KgmlFile')
     @patch('keggmapwizard.pathway.config')
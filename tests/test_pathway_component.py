@@ -5,10 +5,11 @@ Created on Wed Jul 30 16:04:54 2025
 @author: aparn
 """
 
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 from pathlib import Path
-from keggmapwizard.pathway_component import PathwayComponent  
+from keggmapwizard.pathway_component import PathwayComponent, write_inconsistent_kgml
 
 class TestPathwayComponent(unittest.TestCase):
 
@@ -33,6 +34,18 @@ class TestPathwayComponent(unittest.TestCase):
         self.assertEqual(component.pathway_component_geometry_shape, 'circle')
         self.assertIn('cx', component.pathway_component_geometry)
 
+    def test_component_is_compact(self):
+        # Components are kept without __dict__; the entry is reduced to its id, name and type
+        component = PathwayComponent(self.entry)
+        self.assertFalse(hasattr(component, '__dict__'))
+        self.assertEqual(component.entry, {'id': 'pc1', 'name': ['map12345'], 'type': ['map']})
+
+    def test_unknown_graphics_type_raises(self):
+        # Entries with a graphics type without SVG shape are rejected
+        entry = dict(self.entry, graphics={'type': 'unknown'})
+        with self.assertRaises(ValueError):
+            PathwayComponent(entry)
+
     def test_retrieve_pathway_annotation_for_map_type(self):
         # Verifies annotation retrieval modifies map name properly for 'map' types
         component = PathwayComponent(self.entry)
@@ -80,8 +93,30 @@ class TestPathwayComponent(unittest.TestCase):
         }
         result = component.is_equivalent(existing, 'example')
         mock_open.assert_called_once()  # ensure file opened
-        mock_mkdir.assert_called_once_with('Inconsistent_KGML')
+        mock_mkdir.assert_called_once_with(Path('/tmp') / 'Inconsistent_KGML')
+        self.assertEqual(result['pc1'], existing['pc1'])
+
+    @patch('builtins.open', new_callable=unittest.mock.mock_open)
+    def test_is_equivalent_collects_conflicts(self, mock_open):
+        # With a conflicts list, the id and differing geometry are collected and nothing is written
+        component = PathwayComponent(self.entry)
+        existing = {'pc1': MagicMock(pathway_component_geometry={'cx': 0})}
+        conflicts = []
+        result = component.is_equivalent(existing, 'example', conflicts)
         self.assertEqual(result['pc1'], existing['pc1'])
+        # Further conflicts of the same entry id are collected as well
+        component.is_equivalent(existing, 'example', conflicts)
+        self.assertEqual(conflicts, [('pc1', component.pathway_component_geometry)] * 2)
+        mock_open.assert_not_called()
+
+    def test_write_inconsistent_kgml(self):
+        # All conflicts of a file are written to the working directory at once
+        with tempfile.TemporaryDirectory() as working_dir, \
+                patch('keggmapwizard.config.config.working_dir', Path(working_dir)):
+            path = write_inconsistent_kgml('ko00010', [('1', {'cx': 1}), ('2', {'d': 'M 1,2 L 3,4'}),
+                                                       ('1', {'cx': 2})])
+            self.assertEqual(path, Path(working_dir) / 'Inconsistent_KGML' / 'ko00010.txt')
+            self.assertEqual(path.read_text(), "1: {'cx': 1}\n2: {'d': 'M 1,2 L 3,4'}\n1: {'cx': 2}\n")
 
     def test_merge_pathway_components_adds_annotation(self):
         # Tests that annotation gets appended if not present
@@ -107,6 +142,20 @@ class TestPathwayComponent(unittest.TestCase):
         result = component.merge_pathway_components(existing)
         self.assertEqual(len(result['pc1'].pathway_annotation_data), 1)
 
+    def test_merge_pathway_components_uses_annotation_names(self):
+        # The given names are checked instead of the annotations and updated with the added annotation
+        component = PathwayComponent(self.entry)
+        component.retrive_pathway_annotation_data()
+        existing = {'pc1': MagicMock(pathway_annotation_data=[])}
+        names = {'map12345'}
+        component.merge_pathway_components(existing, names)
+        self.assertEqual(existing['pc1'].pathway_annotation_data, [])
+
+        names = {'map00001'}
+        component.merge_pathway_components(existing, names)
+        self.assertEqual(len(existing['pc1'].pathway_annotation_data), 1)
+        self.assertEqual(names, {'map00001', 'map12345'})
+
 ###############################################################################
 
 if __name__ == '__main__':
@@ -0,0 +1,169 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+from keggmapwizard.config import config
+from keggmapwizard.bad_requests import bad_request_store
+from keggmapwizard.resource_manifest import ResourceManifest, resource_manifest
+from keggmapwizard.kegg_pathway_map import KeggPathwayMap, download_kegg_resources
+
+
+class TestResourceManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.manifest = ResourceManifest()
+
+    def test_ensure_checks_once(self):
+        check = MagicMock()
+        self.assertEqual(self.manifest.ensure('rest', ['ko', 'compound', 'ko'], check), ['ko', 'compound'])
+        self.assertEqual(self.manifest.ensure('rest', ['ko', 'compound'], check), [])
+        check.assert_called_once_with(['ko', 'compound'])
+        self.assertTrue(self.manifest.is_verified('rest', 'ko'))
+        self.assertFalse(self.manifest.is_verified('kgml', 'ko'))
+
+    def test_ensure_checks_only_new_resources(self):
+        check = MagicMock()
+        self.manifest.ensure('rest', ['ko'], check)
+        self.manifest.ensure('rest', ['ko', 'hsa'], check)
+        self.assertEqual(check.call_args_list[1].args, (['hsa'],))
+
+    def test_ensure_reload(self):
+        check = MagicMock()
+        self.manifest.ensure('rest', ['ko'], check)
+        self.manifest.ensure('rest', ['ko'], check, reload=True)
+        self.assertEqual(check.call_count, 2)
+
+    def test_failed_check_not_verified(self):
+        check = MagicMock(side_effect=OSError('disk full'))
+        with self.assertRaises(OSError):
+            self.manifest.ensure('rest', ['ko'], check)
+        self.assertFalse(self.manifest.is_verified('rest', 'ko'))
+
+    def test_unresolved_resources_not_verified(self):
+        check = MagicMock()
+        self.manifest.ensure('rest', ['ko', 'hsa'], check, resolved=lambda name: name == 'ko')
+        self.assertTrue(self.manifest.is_verified('rest', 'ko'))
+        self.assertFalse(self.manifest.is_verified('rest', 'hsa'))
+        # The unresolved resource is checked again when next needed
+        self.manifest.ensure('rest', ['ko', 'hsa'], check, resolved=lambda name: True)
+        self.assertEqual(check.call_args_list[1].args, (['hsa'],))
+
+    def test_discard_and_clear(self):
+        check = MagicMock()
+        self.manifest.ensure('rest', ['ko', 'compound'], check)
+        self.manifest.discard('rest', 'ko')
+        self.assertFalse(self.manifest.is_verified('rest', 'ko'))
+        self.assertTrue(self.manifest.is_verified('rest', 'compound'))
+        self.manifest.clear()
+        self.assertFalse(self.manifest.is_verified('rest', 'compound'))
+
+    def test_keyed_by_working_dir(self):
+        check = MagicMock()
+        with patch('keggmapwizard.resource_manifest.config') as mock_config:
+            mock_config.working_dir = '/first'
+            self.manifest.ensure('rest', ['ko'], check)
+            mock_config.working_dir = '/second'
+            self.assertFalse(self.manifest.is_verified('rest', 'ko'))
+
+
+@patch('keggmapwizard.kegg_pathway_map.download_base_png_maps')
+@patch('keggmapwizard.kegg_pathway_map.download_kgml')
+@patch('keggmapwizard.kegg_pathway_map.download_rest_data')
+class TestKeggPathwayMapResources(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.working_dir = config.working_dir
+        config.set_working_dir(self.temp_dir.name)
+        resource_manifest.clear()
+
+    def _write(self, *parts):
+        # Stands in for a successful download
+        file_path = Path(self.temp_dir.name).joinpath(*parts)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.touch()
+
+    def _download(self, mock_rest, mock_kgml, mock_png):
+        mock_rest.side_effect = lambda args, *a, **kw: [self._write('rest_data', f'{arg}.txt') for arg in args]
+        mock_kgml.side_effect = lambda map_ids, *a, **kw: [
+            self._write('kgml_data', file_type, f'{file_type}{map_id[-5:]}.xml')
+            for map_id in map_ids for file_type in ('ko', 'ec', 'rn')] + [
+            self._write('kgml_data', 'orgs', f'{map_id}.xml') for map_id in map_ids if map_id[:-5]]
+        mock_png.side_effect = lambda map_ids, *a, **kw: [self._write('maps_png', f'map{map_id[-5:]}.bimg')
+                                                          for map_id in map_ids]
+
+    def tearDown(self):
+        config.set_working_dir(self.working_dir)
+        resource_manifest.clear()
+        self.temp_dir.cleanup()
+
+    def test_resources_checked_once_per_process(self, mock_rest, mock_kgml, mock_png):
+        self._download(mock_rest, mock_kgml, mock_png)
+        KeggPathwayMap('00010')
+        KeggPathwayMap('00010')
+        mock_rest.assert_called_once()
+        self.assertEqual(len(mock_rest.call_args.args[0]), 15)
+        mock_kgml.assert_called_once_with(['00010'], False)
+        mock_png.assert_called_once_with(['00010'], False)
+
+        # Another map only checks its own KGML file and base image
+        KeggPathwayMap('00020')
+        mock_rest.assert_called_once()
+        self.assertEqual(mock_kgml.call_count, 2)
+        self.assertEqual(mock_png.call_count, 2)
+
+    def test_reload_bypasses_manifest(self, mock_rest, mock_kgml, mock_png):
+        KeggPathwayMap('00010')
+        KeggPathwayMap('00010', reload=True)
+        self.assertEqual(mock_rest.call_count, 2)
+        self.assertEqual(mock_rest.call_args.args, (mock_rest.call_args.args[0], True))
+        self.assertEqual(mock_kgml.call_count, 2)
+        self.assertEqual(mock_png.call_count, 2)
+
+    def test_downloaded_resources_not_checked_again(self, mock_rest, mock_kgml, mock_png):
+        self._download(mock_rest, mock_kgml, mock_png)
+        download_kegg_resources(['00010'], ['hsa'])
+        KeggPathwayMap('00010')
+        self.assertEqual(mock_rest.call_count, 1)
+        self.assertEqual(mock_kgml.call_count, 1)
+        self.assertEqual(mock_png.call_count, 1)
+        self.assertTrue(resource_manifest.is_verified('kgml', 'hsa00010'))
+        self.assertTrue(resource_manifest.is_verified('rest', 'hsa'))
+
+    def test_failed_downloads_checked_again(self, mock_rest, mock_kgml, mock_png):
+        # Nothing is written, e.g. because the network is down
+        download_kegg_resources(['00010'], ['hsa'])
+        self.assertFalse(resource_manifest.is_verified('kgml', 'hsa00010'))
+        self.assertFalse(resource_manifest.is_verified('rest', 'hsa'))
+        KeggPathwayMap('00010')
+        KeggPathwayMap('00010')
+        self.assertEqual(mock_rest.call_count, 3)
+        self.assertEqual(mock_kgml.call_count, 3)
+        self.assertEqual(mock_png.call_count, 3)
+
+    def test_bad_requests_not_checked_again(self, mock_rest, mock_kgml, mock_png):
+        self._download(mock_rest, mock_kgml, mock_png)
+        mock_kgml.side_effect = None
+        # The reference maps of 00010 do not exist
+        for file_type in ('ko', 'ec', 'rn'):
+            bad_request_store(Path(self.temp_dir.name) / 'kgml_data' / file_type).record(f'{file_type}00010', 404)
+        KeggPathwayMap('00010')
+        KeggPathwayMap('00010')
+        mock_kgml.assert_called_once()
+        self.assertTrue(resource_manifest.is_verified('kgml', '00010'))
+
+    def test_transient_bad_requests_checked_again(self, mock_rest, mock_kgml, mock_png):
+        self._download(mock_rest, mock_kgml, mock_png)
+        mock_kgml.side_effect = None
+        # The server failed temporarily for the reference maps of 00010
+        for file_type in ('ko', 'ec', 'rn'):
+            bad_request_store(Path(self.temp_dir.name) / 'kgml_data' / file_type).record(f'{file_type}00010', 503)
+        KeggPathwayMap('00010')
+        self.assertFalse(resource_manifest.is_verified('kgml', '00010'))
+        KeggPathwayMap('00010')
+        self.assertEqual(mock_kgml.call_count, 2)
+
+###############################################################################
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+from unittest.mock import MagicMock
+import xml.etree.ElementTree as ET
+from keggmapwizard.shape_index import ShapeIndex, SvgDocument, get_shape_index
+from keggmapwizard.svg_content import create_svg_content
+from keggmapwizard.color_function_base import color_org, color_custom_annotations
+
+
+class TestShapeIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.base_image = MagicMock()
+        self.base_image.map_id = "map00010"
+        self.base_image.image_width = "200"
+        self.base_image.image_height = "100"
+        self.base_image.image = "encoded_image_data"
+
+        self.components = []
+        for shape_id, titles, annotations in (
+                ("7", ['K08034 (TCF2, HNF1B)', 'mmu:21410 (Hnf1b)'],
+                 [{'type': 'K', 'name': 'K08034', 'description': 'TCF2, HNF1B; transcription factor 2'},
+                  {'type': 'Gene', 'name': 'mmu:21410', 'description': 'Hnf1b; HNF1 homeobox B'}]),
+                ("8", ['K06054 (HES1)'],
+                 [{'type': 'K', 'name': 'K06054', 'description': 'HES1; hairy and enhancer of split 1'}])):
+            component = MagicMock()
+            component.pathway_component_id = shape_id
+            component.pathway_component_geometry = {'x': 1, 'y': 2, 'width': 46, 'height': 17}
+            component.pathway_component_geometry_shape = "rect"
+            component.pathway_annotation_data = {'title': titles, 'visualizatin_class': ['enzyme'],
+                                                 'data_annotation': annotations}
+            self.components.append(component)
+        self.pathway = MagicMock()
+        self.pathway.title = "Mock Pathway"
+        self.pathway.pathway_components = self.components
+
+    def test_create_svg_content_indexes_shapes(self):
+        doc = create_svg_content(self.pathway, self.base_image, None)
+        self.assertIsInstance(doc, SvgDocument)
+        entries = list(doc.shape_index)
+        self.assertEqual([entry.shape_id for entry in entries], ["7", "8"])
+        self.assertEqual(entries[0].titles, ['K08034 (TCF2, HNF1B)', 'mmu:21410 (Hnf1b)'])
+        self.assertEqual(entries[0].annotations[1]['name'], 'mmu:21410')
+        self.assertIs(entries[1].element, doc.find(".//g/rect[@shape_id='8']"))
+        self.assertIs(doc.shape_index.get("8"), entries[1])
+        self.assertIsNone(doc.shape_index.get("9"))
+
+    def test_index_does_not_modify_components(self):
+        doc = create_svg_content(self.pathway, self.base_image, None)
+        doc.shape_index.get("8").set_titles(['changed'])
+        self.assertEqual(self.components[1].pathway_annotation_data['title'], ['K06054 (HES1)'])
+
+    def test_from_document_matches_created_index(self):
+        doc = create_svg_content(self.pathway, self.base_image, None)
+        # A document without index, e.g. read from an SVG file
+        parsed = ET.fromstring(ET.tostring(doc))
+        index = get_shape_index(parsed)
+        self.assertEqual([(entry.shape_id, entry.titles, entry.annotations) for entry in index],
+                         [(entry.shape_id, entry.titles, entry.annotations) for entry in doc.shape_index])
+
+    def test_from_document_does_not_evaluate_titles(self):
+        doc = ET.Element('svg')
+        group = ET.SubElement(doc, 'g')
+        shape = ET.SubElement(group, 'rect', shape_id='1')
+        ET.SubElement(shape, 'title').text = "__import__('os').getcwd()"
+        index = ShapeIndex.from_document(doc)
+        self.assertEqual(list(index)[0].titles, ["__import__('os').getcwd()"])
+        self.assertEqual(list(index)[0].annotations, [])
+
+    def test_set_titles_writes_title_element(self):
+        doc = create_svg_content(self.pathway, self.base_image, None)
+        entry = doc.shape_index.get("7")
+        entry.set_titles(['q1:K08034 (TCF2, HNF1B)'])
+        self.assertEqual(entry.element.find('title').text, "['q1:K08034 (TCF2, HNF1B)']")
+
+    def test_lookup_exact_identifiers(self):
+        doc = ET.Element('svg')
+        group = ET.SubElement(doc, 'g')
+        index = ShapeIndex()
+        for shape_id, annotations in (("1", [{'type': 'K', 'name': 'K00012'}]),
+                                      ("2", [{'type': 'K', 'name': 'K0001'},
+                                             {'type': 'EC', 'name': 'EC:2.7.1.1'},
+                                             {'type': 'Gene', 'name': 'hsa:3098'}])):
+            shape = ET.SubElement(group, 'rect', shape_id=shape_id)
+            index.add(shape, [annotation['name'] for annotation in annotations], annotations)
+
+        self.assertEqual([(entry.shape_id, position) for entry, position in index.lookup('K0001')], [("2", 0)])
+        self.assertEqual([entry.shape_id for entry, _ in index.lookup('K00012')], ["1"])
+        self.assertEqual(index.lookup('K000'), [])
+        # Database prefixes are optional, organism prefixes are not
+        self.assertEqual([position for _, position in index.lookup('2.7.1.1')], [1])
+        self.assertEqual([position for _, position in index.lookup('EC:2.7.1.1')], [1])
+        self.assertEqual(index.lookup('3098'), [])
+
+        matches = index.match(['K0001', 'hsa:3098', 'K00012', 'K99999'])
+        self.assertEqual([(entry.shape_id, positions) for entry, positions in matches.items()],
+                         [("1", {0}), ("2", {0, 2})])
+
+    def test_copy_shares_lookups(self):
+        doc = create_svg_content(self.pathway, self.base_image, None)
+        group = ET.fromstring(ET.tostring(doc.find('g')))
+        index = doc.shape_index.copy(group)
+        entry = index.get("7")
+        self.assertIs(entry.element, group[0])
+        self.assertEqual(entry.titles, doc.shape_index.get("7").titles)
+        self.assertEqual([e.shape_id for e, _ in index.lookup('mmu:21410')], ["7"])
+        # Changing the copy does not change the index it was copied from
+        entry.set_titles(['changed'])
+        index.add(ET.SubElement(group, 'rect', shape_id='9'), ['K00001'], [{'type': 'K', 'name': 'K00001'}])
+        self.assertEqual(doc.shape_index.get("7").titles[0], 'K08034 (TCF2, HNF1B)')
+        self.assertIsNone(doc.shape_index.get("9"))
+        self.assertEqual(doc.shape_index.lookup('K00001'), [])
+        self.assertEqual([e.shape_id for e in index], ["7", "8", "9"])
+        doc.shape_index.add(ET.SubElement(doc.find('g'), 'rect', shape_id='10'), ['K00002'],
+                            [{'type': 'K', 'name': 'K00002'}])
+        self.assertEqual(index.lookup('K00002'), [])
+
+    def test_color_functions_use_index(self):
+        doc = create_svg_content(self.pathway, self.base_image, color_org, 'mmu', 'green')
+        self.assertEqual(doc.shape_index.get("7").element.get('fill'), 'green')
+        self.assertEqual(doc.shape_index.get("8").element.get('fill'), 'transparent')
+
+        doc = create_svg_content(self.pathway, self.base_image, color_custom_annotations,
+                                 {'q1': ['K06054']}, 'red')
+        entry = doc.shape_index.get("8")
+        self.assertEqual(entry.element.get('fill-opacity'), '0.5')
+        self.assertEqual(entry.titles, ['q1:K06054 (HES1)'])
+        self.assertEqual(entry.element.find('title').text, "['q1:K06054 (HES1)']")
+
+###############################################################################
+
+if __name__ == '__main__':
+    unittest.main()
@@ -80,6 +80,18 @@ class TestSVGCreation(unittest.TestCase):
         self.assertEqual(title.text, "Mock Title")
         self.assertIn("EC:1.1.1.1", desc.text)
 
+    def test_create_svg_content_does_not_modify_components(self):
+        # Pathway components are cached, so rendering must not change them
+        create_svg_content(self.mock_pathway, self.base_image, None)
+        doc = create_svg_content(self.mock_pathway, self.base_image, None)
+
+        annotation_data = self.mock_component.pathway_annotation_data
+        self.assertEqual(annotation_data['visualizatin_class'], ["enzyme"])
+        self.assertEqual(annotation_data['data_annotation'][0]['description'], "catalyzes conversion")
+        shape = next(el for el in doc.iter("circle"))
+        self.assertEqual(shape.attrib["class"], "shape enzyme")
+        self.assertIn("catalyzes%20conversion", shape.find("desc").text)
+
     def test_create_svg_content_defines_pattern_image(self):
         # Ensure background image pattern is embedded with correct attributes
         doc = create_svg_content(self.mock_pathway, self.base_image, None)
@@ -94,6 +106,14 @@ class TestSVGCreation(unittest.TestCase):
         self.assertIsNotNone(image)
         self.assertEqual(image.attrib["xlink:href"], "data:image/png;base64,encoded_image_data")
 
+    def test_create_svg_content_references_shared_image(self):
+        # With image_href, the image element references the shared file instead of embedding it
+        doc = create_svg_content(self.mock_pathway, self.base_image, None,
+                                 image_href="base_images/map00010.0123456789abcdef.png")
+        image = doc.find("defs/pattern/image")
+        self.assertEqual(image.attrib["xlink:href"], "base_images/map00010.0123456789abcdef.png")
+        self.assertEqual(image.attrib["width"], "200")
+
     def test_create_svg_content_handles_color_function(self):
         # Simulate custom color function returning an updated doc and color legend
         def mock_color_function(*args, data):
@@ -0,0 +1,123 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+import xml.etree.ElementTree as ET
+from keggmapwizard.base_image import BaseImage, write_base_image
+from keggmapwizard.color_function_base import color_org, color_custom_annotations
+from keggmapwizard.svg_content import create_svg_content
+from keggmapwizard.svg_template import SvgTemplate, TemplateCache
+
+
+class TemplateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        image_path = os.path.join(self.temp_dir.name, 'map00010.bimg')
+        write_base_image(image_path, 200, 100, bytes(range(256)) * 10)
+        self.base_image = BaseImage.from_store('map00010', image_path)
+
+        self.kgml_path = Path(self.temp_dir.name) / 'ko00010.xml'
+        self.kgml_path.write_text('<pathway/>')
+        kgml_file = MagicMock(file_path=self.kgml_path, file_name='ko00010')
+
+        self.components = []
+        for i in range(20):
+            component = MagicMock()
+            component.pathway_component_id = f"e{i}"
+            component.pathway_component_geometry = {'x': i, 'y': 2 * i, 'width': 46, 'height': 17}
+            component.pathway_component_geometry_shape = "rect"
+            component.pathway_annotation_data = {
+                'title': [f"K{i:05d} (gene & <product>)", f"mmu:{i} (Gene\n{i})"],
+                'visualizatin_class': ["enzyme"],
+                'data_annotation': [{"description": "catalyzes \"conversion\"", "type": "K", "name": f"K{i:05d}"},
+                                    {"description": "gene", "type": "Gene", "name": f"mmu:{i}"}]
+            }
+            self.components.append(component)
+        self.rest_path = Path(self.temp_dir.name) / 'ko.txt'
+        self.rest_path.write_text('K00001\tgene\n')
+        self.pathway = MagicMock(map_id='00010', kegg_files=[kgml_file], org_files=[], rest_files=[self.rest_path])
+        self.pathway.title = "Glycolysis & <Gluconeogenesis>"
+        self.pathway.pathway_components = self.components
+        self.pathway.rest_file_versions.side_effect = lambda: (
+            (str(self.rest_path), os.stat(self.rest_path).st_mtime_ns, os.stat(self.rest_path).st_size),)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+class TestSvgTemplate(TemplateTestCase):
+
+    def test_render_equals_create_svg_content(self):
+        template = SvgTemplate(self.pathway, self.base_image)
+        for color_function, args in ((None, ()), (color_org, ('mmu', 'green')),
+                                     (color_custom_annotations, ({'q1': ['K00001', 'mmu:3'], 'q2': ['K00003']},
+                                                                 ['red', 'blue']))):
+            expected = create_svg_content(self.pathway, self.base_image, color_function, *args)
+            rendered = template.render(color_function, *args)
+            self.assertEqual(ET.tostring(rendered), ET.tostring(expected))
+
+    def test_copies_are_independent(self):
+        template = SvgTemplate(self.pathway, self.base_image, embed_image=False)
+        colored = template.render(color_custom_annotations, {'q1': ['K00001']}, 'red')
+        uncolored = template.render()
+        self.assertEqual(colored.shape_index.get('e1').titles[0], 'q1:K00001 (gene & <product>)')
+        self.assertEqual(uncolored.shape_index.get('e1').titles[0], 'K00001 (gene & <product>)')
+        self.assertEqual(uncolored.find(".//g/rect[@shape_id='e1']").get('fill'), 'transparent')
+        self.assertEqual(len(uncolored.find("defs[@id='shape-color-defs']")), 0)
+
+    def test_copy_has_shape_index(self):
+        doc = SvgTemplate(self.pathway, self.base_image).copy()
+        entry = doc.shape_index.get('e3')
+        self.assertIs(entry.element, doc.find(".//g/rect[@shape_id='e3']"))
+        self.assertEqual([e.shape_id for e, _ in doc.shape_index.lookup('mmu:3')], ['e3'])
+        self.assertEqual(len(doc.shape_index), 20)
+
+
+class TestTemplateCache(TemplateTestCase):
+
+    @patch('keggmapwizard.svg_template.SvgTemplate', wraps=SvgTemplate)
+    def test_template_created_once(self, mock_template):
+        cache = TemplateCache()
+        first = cache.get(self.pathway, self.base_image)
+        self.assertIs(cache.get(self.pathway, self.base_image), first)
+        mock_template.assert_called_once()
+
+        # The template is created again once a file of the map changed
+        self.kgml_path.write_text('<pathway title="changed"/>')
+        os.utime(self.kgml_path, ns=(0, 0))
+        self.assertIsNot(cache.get(self.pathway, self.base_image), first)
+        self.assertEqual(mock_template.call_count, 2)
+
+        # Documents with and without embedded image are different templates
+        cache.get(self.pathway, self.base_image, embed_image=False)
+        self.assertEqual(len(cache), 2)
+        # So are documents referencing a shared base image file
+        shared = cache.get(self.pathway, self.base_image, embed_image=False, image_href='base_images/map00010.png')
+        self.assertEqual(shared.render().find('defs/pattern/image').get('xlink:href'), 'base_images/map00010.png')
+        self.assertEqual(len(cache), 3)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    @patch('keggmapwizard.svg_template.SvgTemplate', wraps=SvgTemplate)
+    def test_template_created_again_after_rest_file_changed(self, mock_template):
+        cache = TemplateCache()
+        first = cache.get(self.pathway, self.base_image)
+        # The titles and descriptions of a template are taken from the REST files
+        self.rest_path.write_text('K00001\tgene, updated description\n')
+        os.utime(self.rest_path, ns=(0, 0))
+        self.assertIsNot(cache.get(self.pathway, self.base_image), first)
+        self.assertEqual(mock_template.call_count, 2)
+
+    def test_least_recently_used_template_evicted(self):
+        cache = TemplateCache(max_templates=1)
+        first = cache.get(self.pathway, self.base_image)
+        cache.get(self.pathway, self.base_image, embed_image=False)
+        self.assertEqual(len(cache), 1)
+        self.assertIsNot(cache.get(self.pathway, self.base_image), first)
+
+###############################################################################
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import gzip
+import io
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, PropertyMock, patch
+import xml.etree.ElementTree as ET
+from keggmapwizard.base_image import BaseImage, write_base_image
+from keggmapwizard.svg_content import create_svg_content
+from keggmapwizard.svg_writer import iter_svg, write_svg, write_svg_files, embed_base_image, IMAGE_HREF_PREFIX
+from keggmapwizard.kegg_pathway_map import KeggPathwayMap
+
+
+class TestSvgWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        image_path = os.path.join(self.temp_dir.name, 'map00010.bimg')
+        self.png_bytes = bytes(range(256)) * 2400
+        write_base_image(image_path, 200, 100, self.png_bytes)
+        self.base_image = BaseImage.from_store('map00010', image_path)
+
+        self.components = []
+        for i in range(50):
+            component = MagicMock()
+            component.pathway_component_id = f"e{i}"
+            component.pathway_component_geometry = {'x': i, 'y': 2 * i, 'width': 46, 'height': 17}
+            component.pathway_component_geometry_shape = "rect"
+            component.pathway_annotation_data = {
+                'title': f"['K{i:05d} (gene & <product>)']",
+                'visualizatin_class': ["enzyme"],
+                'data_annotation': [{"description": "catalyzes \"conversion\"", "type": "KO",
+                                     "name": f"K{i:05d}"}]
+            }
+            self.components.append(component)
+        self.pathway = MagicMock()
+        self.pathway.title = "Glycolysis & <Gluconeogenesis>"
+        self.pathway.pathway_components = self.components
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_not_embedded_image_references_base_image(self):
+        doc = create_svg_content(self.pathway, self.base_image, None, embed_image=False)
+        image = doc.find('defs/pattern/image')
+        self.assertEqual(image.get('xlink:href'), IMAGE_HREF_PREFIX)
+
+    def test_iter_svg_equals_tostring(self):
+        embedded = create_svg_content(self.pathway, self.base_image, None)
+        streamed = create_svg_content(self.pathway, self.base_image, None, embed_image=False)
+        self.assertEqual(b''.join(iter_svg(streamed, self.base_image, chunk_size=512)),
+                         ET.tostring(embedded))
+
+    def test_iter_svg_with_color_function(self):
+        def color_function(*args, data):
+            for shape in data.iter('rect'):
+                shape.set('fill', args[0])
+            return data, [args[0]]
+
+        embedded = create_svg_content(self.pathway, self.base_image, color_function, 'red')
+        streamed = create_svg_content(self.pathway, self.base_image, color_function, 'red',
+                                      embed_image=False)
+        self.assertEqual(b''.join(iter_svg(streamed, self.base_image)), ET.tostring(embedded))
+
+    def test_iter_svg_yields_chunks(self):
+        doc = create_svg_content(self.pathway, self.base_image, None, embed_image=False)
+        chunks = list(iter_svg(doc, self.base_image, chunk_size=1024))
+        self.assertGreater(len(chunks), 2)
+        # No chunk holds the whole encoded image
+        self.assertLess(max(map(len, chunks)), len(self.png_bytes) * 4 // 3)
+
+    def test_iter_svg_streams_shapes(self):
+        # The group of shapes is serialized shape by shape, not as a whole
+        embedded = create_svg_content(self.pathway, self.base_image, None)
+        streamed = create_svg_content(self.pathway, self.base_image, None, embed_image=False)
+        chunks = list(iter_svg(streamed, self.base_image, chunk_size=1))
+        self.assertEqual(b''.join(chunks), ET.tostring(embedded))
+        self.assertLessEqual(max(chunk.count(b'shape_id=') for chunk in chunks), 1)
+        self.assertEqual(sum(chunk.count(b'shape_id=') for chunk in chunks), 50)
+        self.assertLess(max(len(chunk) for chunk in chunks if b'shape_id=' in chunk), 1000)
+
+    def test_iter_svg_without_base_image(self):
+        doc = create_svg_content(self.pathway, self.base_image, None)
+        self.assertEqual(b''.join(iter_svg(doc)), ET.tostring(doc))
+
+    def test_write_svg(self):
+        embedded = create_svg_content(self.pathway, self.base_image, None)
+        streamed = create_svg_content(self.pathway, self.base_image, None, embed_image=False)
+        file = io.BytesIO()
+        write_svg(streamed, file, self.base_image)
+        self.assertEqual(file.getvalue(), ET.tostring(embedded))
+
+    def test_write_svg_files(self):
+        embedded = create_svg_content(self.pathway, self.base_image, None)
+        streamed = create_svg_content(self.pathway, self.base_image, None, embed_image=False)
+        paths = [os.path.join(self.temp_dir.name, name) for name in ('map.svg', 'map.svg.gz', 'map.svgz')]
+        write_svg_files(streamed, paths, self.base_image, prefix=b'\n')
+        expected = b'\n' + ET.tostring(embedded)
+        with open(paths[0], 'rb') as file:
+            self.assertEqual(file.read(), expected)
+        for path in paths[1:]:
+            with gzip.open(path, 'rb') as file:
+                self.assertEqual(file.read(), expected)
+        self.assertLess(os.path.getsize(paths[2]), len(expected))
+
+    def test_write_svg_files_deterministic(self):
+        # The compressed files do not change when the same document is written again
+        doc = create_svg_content(self.pathway, self.base_image, None, embed_image=False)
+        first, second = (os.path.join(self.temp_dir.name, name) for name in ('first.svgz', 'second.svgz'))
+        write_svg_files(doc, [first], self.base_image)
+        write_svg_files(doc, [second], self.base_image)
+        with open(first, 'rb') as file_1, open(second, 'rb') as file_2:
+            self.assertEqual(file_1.read(), file_2.read())
+
+    def test_tail_text_preserved(self):
+        doc = create_svg_content(self.pathway, self.base_image, None, embed_image=False)
+        doc.find('defs').tail = '\n & '
+        doc.find('defs/pattern').text = ' <text> '
+        expected = b''.join(iter_svg(doc, self.base_image))
+        doc.find('defs/pattern/image').set('xlink:href', IMAGE_HREF_PREFIX + self.base_image.image)
+        self.assertEqual(expected, ET.tostring(doc))
+
+    def test_embed_base_image(self):
+        embedded = create_svg_content(self.pathway, self.base_image, None)
+        streamed = create_svg_content(self.pathway, self.base_image, None, embed_image=False)
+        self.assertIs(embed_base_image(streamed, self.base_image), streamed)
+        self.assertEqual(ET.tostring(streamed), ET.tostring(embedded))
+        # A document referencing a shared base image file is not changed
+        shared = create_svg_content(self.pathway, self.base_image, None, image_href='base_images/map00010.png')
+        expected = ET.tostring(shared)
+        self.assertEqual(ET.tostring(embed_base_image(shared, self.base_image)), expected)
+
+    @patch('keggmapwizard.kegg_pathway_map.resource_manifest')
+    def test_create_svg_map_returns_embedded_image(self, mock_manifest):
+        kgml_path = Path(self.temp_dir.name) / 'ko00010.xml'
+        kgml_path.write_text('<pathway/>')
+        self.pathway.configure_mock(map_id='00010', kegg_files=[MagicMock(file_path=kgml_path, file_name='ko00010')],
+                                    org_files=[], rest_files=[], org='')
+        with patch.object(KeggPathwayMap, 'pathway', new_callable=PropertyMock, return_value=self.pathway), \
+                patch.object(KeggPathwayMap, 'base_image', new_callable=PropertyMock, return_value=self.base_image), \
+                patch('builtins.print'):
+            pathway_map = KeggPathwayMap('00010')
+            doc = pathway_map.create_svg_map(path=self.temp_dir.name)
+            # The returned document serializes to the content of the written file
+            with open(pathway_map.output_path, 'rb') as file:
+                self.assertEqual(file.read(), b'\n\n' + ET.tostring(doc))
+            self.assertEqual(doc.find('defs/pattern/image').get('xlink:href'),
+                             IMAGE_HREF_PREFIX + self.base_image.image)
+            # write_svg_map writes the same file and only returns its path
+            output_path = pathway_map.write_svg_map(path=self.temp_dir.name, output_name='written')
+            self.assertEqual(output_path, Path(self.temp_dir.name) / 'SVG_output' / 'written.svg')
+            self.assertEqual(output_path.read_bytes(), b'\n\n' + ET.tostring(doc))
+
+###############################################################################
+
+if __name__ == '__main__':
+    unittest.main()
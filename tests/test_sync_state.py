@@ -0,0 +1,81 @@
+import os
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from keggmapwizard.sync_state import (SyncState, SYNC_STATE_FILE, parse_kegg_release, file_digest,
+                                      load_sync_state)
+
+
+class TestSyncState(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.working_dir = Path(self.temp_dir.name)
+        self.file_path = self.working_dir / 'kgml_data' / 'ko' / 'ko00010.xml'
+        self.file_path.parent.mkdir(parents=True)
+        self.file_path.write_bytes(b'<pathway/>')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_parse_kegg_release(self):
+        info = ('kegg             Kyoto Encyclopedia of Genes and Genomes\n'
+                'kegg             Release 112.0+/10-17, Oct 24\n'
+                '                 Kanehisa Laboratories\n')
+        self.assertEqual(parse_kegg_release(info), '112.0+/10-17')
+        self.assertIsNone(parse_kegg_release('no release here'))
+
+    def test_record_and_save(self):
+        sync_state = SyncState(self.working_dir)
+        sync_state.release = '112.0'
+        sync_state.record(self.file_path, {'ETag': '"abc"', 'Last-Modified': 'Thu, 17 Oct 2024 00:00:00 GMT'},
+                          file_digest(self.file_path))
+        sync_state.save()
+
+        with open(self.working_dir / SYNC_STATE_FILE) as file:
+            self.assertIn('kgml_data/ko/ko00010.xml', json.load(file)['files'])
+        loaded = SyncState(self.working_dir)
+        self.assertEqual(loaded.release, '112.0')
+        self.assertEqual(loaded.conditional_headers(self.file_path),
+                         {'If-None-Match': '"abc"', 'If-Modified-Since': 'Thu, 17 Oct 2024 00:00:00 GMT'})
+        self.assertEqual(list(self.working_dir.glob('*.tmp')), [])
+
+    def test_is_current(self):
+        sync_state = SyncState(self.working_dir)
+        # Files are not current as long as no release is known
+        sync_state.record(self.file_path, {'ETag': '"abc"'})
+        self.assertFalse(sync_state.is_current(self.file_path))
+        sync_state.release = '112.0'
+        sync_state.record(self.file_path)
+        self.assertTrue(sync_state.is_current(self.file_path))
+        # A new release makes all files revalidated, and so does deleting a file
+        sync_state.release = '112.1'
+        self.assertFalse(sync_state.is_current(self.file_path))
+        sync_state.record(self.file_path)
+        os.remove(self.file_path)
+        self.assertFalse(sync_state.is_current(self.file_path))
+        self.assertEqual(sync_state.conditional_headers(self.file_path), {})
+
+    def test_is_unchanged(self):
+        sync_state = SyncState(self.working_dir)
+        # Without a recorded digest the file on disk is hashed
+        self.assertTrue(sync_state.is_unchanged(self.file_path, file_digest(self.file_path)))
+        sync_state.record(self.file_path, digest='recorded')
+        self.assertTrue(sync_state.is_unchanged(self.file_path, 'recorded'))
+        self.assertFalse(sync_state.is_unchanged(self.file_path, file_digest(self.file_path)))
+        self.assertFalse(sync_state.is_unchanged(self.working_dir / 'missing.txt', 'recorded'))
+
+    def test_unreadable_state_ignored(self):
+        (self.working_dir / SYNC_STATE_FILE).write_text('{not json')
+        sync_state = SyncState(self.working_dir)
+        self.assertIsNone(sync_state.release)
+        self.assertEqual(len(sync_state), 0)
+
+    def test_load_sync_state_once_per_process(self):
+        self.assertIs(load_sync_state(self.working_dir), load_sync_state(str(self.working_dir)))
+
+###############################################################################
+
+if __name__ == '__main__':
+    unittest.main()